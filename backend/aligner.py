@@ -1,20 +1,317 @@
 import subprocess
+import functools
+import hashlib
 import os
+import resource
+import shutil
+import signal
+import threading
+import time
 
-def run_alignment(input_file, output_prefix="aligned"):
-    exec_dir = "./exec"
+EXEC_DIR = "./exec"
+
+# Ejecutables (configurables por entorno)
+MUSCLE_EXE = os.environ.get("MUSCLE_EXE", "muscle")
+# MUSCLE_EXE = os.path.join(EXEC_DIR, "muscle5.exe")
+MSA_EXE = os.environ.get("MSALIGNER_EXE", os.path.join(EXEC_DIR, "MSAligner"))
+
+# Tiempo máximo (segundos) por herramienta
+DEFAULT_TIMEOUTS = {
+    "muscle": float(os.environ.get("MUSCLE_TIMEOUT", "600")),
+    "msaligner": float(os.environ.get("MSALIGNER_TIMEOUT", "600")),
+}
+
+# Intervalo de supervisión de los procesos (timeouts y memoria)
+POLL_INTERVAL = 0.1
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+class AlignmentError(Exception):
+    """Error al ejecutar uno de los alineadores"""
+
+    def __init__(self, tool, message, stats=None):
+        super().__init__(f"{tool}: {message}")
+        self.tool = tool
+        self.stats = stats or {}
+
+
+class AlignmentTimeout(AlignmentError):
+    """El alineador superó su tiempo máximo"""
+
+
+class AlignmentCancelled(AlignmentError):
+    """El alineamiento fue cancelado desde fuera"""
+
+
+class AlignmentOutOfMemory(AlignmentError):
+    """El alineador superó su límite de memoria residente"""
+
+
+class _ToolRun:
+    """Un proceso alineador lanzado en segundo plano con sus métricas"""
+
+    def __init__(self, tool, cmd, output, timeout, limits=None):
+        self.tool = tool
+        self.cmd = cmd
+        self.output = output
+        self.timeout = timeout
+        self.limits = limits or {}
+        self.proc = None
+        self.returncode = None
+        self.started = None
+        self.wall_time = None
+        self.cpu_time = None
+        self.max_rss = None
+        self.error = None
+        self.done = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self, wake):
+        self.started = time.monotonic()
+        try:
+            # Sesión propia: al matar se mata también a sus subprocesos
+            self.proc = subprocess.Popen(self.cmd, start_new_session=True)
+        except OSError as e:
+            raise AlignmentError(self.tool, f"no se pudo ejecutar {self.cmd[0]}: {e}")
+        self._apply_limits()
+        self._thread = threading.Thread(target=self._wait, args=(wake,), daemon=True)
+        self._thread.start()
+
+    def _apply_limits(self):
+        # prlimit sobre el proceso ya lanzado en vez de preexec_fn, que no es
+        # seguro con hilos. RLIMIT_CPU cuenta desde el arranque la CPU de
+        # todos los hilos. La memoria no se limita con RLIMIT_AS (espacio de
+        # direcciones virtual, que un proceso multihilo reserva de sobra):
+        # la supervisión mide su memoria residente (ver over_memory).
+        if not hasattr(resource, "prlimit") or not self.limits.get("cpu"):
+            return
+        try:
+            soft = int(self.limits["cpu"])
+            # SIGXCPU al llegar al límite blando; SIGKILL poco después
+            resource.prlimit(self.proc.pid, resource.RLIMIT_CPU, (soft, soft + 5))
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    def rss(self):
+        """Memoria residente actual del proceso en bytes (None si no se puede leer)"""
+        try:
+            with open(f"/proc/{self.proc.pid}/statm") as f:
+                return int(f.read().split()[1]) * PAGE_SIZE
+        except (OSError, ValueError, IndexError):
+            return None
+
+    def over_memory(self):
+        limit = self.limits.get("memory")
+        if not limit or self.done.is_set():
+            return False
+        rss = self.rss()
+        return rss is not None and rss > limit
+
+    def _wait(self, wake):
+        # Se espera sin recogerlo (WNOWAIT) y se recoge bajo el lock: mientras
+        # returncode es None su pid sigue reservado y kill() puede señalarlo
+        os.waitid(os.P_PID, self.proc.pid, os.WEXITED | os.WNOWAIT)
+        with self._lock:
+            # os.wait4 devuelve el uso de recursos de ESTE hijo (no el agregado)
+            _, status, rusage = os.wait4(self.proc.pid, 0)
+            self.returncode = os.waitstatus_to_exitcode(status)
+            self.proc.returncode = self.returncode
+        self.wall_time = time.monotonic() - self.started
+        self.cpu_time = rusage.ru_utime + rusage.ru_stime
+        # Pico de memoria residente (Linux lo da en KB)
+        self.max_rss = rusage.ru_maxrss * 1024
+        self.done.set()
+        wake.set()
+
+    def expired(self):
+        return (self.timeout is not None and not self.done.is_set()
+                and time.monotonic() - self.started > self.timeout)
+
+    def kill(self, error):
+        with self._lock:
+            if self.returncode is None:
+                self.error = error
+                try:
+                    os.killpg(self.proc.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+
+    def stats(self):
+        return {
+            "output": self.output,
+            "returncode": self.returncode,
+            "wall_time": self.wall_time,
+            "cpu_time": self.cpu_time,
+            "max_rss": self.max_rss,
+        }
+
+
+def _supervise(runs, cancel_event):
+    """Espera a que terminen los procesos aplicando timeouts y cancelación.
+
+    Si una herramienta falla, se matan las demás: el resultado ya no sirve.
+    """
+    wake = threading.Event()
+    try:
+        for run in runs:
+            run.start(wake)
+    except AlignmentError:
+        # Si uno no arranca, los ya lanzados no deben seguir corriendo
+        for run in runs:
+            if run.proc is not None:
+                run.kill(AlignmentCancelled)
+                run.done.wait()
+        raise
+
+    failed = None
+    while not all(run.done.is_set() for run in runs):
+        wake.wait(POLL_INTERVAL)
+        wake.clear()
+
+        for run in runs:
+            if run.expired():
+                run.kill(AlignmentTimeout)
+            elif run.over_memory():
+                run.kill(AlignmentOutOfMemory)
+            elif run.done.is_set() and run.returncode != 0 and failed is None:
+                failed = run
+
+        if cancel_event is not None and cancel_event.is_set():
+            for run in runs:
+                run.kill(AlignmentCancelled)
+        elif failed is not None:
+            for run in runs:
+                run.kill(AlignmentCancelled)
+
+    for run in runs:
+        run.done.wait()
+
+
+def _raise_on_failure(runs):
+    # Prioridad: timeout > memoria > fallo propio > cancelación (consecuencia de otro)
+    for kind in (AlignmentTimeout, AlignmentOutOfMemory, None, AlignmentCancelled):
+        for run in runs:
+            if run.returncode == 0 or run.error is not kind:
+                continue
+            if kind is AlignmentTimeout:
+                raise AlignmentTimeout(run.tool, f"superó {run.timeout:g}s", run.stats())
+            if kind is AlignmentOutOfMemory:
+                raise AlignmentOutOfMemory(
+                    run.tool, f"superó el límite de memoria ({run.limits['memory'] / 1024 ** 2:.0f} MB)",
+                    run.stats()
+                )
+            if kind is AlignmentCancelled:
+                raise AlignmentCancelled(run.tool, "cancelado", run.stats())
+            raise AlignmentError(run.tool, _exit_reason(run), run.stats())
+
+
+def _exit_reason(run):
+    if run.returncode == -signal.SIGXCPU:
+        return f"superó el límite de CPU ({run.limits['cpu']:g}s de CPU)"
+    return f"terminó con código {run.returncode}"
+
+
+def _commands(input_file, muscle_output, msa_output):
+    return {
+        "muscle": [MUSCLE_EXE, "-align", input_file, "-output", muscle_output],
+        "msaligner": [MSA_EXE, input_file, msa_output],
+    }
+
+
+def _muscle_version():
+    try:
+        out = subprocess.run([MUSCLE_EXE, "-version"], capture_output=True, text=True, timeout=10)
+        return (out.stdout or out.stderr).strip()
+    except (OSError, subprocess.SubprocessError):
+        return "unknown"
+
+
+def _file_digest(path):
+    # MSAligner no reporta versión: se identifica por el hash del binario
+    try:
+        with open(path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return "unknown"
+
+
+@functools.lru_cache(maxsize=None)
+def aligner_fingerprint():
+    """Versión y argumentos de cada alineador (forma parte de la clave de caché)"""
+    cmds = _commands("{input}", "{muscle_output}", "{msa_output}")
+    return {
+        "muscle": {"version": _muscle_version(), "args": cmds["muscle"][1:]},
+        "msaligner": {"version": _file_digest(MSA_EXE), "args": cmds["msaligner"][1:]},
+    }
+
+
+def prepare():
+    """Comprueba al arrancar que los alineadores se pueden ejecutar y calcula
+    su huella (aligner_fingerprint lanza `muscle -version` y lee el binario
+    de MSAligner). Llamado en el maestro de gunicorn antes del fork, los
+    workers heredan la huella y el primer alineamiento no paga ese coste.
+    Devuelve {herramienta: ruta resuelta o None}."""
+    found = {}
+    for tool, exe in (("muscle", MUSCLE_EXE), ("msaligner", MSA_EXE)):
+        path = shutil.which(exe)
+        if path is None:
+            print(f"⚠️ {tool}: no se encuentra el ejecutable {exe}")
+        found[tool] = path
+    aligner_fingerprint()
+    return found
+
+
+def run_aligners(input_file, output_prefix="aligned", concurrent=True,
+                 timeouts=None, cancel_event=None, limits=None):
+    """Ejecuta MUSCLE y MSAligner sobre el mismo input.
+
+    Con concurrent=True ambos procesos arrancan a la vez y el tiempo total es
+    el del más lento. Devuelve por herramienta la ruta de salida, el código de
+    retorno y los tiempos de pared/CPU. Lanza AlignmentError (o sus subclases
+    AlignmentTimeout / AlignmentOutOfMemory / AlignmentCancelled) si alguno
+    no termina bien; en ese caso se borran las salidas parciales.
+
+    `limits` se aplica a cada proceso (ver Scheduler.limits): "cpu" son
+    segundos de CPU de todos sus hilos (RLIMIT_CPU) y "memory" bytes de
+    memoria residente, medida en cada supervisión (se mata al superarla).
+    """
+    timeouts = {**DEFAULT_TIMEOUTS, **(timeouts or {})}
 
     # Definir rutas de salida
     muscle_output = f"{output_prefix}_muscle.fasta"
     msa_output = f"{output_prefix}_msa.fasta"
 
-    # Ejecutar Muscle5
-    muscle_exe = "muscle"
-    # muscle_exe = os.path.join(exec_dir, "muscle5.exe")
-    subprocess.run([muscle_exe, "-align", input_file, "-output", muscle_output], check=True)
+    cmds = _commands(input_file, muscle_output, msa_output)
+    runs = [
+        _ToolRun("muscle", cmds["muscle"], muscle_output, timeouts["muscle"], limits),
+        _ToolRun("msaligner", cmds["msaligner"], msa_output, timeouts["msaligner"], limits),
+    ]
+
+    started = []
+    try:
+        if concurrent:
+            started = runs
+            _supervise(runs, cancel_event)
+        else:
+            for run in runs:
+                started.append(run)
+                _supervise([run], cancel_event)
+                if run.returncode != 0:
+                    break
+        _raise_on_failure(started)
+    except BaseException:
+        for run in runs:
+            if run.proc is not None:
+                run.kill(AlignmentCancelled)
+            if os.path.exists(run.output):
+                os.remove(run.output)
+        raise
+
+    return {run.tool: run.stats() for run in runs}
 
-    # Ejecutar MSAligner
-    msa_exe = os.path.join(exec_dir, "MSAligner")
-    subprocess.run([msa_exe, input_file, msa_output], check=True)
 
-    return muscle_output, msa_output
+def run_alignment(input_file, output_prefix="aligned", **kwargs):
+    results = run_aligners(input_file, output_prefix, **kwargs)
+    return results["muscle"]["output"], results["msaligner"]["output"]
@@ -1,77 +1,655 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
 import os
-from aligner import run_alignment
+from aligner import (run_aligners, prepare, AlignmentError, AlignmentTimeout, AlignmentCancelled,
+                     AlignmentOutOfMemory)
+from cache import ResultCache, cache_key
+from jobs import JobQueueFull, QUEUED, RUNNING, DONE
+from scheduler import Scheduler, AdmissionRejected, estimate_job
+from batch import (MAX_BATCH_FILES, BatchEntry, BatchError, extract_archive, is_archive,
+                   remove_inputs, run_batch)
+from streaming import CHUNK_SIZE, copy_stream, iter_file, ndjson_stream, multipart_stream
+from common.analysis import compare_fasta, compare_files, summarize_fasta, summarize_file
+from common.fasta import FastaError, FastaTooLarge, scan_fasta
+from common.metrics import CONTENT_TYPE, MEMORY_BUCKETS, Registry, StageTimer, instrument_flask
+from common.http import CONNECT_TIMEOUT, Client
+from writeback import SaveQueue
+import json
+import re
 import uuid
-import requests  # 👈 para comunicar con el contenedor db
 
 app = Flask(__name__)
 
+# Temporales de cada alineamiento (inputs subidos y salidas de los
+# alineadores). Conviene un tmpfs (docker-compose monta uno): son archivos de
+# vida corta que no deben pasar por el disco del contenedor.
+SCRATCH_DIR = os.environ.get("SCRATCH_DIR", ".")
+IN_DIR = os.path.join(SCRATCH_DIR, "in")
+OUT_DIR = os.path.join(SCRATCH_DIR, "out")
+
 # Crear carpetas si no existen
-os.makedirs("in", exist_ok=True)
-os.makedirs("out", exist_ok=True)
+os.makedirs(IN_DIR, exist_ok=True)
+os.makedirs(OUT_DIR, exist_ok=True)
 
-DB_URL = "http://db:6000"  # 👈 usa el nombre del servicio en docker-compose
+# Los temporales de cada petición se nombran con uuid4, así que varios hilos o
+# procesos pueden compartir in/ y out/ sin pisarse
+SCRATCH_PATTERN = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}")
 
 
-@app.route("/align", methods=["POST"])
-def align():
-    # Crear ruta única para input
+def clean_scratch():
+    """Borra los temporales que dejó en in/ y out/ una ejecución anterior
+    interrumpida. Solo debe llamarse al arrancar, antes de atender peticiones
+    (en gunicorn desde el proceso maestro, ver gunicorn.conf.py)."""
+    removed = 0
+    for directory in (IN_DIR, OUT_DIR):
+        for name in os.listdir(directory):
+            if SCRATCH_PATTERN.match(name):
+                try:
+                    os.remove(os.path.join(directory, name))
+                    removed += 1
+                except OSError:
+                    pass
+    if removed:
+        print(f"🧹 Eliminados {removed} temporales de una ejecución anterior")
+
+DB_URL = os.environ.get("DB_URL", "http://db:6000")  # 👈 usa el nombre del servicio en docker-compose
+# Subir o descargar un blob grande puede tardar más que una petición normal
+BLOB_TIMEOUT = float(os.environ.get("DB_BLOB_TIMEOUT", "300"))
+
+# Cliente compartido: conexiones keep-alive, timeouts y reintentos
+db = Client(DB_URL)
+
+# Pool de alineamiento: cada trabajo lanza 2 procesos, así que por defecto
+# se usa la mitad de los núcleos del contenedor
+ALIGN_WORKERS = int(os.environ.get("ALIGN_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+ALIGN_QUEUE_SIZE = int(os.environ.get("ALIGN_QUEUE_SIZE", "32"))
+
+# Límites del FASTA de entrada: se comprueban antes de lanzar los alineadores
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", str(256 * 1024 * 1024)))
+MAX_SEQUENCES = int(os.environ.get("MAX_SEQUENCES", "20000"))
+MAX_RESIDUES = int(os.environ.get("MAX_RESIDUES", "50000000"))
+MAX_SEQUENCE_LENGTH = int(os.environ.get("MAX_SEQUENCE_LENGTH", "100000"))
+
+# Flask corta con 413 las peticiones más grandes sin llegar a leerlas
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_BYTES
+
+# /align/stream solo resume y compara en el backend alineamientos de hasta
+# este tamaño (ambas salidas): el análisis decodifica la matriz completa, y
+# los más grandes los calcula la DB la primera vez que se piden
+STREAM_ANALYSIS_MAX_BYTES = int(os.environ.get("STREAM_ANALYSIS_MAX_BYTES", str(32 * 1024 * 1024)))
+
+# Alineamientos de un mismo lote en vuelo a la vez
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", str(ALIGN_WORKERS)))
+
+# Carril rápido con ALIGN_WORKERS y carril aparte para trabajos grandes
+scheduler = Scheduler(ALIGN_WORKERS, ALIGN_QUEUE_SIZE)
+result_cache = ResultCache(db)
+
+# Métricas (GET /metrics, formato Prometheus)
+metrics = Registry()
+instrument_flask(app, metrics, "backend")
+STAGE_SECONDS = metrics.histogram(
+    "backend_alignment_stage_seconds", "Duración de cada etapa de un alineamiento", ("stage",)
+)
+ALIGNER_SECONDS = metrics.histogram(
+    "backend_aligner_wall_seconds", "Tiempo de pared de cada alineador", ("tool",)
+)
+ALIGNER_CPU_SECONDS = metrics.histogram(
+    "backend_aligner_cpu_seconds", "Tiempo de CPU de cada alineador", ("tool",)
+)
+ALIGNER_RSS = metrics.histogram(
+    "backend_aligner_peak_rss_bytes", "Pico de memoria residente de cada alineador", ("tool",),
+    buckets=MEMORY_BUCKETS
+)
+ALIGNER_FAILURES = metrics.counter(
+    "backend_aligner_failures_total", "Alineadores que no terminaron bien", ("tool", "reason")
+)
+CACHE_LOOKUPS = metrics.counter(
+    "backend_result_cache_lookups_total", "Consultas a la caché de resultados", ("result",)
+)
+metrics.gauge(
+    "backend_queue_depth", "Trabajos esperando en cada carril", ("lane",),
+    callback=lambda: {(lane,): s["queued"] for lane, s in scheduler.stats().items()}
+)
+metrics.gauge(
+    "backend_jobs_running", "Trabajos en ejecución en cada carril", ("lane",),
+    callback=lambda: {(lane,): s["running"] for lane, s in scheduler.stats().items()}
+)
+DB_SAVES = metrics.counter(
+    "backend_db_saves_total", "Alineamientos enviados a la DB en segundo plano", ("result",)
+)
+
+# Los guardados en la DB no hacen esperar al usuario: se escriben en el spool
+# y se envían en segundo plano (ver writeback.py)
+save_queue = SaveQueue(db, counter=DB_SAVES, upload_timeout=(CONNECT_TIMEOUT, BLOB_TIMEOUT))
+metrics.gauge("backend_db_saves_pending", "Guardados en el spool pendientes de confirmar",
+              callback=save_queue.pending)
+
+
+def save_upload(file):
+    """Guarda el archivo subido con un nombre único y devuelve (nombre, ruta).
+
+    El nombre es el original del usuario (es el que se muestra en el historial).
+    """
     input_filename = f"{uuid.uuid4()}.fasta"
-    input_path = os.path.join("in", input_filename)
+    input_path = os.path.join(IN_DIR, input_filename)
+    try:
+        file.save(input_path)
+    except BaseException:
+        remove_inputs([input_path])
+        raise
+    return file.filename or input_filename, input_path
+
+
+def admit_upload(input_path):
+    """Valida el FASTA subido (formato, alfabeto, nombres y límites), estima
+    su coste y devuelve (FastaStats, carril, límites de sus alineadores). Si
+    no es válido o no cabe en el presupuesto se borra y se relanza el error."""
+    try:
+        stats = scan_fasta(input_path, MAX_SEQUENCES, MAX_RESIDUES, MAX_SEQUENCE_LENGTH, MAX_UPLOAD_BYTES)
+        estimate = estimate_job(stats)
+        return stats, scheduler.admit(estimate), scheduler.limits(estimate)
+    except (FastaError, AdmissionRejected):
+        os.remove(input_path)
+        raise
+
+
+def run_in_lane(lane, fn, *args, discard=None):
+    """Ejecuta fn(*args, cancel_event=...) en su carril y espera el resultado
+    (para las rutas síncronas: así también respetan la planificación). El
+    trabajo no se conserva al terminar: no tiene id que consultar en /jobs."""
+    return scheduler.lanes[lane].submit(fn, *args, discard=discard, keep=False).wait()
+
+
+def observe_aligners(results):
+    for tool, r in results.items():
+        ALIGNER_SECONDS.observe(r["wall_time"], tool=tool)
+        ALIGNER_CPU_SECONDS.observe(r["cpu_time"], tool=tool)
+        ALIGNER_RSS.observe(r["max_rss"], tool=tool)
+
+
+def align_files(input_path, output_prefix, limits=None, timer=None, cancel_event=None):
+    """run_aligners con los límites de CPU/memoria por proceso que el
+    planificador calculó para este trabajo (ver admit_upload).
+
+    Registra las métricas de cada alineador y, si se pasa un StageTimer, el
+    tiempo de pared de cada uno como etapa (corren en paralelo: se solapan).
+    """
+    if timer is not None:
+        timer.end("queue_wait")
+    try:
+        results = run_aligners(input_path, output_prefix, cancel_event=cancel_event, limits=limits)
+    except AlignmentError as e:
+        reason = ("timeout" if isinstance(e, AlignmentTimeout)
+                  else "memory" if isinstance(e, AlignmentOutOfMemory)
+                  else "cancelled" if isinstance(e, AlignmentCancelled) else "error")
+        ALIGNER_FAILURES.inc(tool=e.tool, reason=reason)
+        raise
+    observe_aligners(results)
+    if timer is not None:
+        for tool, r in results.items():
+            timer.add(tool, r["wall_time"])
+    return results
+
+
+def summarize_alignments(summarize, sources, timer):
+    """Resumen (common.analysis) de cada alineador: {"muscle": ..., "msa": ...}.
+
+    Si un alineamiento no se puede resumir se devuelve {} y la DB lo
+    calculará al guardarlo: un resumen nunca hace fallar el alineamiento.
+    """
+    with timer.stage("summary"):
+        try:
+            return {aligner: summarize(source) for aligner, source in sources.items()}
+        except FastaError as e:
+            print(f"⚠️ No se pudo resumir el alineamiento: {e}")
+            return {}
+
+
+def compare_alignments(compare, muscle, msa, timer):
+    """Comparación MUSCLE (referencia) frente a MSAligner (common.analysis.compare),
+    o None si no se puede calcular (la DB la calculará al guardarlo)"""
+    with timer.stage("compare"):
+        try:
+            return compare(muscle, msa)
+        except FastaError as e:
+            print(f"⚠️ No se pudieron comparar los alineamientos: {e}")
+            return None
 
-    # Guardar input
-    file = request.files["file"]
-    file.save(input_path)
 
-    # Ejecutar alineamiento → devuelve 2 paths
-    muscle_path, msa_path = run_alignment(
-        input_path, os.path.join("out", str(uuid.uuid4()))
-    )
+@app.errorhandler(FastaError)
+def fasta_error_response(e):
+    status = 413 if isinstance(e, FastaTooLarge) else 400
+    return jsonify({"error": str(e)}), status
 
-    # Leer alineamientos como texto plano
-    with open(muscle_path, "r") as f1, open(msa_path, "r") as f2:
-        muscle_text = f1.read()
-        msa_text = f2.read()
 
-    # Guardar en la base de datos
+@app.errorhandler(AdmissionRejected)
+def admission_rejected_response(e):
+    return jsonify({
+        "error": f"Trabajo rechazado: {e}",
+        "estimate": e.estimate._asdict(),
+        "limits": scheduler.budget(),
+    }), 413
+
+
+@app.errorhandler(JobQueueFull)
+def queue_full_response(e):
+    resp = jsonify({"error": str(e), "queue": e.stats})
+    resp.headers["Retry-After"] = "5"
+    return resp, 503
+
+
+def align_input(input_path, fasta_digest, limits=None, timer=None, cancel_event=None):
+    """Alinea (o lee de la caché) y limpia los temporales. Devuelve el resultado
+    con los tiempos de cada alineador y de cada etapa (`stages`)."""
+    timer = timer or StageTimer(STAGE_SECONDS)
+    timer.end("queue_wait")
+
+    # Si este FASTA ya se alineó con los mismos alineadores, no se relanzan
+    key = cache_key(fasta_digest)
+    outputs = []
     try:
-        requests.post(f"{DB_URL}/save", json={
+        with timer.stage("cache_lookup"):
+            cached = result_cache.lookup(key)
+        CACHE_LOOKUPS.inc(result="miss" if cached is None else "hit")
+        if cached is not None:
+            muscle_text = cached["muscle_content"]
+            msa_text = cached["msa_content"]
+            results = {}
+        else:
+            # Ejecutar ambos alineadores en paralelo → rutas y tiempos por herramienta
+            results = align_files(
+                input_path, os.path.join(OUT_DIR, str(uuid.uuid4())), limits, timer, cancel_event=cancel_event
+            )
+            outputs = [results["muscle"]["output"], results["msaligner"]["output"]]
+
+            # Leer alineamientos como texto plano
+            with timer.stage("read_outputs"):
+                with open(outputs[0], "r") as f1, open(outputs[1], "r") as f2:
+                    muscle_text = f1.read()
+                    msa_text = f2.read()
+    finally:
+        # Borrar archivos temporales también si falla el alineador o la lectura
+        with timer.stage("cleanup"):
+            remove_inputs([input_path, *outputs])
+
+    if cached is None:
+        with timer.stage("cache_store"):
+            result_cache.store(key, muscle_text, msa_text)
+
+    # Métricas precalculadas: el frontend y el historial no necesitan
+    # volver a parsear los alineamientos completos
+    muscle_data, msa_data = muscle_text.encode(), msa_text.encode()
+    summaries = summarize_alignments(summarize_fasta, {"muscle": muscle_data, "msa": msa_data}, timer)
+    comparison = compare_alignments(compare_fasta, muscle_data, msa_data, timer)
+
+    # Ambos alineamientos como texto plano
+    return {
+        "aligned_muscle.fasta": muscle_text,
+        "aligned_msa.fasta": msa_text,
+        "summaries": summaries,
+        "comparison": comparison,
+        "cached": cached is not None,
+        "timings": timings_of(results),
+        "stages": timer.to_dict()
+    }
+
+
+def process_alignment(input_path, input_filename, fasta_digest, limits=None, timer=None,
+                      cancel_event=None):
+    """Alinea, guarda en la DB y limpia los temporales. Devuelve el resultado."""
+    timer = timer or StageTimer(STAGE_SECONDS)
+    result = align_input(input_path, fasta_digest, limits, timer, cancel_event=cancel_event)
+
+    # Guardar en la base de datos (en segundo plano)
+    with timer.stage("db_enqueue"):
+        save_queue.submit({
             "filename": input_filename,
-            "muscle_content": muscle_text,
-            "msa_content": msa_text
+            "muscle_content": result["aligned_muscle.fasta"],
+            "msa_content": result["aligned_msa.fasta"],
+            "summaries": result["summaries"],
+            "comparison": result["comparison"]
         })
-    except Exception as e:
-        print(f"⚠️ No se pudo guardar en DB: {e}")
 
-    # Borrar archivos temporales
+    result["stages"] = timer.to_dict()
+    return result
+
+
+def timings_of(results):
+    return {
+        tool: {"wall_time": r["wall_time"], "cpu_time": r["cpu_time"], "max_rss": r["max_rss"]}
+        for tool, r in results.items()
+    }
+
+
+def alignment_error_response(e):
+    status = 504 if isinstance(e, AlignmentTimeout) else 500
+    return jsonify({"error": str(e), "tool": e.tool}), status
+
+
+@app.route("/align", methods=["POST"])
+def align():
+    """Alineamiento síncrono: responde cuando ambos alineadores terminan"""
+    timer = StageTimer(STAGE_SECONDS)
+    with timer.stage("save_upload"):
+        input_filename, input_path = save_upload(request.files["file"])
+    with timer.stage("validate"):
+        stats, lane, limits = admit_upload(input_path)
+    timer.begin("queue_wait")
     try:
+        return jsonify(run_in_lane(lane, process_alignment, input_path, input_filename, stats.digest,
+                                   limits, timer, discard=lambda: remove_inputs([input_path])))
+    except JobQueueFull:
         os.remove(input_path)
-        os.remove(muscle_path)
-        os.remove(msa_path)
-    except Exception as e:
-        print(f"Error al limpiar archivos: {e}")
+        raise
+    except AlignmentError as e:
+        return alignment_error_response(e)
+
+
+def upload_blob(path):
+    """Sube un archivo a la DB en streaming y devuelve el hash de su blob"""
+    with open(path, "rb") as f:
+        resp = db.post("blobs", data=f, timeout=(CONNECT_TIMEOUT, BLOB_TIMEOUT))
+    resp.raise_for_status()
+    return resp.json()["hash"]
+
+
+def iter_db_blob(digest):
+    """Descarga un blob de la DB por trozos"""
+    with db.get(f"blobs/{digest}", stream=True, timeout=(CONNECT_TIMEOUT, BLOB_TIMEOUT)) as resp:
+        resp.raise_for_status()
+        yield from resp.iter_content(CHUNK_SIZE)
+
+
+@app.route("/align/stream", methods=["POST"])
+def align_stream():
+    """Alineamiento en streaming para archivos grandes.
+
+    El input llega como multipart (campo `file`) o como cuerpo crudo
+    (`?filename=` opcional) y se escribe a disco por trozos. La respuesta es
+    NDJSON (por defecto) o multipart/mixed (`?format=multipart`) leída
+    directamente de los archivos de salida, y el guardado en la DB también se
+    hace en streaming: ningún alineamiento completo pasa por memoria.
+    """
+    timer = StageTimer(STAGE_SECONDS)
+    input_path = os.path.join(IN_DIR, f"{uuid.uuid4()}.fasta")
+    outputs = []
+    try:
+        with timer.stage("save_upload"):
+            if request.mimetype == "multipart/form-data":
+                file = request.files["file"]
+                filename = file.filename
+                copy_stream(file.stream, input_path)
+            else:
+                filename = request.args.get("filename")
+                copy_stream(request.stream, input_path)
+        filename = filename or os.path.basename(input_path)
+
+        with timer.stage("validate"):
+            stats, lane, limits = admit_upload(input_path)
+        key = cache_key(stats.digest)
+        with timer.stage("cache_lookup"):
+            refs = result_cache.lookup(key, refs=True)
+        CACHE_LOOKUPS.inc(result="miss" if refs is None else "hit")
+        summaries, comparison = {}, None
+        if refs is not None:
+            results = {}
+            sources = [
+                ("aligned_muscle.fasta", iter_db_blob(refs["muscle_blob"])),
+                ("aligned_msa.fasta", iter_db_blob(refs["msa_blob"])),
+            ]
+            cached = True
+        else:
+            timer.begin("queue_wait")
+            try:
+                output_prefix = os.path.join(OUT_DIR, str(uuid.uuid4()))
+                results = run_in_lane(lane, align_files, input_path, output_prefix, limits, timer)
+            except AlignmentError as e:
+                return alignment_error_response(e)
+
+            outputs = [results["muscle"]["output"], results["msaligner"]["output"]]
+            # En un acierto de caché la DB ya tiene los resúmenes y la comparación de estos blobs
+            if sum(os.path.getsize(path) for path in outputs) <= STREAM_ANALYSIS_MAX_BYTES:
+                summaries = summarize_alignments(
+                    summarize_file, {"muscle": outputs[0], "msa": outputs[1]}, timer
+                )
+                comparison = compare_alignments(compare_files, outputs[0], outputs[1], timer)
+            try:
+                with timer.stage("upload_blobs"):
+                    refs = {"muscle_blob": upload_blob(outputs[0]), "msa_blob": upload_blob(outputs[1])}
+                with timer.stage("cache_store"):
+                    result_cache.store(key, **refs)
+            except Exception as e:
+                # Sin la DB los blobs viajan por el spool y se suben al guardarlos
+                print(f"⚠️ No se pudo subir a la DB, se guardará más tarde: {e}")
+                refs = None
+            sources = [
+                ("aligned_muscle.fasta", iter_file(outputs[0])),
+                ("aligned_msa.fasta", iter_file(outputs[1])),
+            ]
+            cached = False
+
+        # Guardar en la base de datos: solo referencias si los blobs ya están
+        # subidos; el análisis que falte lo calcula la DB cuando se pida
+        item = {"filename": filename, "summaries": summaries, "comparison": comparison,
+                "defer_analysis": True}
+        with timer.stage("db_enqueue"):
+            if refs is not None:
+                save_queue.submit({**item, **refs})
+            else:
+                save_queue.submit_files(item, {"muscle_blob": outputs[0], "msa_blob": outputs[1]})
+    except BaseException:
+        # Las salidas solo sobreviven si llega a crearse la respuesta que las envía
+        remove_inputs(outputs)
+        raise
+    finally:
+        # Pase lo que pase (upload cortado, FASTA rechazado, fallo del
+        # alineador o de la DB) el input ya no hace falta
+        remove_inputs([input_path])
+
+    meta = {"filename": filename, "cached": cached, "summaries": summaries,
+            "comparison": comparison, "timings": timings_of(results), "stages": timer.to_dict()}
+    if request.args.get("format") == "multipart":
+        boundary, body = multipart_stream(meta, sources)
+        mimetype = f"multipart/mixed; boundary={boundary}"
+    else:
+        body = ndjson_stream(meta, sources)
+        mimetype = "application/x-ndjson"
+
+    def generate():
+        # Los temporales se borran al terminar (o cortarse) la respuesta
+        try:
+            yield from body
+        finally:
+            remove_inputs(outputs)
+
+    return Response(generate(), mimetype=mimetype)
+
+def batch_inputs():
+    """(nombre, ruta, error) de cada FASTA del lote.
+
+    Acepta varios archivos multipart (campo `files`), cada uno FASTA o
+    zip/tar, o un zip/tar (o un FASTA) como cuerpo crudo.
+    """
+    uploads = []
+    inputs = []
+    try:
+        if request.mimetype == "multipart/form-data":
+            for file in request.files.getlist("files") or request.files.getlist("file"):
+                uploads.append(save_upload(file))
+        else:
+            path = os.path.join(IN_DIR, f"{uuid.uuid4()}.upload")
+            copy_stream(request.stream, path)
+            uploads.append((request.args.get("filename") or os.path.basename(path), path))
+
+        for name, path in uploads:
+            if is_archive(path):
+                inputs.extend(extract_archive(path, IN_DIR, MAX_UPLOAD_BYTES))
+                os.remove(path)
+            else:
+                inputs.append((name, path, None))
+        if not inputs:
+            raise BatchError("El lote no contiene archivos")
+        if len(inputs) > MAX_BATCH_FILES:
+            raise BatchError(f"El lote tiene más de {MAX_BATCH_FILES} archivos")
+    except BaseException:
+        remove_inputs([p for _, p in uploads] + [p for _, p, _ in inputs])
+        raise
+    return inputs
+
+
+def save_bulk(items):
+    """Encola los resultados de un lote para guardarlos en una sola
+    transacción de la DB"""
+    if not items:
+        return {"count": 0}
+    try:
+        save_queue.submit(items)
+        return {"count": len(items)}
+    except OSError as e:
+        print(f"⚠️ No se pudo encolar el lote para la DB: {e}")
+        return {"count": 0, "error": str(e)}
+
+
+@app.errorhandler(BatchError)
+def batch_error_response(e):
+    return jsonify({"error": str(e)}), 400
+
+
+@app.route("/align/batch", methods=["POST"])
+def align_batch():
+    """Alinea muchos FASTA en una sola petición.
+
+    Cada entrada se valida y se admite por separado (las rechazadas no paran
+    el lote) y las admitidas pasan por los carriles del planificador. La
+    respuesta es NDJSON: una línea `result` por archivo según va terminando,
+    una línea `saved` con los resultados encolados para guardarse en bloque en la
+    DB (en segundo plano, en una transacción) y una línea `end`.
+    """
+    entries = []
+    for index, (name, path, error) in enumerate(batch_inputs()):
+        digest = lane = limits = None
+        if error is None:
+            try:
+                stats, lane, limits = admit_upload(path)
+                digest = stats.digest
+            except (FastaError, AdmissionRejected) as e:
+                error = str(e)
+        entries.append(BatchEntry(index, name, path if error is None else None, digest, lane, limits,
+                                  error))
+
+    rejected = [e for e in entries if e.error is not None]
+    admitted = [e for e in entries if e.error is None]
+    results = run_batch(scheduler, admitted, align_input, BATCH_CONCURRENCY)
+
+    def line(payload):
+        return json.dumps(payload) + "\n"
+
+    def generate():
+        yield line({"type": "meta", "files": len(entries), "admitted": len(admitted)})
+        for entry in rejected:
+            yield line({"type": "result", "index": entry.index, "filename": entry.filename,
+                        "status": "rejected", "error": entry.error})
+
+        items = []
+        try:
+            for entry, job in results:
+                result = {"type": "result", "index": entry.index, "filename": entry.filename,
+                          "status": job.status}
+                if job.status == DONE:
+                    items.append({
+                        "filename": entry.filename,
+                        "muscle_content": job.result["aligned_muscle.fasta"],
+                        "msa_content": job.result["aligned_msa.fasta"],
+                        "summaries": job.result["summaries"],
+                        "comparison": job.result["comparison"],
+                    })
+                    result.update(job.result)
+                else:
+                    result["error"] = job.error
+                yield line(result)
+        finally:
+            # Lo ya alineado se guarda aunque el cliente se desconecte a medias
+            saved = save_bulk(items)
+        yield line({"type": "saved", **saved})
+        yield line({"type": "end"})
+
+    return Response(generate(), mimetype="application/x-ndjson")
+
+
+@app.route("/jobs", methods=["POST"])
+def submit_job():
+    """Encola un alineamiento y devuelve su ID sin esperar al resultado"""
+    timer = StageTimer(STAGE_SECONDS)
+    with timer.stage("save_upload"):
+        input_filename, input_path = save_upload(request.files["file"])
+    with timer.stage("validate"):
+        stats, lane, limits = admit_upload(input_path)
+    timer.begin("queue_wait")
+    try:
+        job = scheduler.lanes[lane].submit(process_alignment, input_path, input_filename, stats.digest,
+                                           limits, timer, discard=lambda: remove_inputs([input_path]))
+    except JobQueueFull:
+        os.remove(input_path)
+        raise
 
-    # Devolver ambos como JSON (texto plano)
     return jsonify({
-        "aligned_muscle.fasta": muscle_text,
-        "aligned_msa.fasta": msa_text
-    })
+        **job.to_dict(),
+        "estimate": estimate_job(stats)._asdict(),
+        "limits": limits,
+        "queue": scheduler.lanes[lane].stats()
+    }), 202
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    job = scheduler.get(job_id)
+    if job is None:
+        return jsonify({"error": "Trabajo no encontrado"}), 404
+    return jsonify({**job.to_dict(), "queue": scheduler.lanes[job.lane].stats()})
+
+
+@app.route("/jobs/<job_id>/result", methods=["GET"])
+def job_result(job_id):
+    job = scheduler.get(job_id)
+    if job is None:
+        return jsonify({"error": "Trabajo no encontrado"}), 404
+    if job.status in (QUEUED, RUNNING):
+        return jsonify(job.to_dict()), 202
+    if job.status != DONE:
+        return jsonify(job.to_dict()), 500
+    return jsonify(job.result)
+
+
+@app.route("/jobs/<job_id>", methods=["DELETE"])
+def cancel_job(job_id):
+    job = scheduler.cancel(job_id)
+    if job is None:
+        return jsonify({"error": "Trabajo no encontrado"}), 404
+    return jsonify(job.to_dict())
 
 
 @app.route("/alignments", methods=["GET"])
 def get_alignments():
-    """Devuelve el historial desde la DB"""
+    """Devuelve una página del historial desde la DB (limit, cursor, prefix, since, until)"""
     try:
-        resp = requests.get(f"{DB_URL}/list")
+        resp = db.get("list", params=request.args)
         return jsonify(resp.json())
     except Exception as e:
         return jsonify({"error": f"No se pudo conectar con DB: {e}"}), 500
 
+@app.route("/cache/stats", methods=["GET"])
+def cache_stats():
+    """Aciertos/fallos y ocupación de la caché de resultados"""
+    try:
+        return jsonify(result_cache.stats())
+    except Exception as e:
+        return jsonify({"error": f"No se pudo conectar con DB: {e}"}), 500
+
 @app.route("/save", methods=["POST"])
 def save_proxy():
     data = request.json
     try:
-        resp = requests.post(f"{DB_URL}/save", json=data)
+        resp = db.post("save", json=data)
         return jsonify(resp.json()), resp.status_code
     except Exception as e:
         return jsonify({"error": f"No se pudo guardar en DB: {e}"}), 500
@@ -79,11 +657,81 @@ def save_proxy():
 @app.route("/alignment/<int:alignment_id>", methods=["GET"])
 def get_alignment(alignment_id):
     try:
-        resp = requests.get(f"{DB_URL}/get/{alignment_id}")
+        resp = db.get(f"get/{alignment_id}")
+        return jsonify(resp.json()), resp.status_code
+    except Exception as e:
+        return jsonify({"error": f"No se pudo obtener el alineamiento: {e}"}), 500
+
+
+@app.route("/alignment/<int:alignment_id>/info", methods=["GET"])
+def get_alignment_info(alignment_id):
+    """Dimensiones y nombres de cada alineador, sin su contenido"""
+    try:
+        resp = db.get(f"get/{alignment_id}/info")
+        return jsonify(resp.json()), resp.status_code
+    except Exception as e:
+        return jsonify({"error": f"No se pudo obtener el alineamiento: {e}"}), 500
+
+
+@app.route("/alignment/<int:alignment_id>/summary", methods=["GET"])
+def get_alignment_summary(alignment_id):
+    """Resumen precalculado de cada alineador (`identity=0` sin la matriz de identidad)"""
+    try:
+        resp = db.get(f"get/{alignment_id}/summary", params=request.args)
+        return jsonify(resp.json()), resp.status_code
+    except Exception as e:
+        return jsonify({"error": f"No se pudo obtener el alineamiento: {e}"}), 500
+
+
+@app.route("/alignment/<int:alignment_id>/comparison", methods=["GET"])
+def get_alignment_comparison(alignment_id):
+    """Comparación precalculada MUSCLE frente a MSAligner"""
+    try:
+        resp = db.get(f"get/{alignment_id}/comparison")
         return jsonify(resp.json()), resp.status_code
     except Exception as e:
         return jsonify({"error": f"No se pudo obtener el alineamiento: {e}"}), 500
 
 
+@app.route("/alignment/<int:alignment_id>/window", methods=["GET"])
+def get_alignment_window(alignment_id):
+    """Ventana (columnas y filas) de un alineamiento en formato binario common.msa"""
+    try:
+        resp = db.get(f"get/{alignment_id}/window", params=request.args,
+                      timeout=(CONNECT_TIMEOUT, BLOB_TIMEOUT))
+    except Exception as e:
+        return jsonify({"error": f"No se pudo obtener el alineamiento: {e}"}), 500
+    return Response(resp.content, status=resp.status_code, content_type=resp.headers.get("Content-Type"))
+
+
+@app.route("/alignment/<int:alignment_id>/fasta", methods=["GET"])
+def get_alignment_fasta(alignment_id):
+    """FASTA de un alineador (`aligner`), reenviado en streaming desde la DB"""
+    try:
+        resp = db.get(f"get/{alignment_id}/fasta", params=request.args, stream=True,
+                      timeout=(CONNECT_TIMEOUT, BLOB_TIMEOUT))
+    except Exception as e:
+        return jsonify({"error": f"No se pudo obtener el alineamiento: {e}"}), 500
+    if resp.status_code != 200:
+        with resp:
+            return jsonify(resp.json()), resp.status_code
+
+    def generate():
+        with resp:
+            yield from resp.iter_content(CHUNK_SIZE)
+
+    return Response(generate(), mimetype="text/plain")
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """Métricas en formato de texto de Prometheus"""
+    return Response(metrics.render(), content_type=CONTENT_TYPE)
+
+
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000)
+    # Servidor de desarrollo; en producción: gunicorn -c gunicorn.conf.py app:app
+    clean_scratch()
+    prepare()
+    save_queue.start()
+    app.run(host="0.0.0.0", port=5000, threaded=True)
@@ -0,0 +1,159 @@
+import os
+import queue
+import tarfile
+import time
+import uuid
+import zipfile
+from collections import deque, namedtuple
+
+from jobs import FAILED, Job, JobQueueClosed, JobQueueFull
+from streaming import copy_stream
+
+# Máximo de archivos FASTA por lote
+MAX_BATCH_FILES = int(os.environ.get("MAX_BATCH_FILES", "1000"))
+# Espera antes de reintentar cuando el carril está lleno
+BATCH_RETRY_INTERVAL = 0.5
+# Tiempo máximo sin conseguir hueco en un carril lleno (sin nada propio en
+# vuelo): pasado este, las entradas que faltan terminan con error
+BATCH_QUEUE_TIMEOUT = float(os.environ.get("BATCH_QUEUE_TIMEOUT", "300"))
+
+# Entradas de archivos comprimidos que no son datos (metadatos de macOS, ocultos)
+IGNORED_PREFIXES = ("__MACOSX/", ".")
+
+BatchEntry = namedtuple("BatchEntry", ["index", "filename", "path", "digest", "lane", "limits", "error"])
+
+
+class BatchError(ValueError):
+    """El lote no se puede procesar (formato o tamaño)"""
+
+
+def _ignored(name):
+    base = os.path.basename(name)
+    return not base or name.startswith(IGNORED_PREFIXES) or base.startswith(".")
+
+
+def is_archive(path):
+    return zipfile.is_zipfile(path) or tarfile.is_tarfile(path)
+
+
+def _archive_members(path):
+    """Genera (nombre, tamaño, abrir) de los archivos regulares de un zip/tar"""
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and not _ignored(info.filename):
+                    yield info.filename, info.file_size, lambda info=info: archive.open(info)
+        return
+    with tarfile.open(path, "r:*") as archive:
+        for member in archive:
+            if member.isfile() and not _ignored(member.name):
+                yield member.name, member.size, lambda member=member: archive.extractfile(member)
+
+
+def extract_archive(path, directory, max_bytes):
+    """Extrae a `directory` los FASTA de un zip/tar (sin confiar en sus rutas).
+
+    Devuelve una lista de (nombre, ruta, error): las entradas que superan
+    `max_bytes` no se extraen y llevan el motivo en `error`.
+    """
+    extracted = []
+    try:
+        for name, size, open_member in _archive_members(path):
+            if len(extracted) >= MAX_BATCH_FILES:
+                raise BatchError(f"El lote tiene más de {MAX_BATCH_FILES} archivos")
+            if size > max_bytes:
+                extracted.append((name, None, f"El archivo ocupa {size} bytes (máximo {max_bytes})"))
+                continue
+            target = os.path.join(directory, f"{uuid.uuid4()}.fasta")
+            with open_member() as src:
+                copy_stream(src, target)
+            extracted.append((name, target, None))
+    except (zipfile.BadZipFile, tarfile.TarError, EOFError) as e:
+        remove_inputs(p for _, p, _ in extracted)
+        raise BatchError(f"Archivo comprimido no válido: {e}")
+    except BaseException:
+        remove_inputs(p for _, p, _ in extracted)
+        raise
+    return extracted
+
+
+def remove_inputs(paths):
+    for path in paths:
+        if path is None:
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            # Ya lo borró otro (p. ej. la limpieza de align_input)
+            pass
+
+
+def failed_job(entry, error):
+    """Job ya terminado con error para una entrada que no llegó a encolarse"""
+    job = Job(None, (), entry.lane)
+    job.status = FAILED
+    job.error = str(error)
+    job.exception = error
+    job.finished_at = time.time()
+    job.finished.set()
+    return job
+
+
+def _fail_waiting(waiting, error):
+    """Termina con `error` (y sin temporales) las entradas que no llegaron a encolarse"""
+    while waiting:
+        entry = waiting.popleft()
+        remove_inputs([entry.path])
+        yield entry, failed_job(entry, error)
+
+
+def run_batch(scheduler, entries, fn, concurrency):
+    """Ejecuta fn(path, digest, limits, cancel_event=...) para cada entrada admitida y
+    genera (entrada, job) según van terminando.
+
+    Los trabajos pasan por los carriles del planificador, pero el lote solo
+    tiene `concurrency` en vuelo a la vez: no llena las colas ni deja sin
+    hueco a otros clientes. Si el consumidor deja de leer (cliente
+    desconectado) se cancelan los pendientes y se borran sus temporales. Si
+    un carril se cierra (el servidor se detiene) o sigue lleno más de
+    BATCH_QUEUE_TIMEOUT, las entradas que faltan terminan con error en lugar
+    de esperar un hueco sin plazo.
+    """
+    done = queue.Queue()
+    waiting = deque(entries)
+    running = {}
+    full_since = None
+    try:
+        while waiting or running:
+            while waiting and len(running) < concurrency:
+                entry = waiting[0]
+                try:
+                    job = scheduler.lanes[entry.lane].submit(
+                        fn, entry.path, entry.digest, entry.limits, notify=done,
+                        discard=lambda path=entry.path: remove_inputs([path]), keep=False
+                    )
+                except JobQueueClosed as e:
+                    yield from _fail_waiting(waiting, e)
+                    break
+                except JobQueueFull as e:
+                    if running:
+                        break
+                    if full_since is None:
+                        full_since = time.monotonic()
+                    elif time.monotonic() - full_since > BATCH_QUEUE_TIMEOUT:
+                        yield from _fail_waiting(waiting, e)
+                        break
+                    time.sleep(BATCH_RETRY_INTERVAL)
+                    continue
+                full_since = None
+                waiting.popleft()
+                running[job.id] = entry
+
+            if not running:
+                continue
+            job = done.get()
+            yield running.pop(job.id), job
+    finally:
+        for job_id in running:
+            scheduler.cancel(job_id)
+        remove_inputs(e.path for e in list(running.values()) + list(waiting))
@@ -0,0 +1,53 @@
+import hashlib
+import json
+
+from aligner import aligner_fingerprint
+
+
+def cache_key(fasta_digest):
+    """Clave de caché: hash del FASTA normalizado (ver common.fasta.scan_fasta)
+    + versión y argumentos de los alineadores"""
+    payload = json.dumps({
+        "fasta": fasta_digest,
+        "aligners": aligner_fingerprint(),
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResultCache:
+    """Caché de resultados de alineamiento persistida en el servicio db.
+
+    Cualquier fallo de comunicación con la DB se trata como un fallo de caché:
+    el alineamiento se ejecuta igualmente.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def lookup(self, key, refs=False):
+        """Resultado cacheado o None. Con refs=True devuelve solo los hashes
+        de los blobs (muscle_blob/msa_blob) para descargarlos en streaming."""
+        try:
+            resp = self.client.get(f"cache/{key}", params={"refs": 1} if refs else None)
+        except Exception as e:
+            print(f"⚠️ No se pudo consultar la caché: {e}")
+            return None
+        if resp.status_code != 200:
+            return None
+        return resp.json()
+
+    def store(self, key, muscle_text=None, msa_text=None, muscle_blob=None, msa_blob=None):
+        """Guarda el resultado como texto o como referencias a blobs ya subidos"""
+        try:
+            self.client.put(f"cache/{key}", json={
+                "muscle_content": muscle_text,
+                "msa_content": msa_text,
+                "muscle_blob": muscle_blob,
+                "msa_blob": msa_blob
+            })
+        except Exception as e:
+            print(f"⚠️ No se pudo guardar en la caché: {e}")
+
+    def stats(self):
+        resp = self.client.get("cache/stats")
+        return resp.json()
@@ -0,0 +1,83 @@
+# Configuración de gunicorn para el backend:
+#   gunicorn -c gunicorn.conf.py app:app
+import os
+import signal
+import sys
+import threading
+import time
+
+chdir = os.path.dirname(os.path.abspath(__file__))  # in/, out/ y spool/ son relativos
+sys.path.insert(0, chdir)
+
+from scheduler import MAX_JOB_SECONDS  # noqa: E402
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:5000")
+
+# Los trabajos (/jobs) y los carriles del planificador viven en memoria del
+# proceso: con varios workers, GET /jobs/<id> podría llegar a un proceso que no
+# conoce el trabajo y los límites de concurrencia se multiplicarían. Por eso un solo proceso con muchos hilos:
+# los alineadores son procesos aparte, así que los hilos solo esperan.
+workers = int(os.environ.get("GUNICORN_WORKERS", "1"))
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", "32"))
+
+# Importar la app una sola vez en el maestro: los workers arrancan ya cargados
+preload_app = True
+
+# Con gthread el latido del worker no depende de las peticiones, así que un
+# alineamiento largo no provoca que el maestro lo mate
+timeout = 60
+keepalive = 5
+
+# Al detenerse (SIGTERM) se deja terminar a los alineamientos en curso hasta
+# este tiempo; docker-compose debe dar algo más (stop_grace_period)
+graceful_timeout = int(os.environ.get("GRACEFUL_TIMEOUT", str(int(MAX_JOB_SECONDS) + 30)))
+SHUTDOWN_MARGIN = 10  # segundos para cancelar y limpiar antes del SIGKILL
+
+accesslog = "-"
+
+
+def on_starting(server):
+    # En el maestro y antes de crear workers: nadie usa aún in/ ni out/
+    from app import clean_scratch
+    clean_scratch()
+    # Huella de los alineadores calculada una vez: los workers la heredan
+    from aligner import prepare
+    prepare()
+
+
+def post_worker_init(worker):
+    """Al recibir SIGTERM se cierran los carriles en paralelo al cierre de
+    gunicorn: los trabajos de /jobs (que no son peticiones en curso) también
+    pueden terminar, y los que no lo hagan se cancelan antes de que el
+    maestro mate al worker y deje huérfanos los procesos alineadores.
+    Después se da tiempo a que se envíen los guardados pendientes."""
+    from app import save_queue, scheduler
+
+    # Reenviar lo que quedó en el spool sin esperar al primer alineamiento
+    save_queue.start()
+    handle_exit = worker.handle_exit
+
+    def shutdown():
+        deadline = time.monotonic() + max(0.0, graceful_timeout - SHUTDOWN_MARGIN)
+        worker.log.info("Trabajos cancelados al detenerse: %d",
+                        scheduler.shutdown(deadline - time.monotonic()))
+        # Los guardados que no se confirmen siguen en el spool para el próximo arranque
+        if not save_queue.flush(max(0.0, deadline - time.monotonic())):
+            worker.log.info("Guardados pendientes en el spool: %d", save_queue.pending())
+
+    def drain(sig, frame):
+        if not hasattr(worker, "scheduler_shutdown"):
+            worker.scheduler_shutdown = threading.Thread(
+                target=shutdown, name="scheduler-shutdown", daemon=True
+            )
+            worker.scheduler_shutdown.start()
+        handle_exit(sig, frame)
+
+    signal.signal(signal.SIGTERM, drain)
+
+
+def worker_exit(server, worker):
+    thread = getattr(worker, "scheduler_shutdown", None)
+    if thread is not None:
+        thread.join()
@@ -0,0 +1,196 @@
+import queue
+import threading
+import time
+import uuid
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class JobQueueFull(Exception):
+    """No hay hueco en la cola: el cliente debe reintentar más tarde"""
+
+    def __init__(self, message, stats=None):
+        super().__init__(message)
+        self.stats = stats or {}
+
+
+class JobQueueClosed(JobQueueFull):
+    """La cola ya no admite trabajos (el servidor se está deteniendo): a
+    diferencia de una cola llena, reintentar no sirve"""
+
+
+class Job:
+    """Un trabajo de alineamiento y su estado"""
+
+    def __init__(self, fn, args, lane=None, notify=None, discard=None, keep=True):
+        self.id = str(uuid.uuid4())
+        self.fn = fn
+        self.args = args
+        self.lane = lane
+        self.notify = notify
+        self.discard = discard
+        self.keep = keep
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.exception = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_event = threading.Event()
+        self.finished = threading.Event()
+
+    def wait(self, timeout=None):
+        """Espera a que termine; devuelve el resultado o relanza su excepción"""
+        self.finished.wait(timeout)
+        if self.exception is not None:
+            raise self.exception
+        return self.result
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "lane": self.lane,
+            "status": self.status,
+            "error": self.error,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobQueue:
+    """Pool acotado de hilos que procesa trabajos en orden de llegada.
+
+    Los trabajos esperan en una cola de tamaño máximo `max_queued`; cuando
+    está llena submit() lanza JobQueueFull en lugar de aceptar más trabajo.
+    Los trabajos terminados se conservan `ttl` segundos para poder consultarlos
+    (salvo los internos, con keep=False, que se olvidan al terminar).
+    """
+
+    def __init__(self, workers, max_queued, ttl=3600, name="align"):
+        self.name = name
+        self.workers = workers
+        self.max_queued = max_queued
+        self.ttl = ttl
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._running = 0
+        self._threads = []
+        self._closed = False
+
+    def _ensure_started(self):
+        # Los hilos se crean al primer uso (y no al importar el módulo)
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._worker, name=f"{self.name}-worker-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            if job.cancel_event.is_set():
+                # Cancelado antes de empezar: fn no llegará a liberar lo suyo
+                if job.discard is not None:
+                    try:
+                        job.discard()
+                    except Exception as e:
+                        print(f"⚠️ Error al descartar el trabajo {job.id}: {e}")
+                self._finish(job, CANCELLED)
+                continue
+
+            with self._lock:
+                self._running += 1
+            job.status = RUNNING
+            job.started_at = time.time()
+            try:
+                job.result = job.fn(*job.args, cancel_event=job.cancel_event)
+                self._finish(job, DONE)
+            except Exception as e:
+                job.error = str(e)
+                job.exception = e
+                self._finish(job, CANCELLED if job.cancel_event.is_set() else FAILED)
+            finally:
+                with self._lock:
+                    self._running -= 1
+
+    def _finish(self, job, status):
+        if not job.keep:
+            # Nadie lo consultará por su id: quien lo lanzó ya tiene el Job
+            with self._lock:
+                self._jobs.pop(job.id, None)
+        job.finished_at = time.time()
+        job.status = status
+        job.finished.set()
+        if job.notify is not None:
+            job.notify.put(job)
+
+    def _purge(self):
+        limit = time.time() - self.ttl
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job.finished_at is not None and job.finished_at < limit]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+    def submit(self, fn, *args, notify=None, discard=None, keep=True):
+        """Encola fn(*args, cancel_event=...) y devuelve el Job creado.
+
+        Si se pasa una cola `notify`, el Job se deposita en ella al terminar.
+        `discard()` se llama si el trabajo se cancela antes de ejecutarse
+        (p. ej. para borrar su input). Con keep=False (trabajos internos de
+        las rutas síncronas y los lotes, que esperan al Job directamente) no
+        se conserva al terminar: su resultado no ocupa memoria durante `ttl`.
+        """
+        if self._closed:
+            raise JobQueueClosed(f"Cola '{self.name}' cerrada: el servidor se está deteniendo", self.stats())
+        self._ensure_started()
+        self._purge()
+        job = Job(fn, args, self.name, notify, discard, keep)
+        with self._lock:
+            self._jobs[job.id] = job
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job.id]
+            raise JobQueueFull(f"Cola '{self.name}' llena ({self.max_queued} trabajos en espera)",
+                               self.stats())
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is not None:
+            job.cancel_event.set()
+        return job
+
+    def close(self):
+        """Deja de aceptar trabajos; los ya encolados siguen ejecutándose"""
+        self._closed = True
+
+    def pending(self):
+        """Trabajos encolados o en ejecución"""
+        with self._lock:
+            return [job for job in self._jobs.values() if not job.finished.is_set()]
+
+    def stats(self):
+        with self._lock:
+            running = self._running
+        return {
+            "workers": self.workers,
+            "running": running,
+            "queued": self._queue.qsize(),
+            "max_queued": self.max_queued,
+        }
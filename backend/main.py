@@ -1,5 +1,5 @@
 from aligner import run_alignment
-from io_utils import read_fasta
+from common.fasta import read_fasta
 import os
 
 # Crear carpetas si no existen
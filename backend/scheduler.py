@@ -0,0 +1,145 @@
+import os
+import time
+from collections import namedtuple
+
+from aligner import DEFAULT_TIMEOUTS
+from jobs import JobQueue
+
+# Modelo de coste (aproximado, calibrable por entorno). El alineamiento
+# progresivo compara todos los pares de secuencias con programación dinámica:
+# tiempo ~ pares x L², memoria ~ matriz L² + matriz de distancias N².
+CELLS_PER_SECOND = float(os.environ.get("ALIGN_CELLS_PER_SECOND", "5e7"))
+BYTES_PER_CELL = int(os.environ.get("ALIGN_BYTES_PER_CELL", "32"))
+BASE_MEMORY = int(os.environ.get("ALIGN_BASE_MEMORY", str(64 * 1024 * 1024)))
+
+# Presupuestos por trabajo (tiempo de pared y memoria residente): por encima
+# se rechaza en la admisión, y acotan los límites de cada proceso alineador
+MAX_JOB_SECONDS = float(os.environ.get("MAX_JOB_SECONDS", str(max(DEFAULT_TIMEOUTS.values()))))
+MAX_JOB_MEMORY = int(os.environ.get("MAX_JOB_MEMORY", str(4 * 1024 ** 3)))
+
+# Límites de cada proceso alineador a partir de la estimación del trabajo: el
+# modelo de coste es aproximado, así que se deja un margen (multiplicador) y
+# un mínimo para los trabajos pequeños, sin pasar de los presupuestos
+LIMIT_HEADROOM = float(os.environ.get("ALIGN_LIMIT_HEADROOM", "4"))
+MIN_LIMIT_SECONDS = float(os.environ.get("ALIGN_MIN_LIMIT_SECONDS", "30"))
+MIN_LIMIT_MEMORY = int(os.environ.get("ALIGN_MIN_LIMIT_MEMORY", str(512 * 1024 ** 2)))
+# Hilos que usa cada alineador (MUSCLE 5 usa todos los núcleos por defecto):
+# el tiempo de CPU de un proceso es la suma de todos sus hilos
+ALIGNER_THREADS = int(os.environ.get("ALIGNER_THREADS", str(os.cpu_count() or 1)))
+
+# Trabajos estimados por encima de este tiempo van al carril de grandes
+LARGE_JOB_SECONDS = float(os.environ.get("LARGE_JOB_SECONDS", "10"))
+LARGE_WORKERS = int(os.environ.get("LARGE_WORKERS", "1"))
+LARGE_QUEUE_SIZE = int(os.environ.get("LARGE_QUEUE_SIZE", "4"))
+
+FAST = "fast"
+LARGE = "large"
+
+JobEstimate = namedtuple("JobEstimate", ["sequences", "residues", "max_length", "seconds", "memory"])
+
+
+class AdmissionRejected(Exception):
+    """El trabajo superaría los presupuestos configurados"""
+
+    def __init__(self, message, estimate):
+        super().__init__(message)
+        self.estimate = estimate
+
+
+def estimate_job(stats):
+    """Coste estimado de alinear un FASTA a partir de sus FastaStats"""
+    n, length = stats.sequences, stats.max_length
+    pairs = n * (n - 1) / 2
+    seconds = pairs * length * length / CELLS_PER_SECOND
+    memory = BASE_MEMORY + length * length * BYTES_PER_CELL + n * n * 8 + stats.residues
+    return JobEstimate(n, stats.residues, length, round(seconds, 3), int(memory))
+
+
+class Scheduler:
+    """Reparte los trabajos en dos carriles según su coste estimado.
+
+    Los pequeños van a un carril rápido con varios workers; los grandes a un
+    carril aparte con pocos workers y una cola corta, para que no acaparen el
+    servidor ni bloqueen a los pequeños. Los trabajos que superan el
+    presupuesto de tiempo o memoria se rechazan antes de encolarlos.
+    """
+
+    def __init__(self, fast_workers, fast_queue, large_workers=LARGE_WORKERS,
+                 large_queue=LARGE_QUEUE_SIZE, large_seconds=LARGE_JOB_SECONDS,
+                 max_seconds=MAX_JOB_SECONDS, max_memory=MAX_JOB_MEMORY,
+                 threads=ALIGNER_THREADS):
+        self.lanes = {
+            FAST: JobQueue(fast_workers, fast_queue, name=FAST),
+            LARGE: JobQueue(large_workers, large_queue, name=LARGE),
+        }
+        self.large_seconds = large_seconds
+        self.max_seconds = max_seconds
+        self.max_memory = max_memory
+        self.threads = threads
+
+    def admit(self, estimate):
+        """Carril para el trabajo o AdmissionRejected si no cabe en el presupuesto"""
+        if estimate.seconds > self.max_seconds:
+            raise AdmissionRejected(
+                f"Tiempo estimado {estimate.seconds:.0f}s (máximo {self.max_seconds:g}s)", estimate
+            )
+        if estimate.memory > self.max_memory:
+            raise AdmissionRejected(
+                f"Memoria estimada {estimate.memory / 1024 ** 2:.0f} MB "
+                f"(máximo {self.max_memory / 1024 ** 2:.0f} MB)", estimate
+            )
+        return LARGE if estimate.seconds > self.large_seconds else FAST
+
+    def budget(self):
+        """Presupuestos de admisión"""
+        return {"seconds": self.max_seconds, "memory": self.max_memory}
+
+    def limits(self, estimate):
+        """Límites de cada proceso alineador de un trabajo (ver run_aligners).
+
+        - `cpu`: segundos de CPU (RLIMIT_CPU, suma de todos los hilos). Es el
+          tiempo de pared permitido por los hilos del alineador, para que un
+          proceso multihilo no lo agote antes de tiempo.
+        - `memory`: bytes de memoria residente (RSS) del proceso. No es un
+          límite de espacio de direcciones: un proceso multihilo reserva
+          mucho más espacio virtual del que llega a usar.
+        """
+        seconds = min(self.max_seconds, max(estimate.seconds * LIMIT_HEADROOM, MIN_LIMIT_SECONDS))
+        memory = min(self.max_memory, max(estimate.memory * LIMIT_HEADROOM, MIN_LIMIT_MEMORY))
+        return {"cpu": seconds * self.threads, "memory": int(memory)}
+
+    def get(self, job_id):
+        for lane in self.lanes.values():
+            job = lane.get(job_id)
+            if job is not None:
+                return job
+        return None
+
+    def cancel(self, job_id):
+        for lane in self.lanes.values():
+            job = lane.cancel(job_id)
+            if job is not None:
+                return job
+        return None
+
+    def stats(self):
+        return {name: lane.stats() for name, lane in self.lanes.items()}
+
+    def shutdown(self, timeout):
+        """Cierre ordenado: no admite más trabajos y espera hasta `timeout`
+        segundos a que terminen los pendientes. Los que no acaben a tiempo se
+        cancelan (lo que mata sus procesos alineadores) para no dejar
+        huérfanos. Devuelve el número de trabajos cancelados."""
+        for lane in self.lanes.values():
+            lane.close()
+        deadline = time.monotonic() + timeout
+        for lane in self.lanes.values():
+            for job in lane.pending():
+                job.finished.wait(max(0.0, deadline - time.monotonic()))
+        cancelled = [job for lane in self.lanes.values() for job in lane.pending()]
+        for job in cancelled:
+            job.cancel_event.set()
+        for job in cancelled:
+            # Cancelar es inmediato (killpg); el margen cubre la limpieza
+            job.finished.wait(5)
+        return len(cancelled)
@@ -0,0 +1,76 @@
+import codecs
+import json
+import os
+import uuid
+
+# Tamaño de los trozos leídos/escritos en streaming
+CHUNK_SIZE = 64 * 1024
+
+
+def copy_stream(src, path, chunk_size=CHUNK_SIZE):
+    """Escribe un stream en disco por trozos; devuelve los bytes copiados.
+
+    Si la lectura falla (p. ej. 413 al superar MAX_CONTENT_LENGTH) no deja
+    el archivo a medias.
+    """
+    total = 0
+    try:
+        with open(path, "wb") as f:
+            while True:
+                chunk = src.read(chunk_size)
+                if not chunk:
+                    break
+                f.write(chunk)
+                total += len(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return total
+
+
+def iter_file(path, chunk_size=CHUNK_SIZE):
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def ndjson_stream(meta, sources):
+    """Genera líneas NDJSON: una cabecera `meta`, los trozos de cada fuente y un final.
+
+    `sources` es una lista de (nombre, iterable de bytes). Cada trozo viaja como
+    {"type": "chunk", "name": ..., "data": ...}; el cliente concatena `data`.
+    """
+    yield json.dumps({"type": "meta", **meta}) + "\n"
+    for name, chunks in sources:
+        # Decodificador incremental: un carácter UTF-8 puede quedar partido entre trozos
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        for chunk in chunks:
+            text = decoder.decode(chunk)
+            if text:
+                yield json.dumps({"type": "chunk", "name": name, "data": text}) + "\n"
+        tail = decoder.decode(b"", final=True)
+        if tail:
+            yield json.dumps({"type": "chunk", "name": name, "data": tail}) + "\n"
+    yield json.dumps({"type": "end"}) + "\n"
+
+
+def multipart_stream(meta, sources, boundary=None):
+    """Genera un cuerpo multipart/mixed: una parte JSON con `meta` y una parte
+    FASTA por fuente. Devuelve (boundary, generador)."""
+    boundary = boundary or uuid.uuid4().hex
+
+    def parts():
+        yield (f"--{boundary}\r\nContent-Type: application/json\r\n"
+               f"Content-Disposition: inline; name=\"meta\"\r\n\r\n").encode()
+        yield json.dumps(meta).encode() + b"\r\n"
+        for name, chunks in sources:
+            yield (f"--{boundary}\r\nContent-Type: text/x-fasta\r\n"
+                   f"Content-Disposition: attachment; name=\"{name}\"; filename=\"{name}\"\r\n\r\n").encode()
+            yield from chunks
+            yield b"\r\n"
+        yield f"--{boundary}--\r\n".encode()
+
+    return boundary, parts()
@@ -0,0 +1,265 @@
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+import uuid
+from datetime import datetime
+
+# Directorio donde esperan los guardados pendientes (sobrevive a reinicios)
+SPOOL_DIR = os.environ.get("SAVE_SPOOL_DIR", "spool")
+# Guardados pendientes que se envían juntos en una transacción de /save_bulk
+SAVE_BATCH_SIZE = int(os.environ.get("SAVE_BATCH_SIZE", "50"))
+# Espera entre reintentos cuando la DB no responde: crece hasta el máximo
+SAVE_RETRY_INITIAL = float(os.environ.get("SAVE_RETRY_INITIAL", "1"))
+SAVE_RETRY_MAX = float(os.environ.get("SAVE_RETRY_MAX", "60"))
+
+
+class SaveQueue:
+    """Guardado diferido (write-behind) de alineamientos en la DB.
+
+    submit() escribe los alineamientos en un archivo del spool y vuelve de
+    inmediato; un hilo los envía a POST /save_bulk en segundo plano,
+    agrupando los pendientes. Si la DB no responde se reintenta con backoff
+    sin perder nada: el archivo solo se borra cuando la DB confirma, y los
+    que quedaron de una ejecución anterior se reenvían al arrancar. Cada
+    alineamiento lleva un `save_key` único, así que reenviar uno que la DB
+    ya había guardado no lo duplica.
+
+    submit_files() hace lo mismo con alineamientos que están en archivos
+    (copiados al spool junto al guardado): el hilo los sube a POST /blobs
+    antes de guardarlos.
+
+    Los que la DB rechaza (4xx) se apartan a `failed/` para revisarlos.
+    El spool pertenece a un único proceso (el backend usa un solo worker).
+    """
+
+    def __init__(self, client, spool_dir=SPOOL_DIR, batch_size=SAVE_BATCH_SIZE,
+                 counter=None, upload_timeout=None):
+        self.client = client
+        self.spool_dir = spool_dir
+        self.failed_dir = os.path.join(spool_dir, "failed")
+        self.batch_size = batch_size
+        self.counter = counter
+        self.upload_timeout = upload_timeout
+        self._queue = queue.Queue()
+        self._lock = threading.Condition()
+        self._thread = None
+        self._outstanding = 0  # archivos encolados aún sin confirmar ni apartar
+        os.makedirs(self.failed_dir, exist_ok=True)
+
+    def _ensure_started(self):
+        # El hilo se crea al primer uso (no al importar, que con preload_app
+        # ocurre en el maestro de gunicorn antes del fork)
+        with self._lock:
+            if self._thread is not None:
+                return
+            names = sorted(os.listdir(self.spool_dir))
+            for name in names:
+                if name.endswith(".tmp") or (name.endswith(".blob")
+                                             and name.split(".", 1)[0] + ".json" not in names):
+                    # Escritura interrumpida: submit() nunca devolvió su save_key
+                    os.remove(os.path.join(self.spool_dir, name))
+                elif name.endswith(".json"):
+                    self._outstanding += 1
+                    self._queue.put(os.path.join(self.spool_dir, name))
+            self._thread = threading.Thread(target=self._worker, name="db-writeback", daemon=True)
+            self._thread.start()
+
+    def start(self):
+        """Arranca el envío (y reenvía lo que quedó en el spool)"""
+        self._ensure_started()
+
+    def submit(self, items):
+        """Encola uno o varios alineamientos (mismo formato que /save).
+
+        Se guardan juntos, en la misma transacción. Devuelve sus save_key.
+        """
+        if isinstance(items, dict):
+            items = [items]
+        # Antes de escribir: el arranque reenvía lo que ya está en el spool, y
+        # este archivo no debe encolarse también desde ahí
+        self._ensure_started()
+        return self._spool(items, self._new_stem())
+
+    def submit_files(self, item, files):
+        """Encola un alineamiento cuyos FASTA están en archivos.
+
+        `files` es {campo: ruta} (p. ej. {"muscle_blob": ..., "msa_blob": ...}).
+        Se copian al spool por trozos, sin cargarlos en memoria, y al enviar
+        el guardado se suben a POST /blobs y el campo recibe el hash del blob.
+        Devuelve su save_key.
+        """
+        self._ensure_started()
+        stem = self._new_stem()
+        copied = {}
+        try:
+            for field, path in files.items():
+                name = f"{stem}.{field}.blob"
+                with open(path, "rb") as src, open(os.path.join(self.spool_dir, name), "wb") as dst:
+                    shutil.copyfileobj(src, dst, 1024 * 1024)
+                    dst.flush()
+                    os.fsync(dst.fileno())
+                copied[field] = name
+        except BaseException:
+            for name in copied.values():
+                os.remove(os.path.join(self.spool_dir, name))
+            raise
+        return self._spool([{**item, "blob_files": copied}], stem)[0]
+
+    @staticmethod
+    def _new_stem():
+        # Nombre ordenable por llegada: se reenvían en el mismo orden
+        return f"{time.time_ns():020d}-{uuid.uuid4().hex}"
+
+    def _spool(self, items, stem):
+        created_at = datetime.now().isoformat()
+        items = [{"save_key": str(uuid.uuid4()), "created_at": created_at, **item} for item in items]
+
+        path = os.path.join(self.spool_dir, stem + ".json")
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"items": items}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._outstanding += 1
+        self._queue.put(path)
+        return [item["save_key"] for item in items]
+
+    def pending(self):
+        """Archivos del spool aún sin confirmar"""
+        return sum(1 for name in os.listdir(self.spool_dir) if name.endswith(".json"))
+
+    def flush(self, timeout=None):
+        """Espera a que se confirme todo lo encolado; devuelve False si vence
+        `timeout` (lo pendiente sigue en el spool para la próxima ejecución)"""
+        with self._lock:
+            return self._lock.wait_for(lambda: self._outstanding == 0, timeout)
+
+    def _done(self, count=1):
+        with self._lock:
+            self._outstanding -= count
+            self._lock.notify_all()
+
+    def _count(self, result, amount):
+        if self.counter is not None:
+            self.counter.inc(amount, result=result)
+
+    def _take_batch(self):
+        paths = [self._queue.get()]
+        while len(paths) < self.batch_size:
+            try:
+                paths.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return paths
+
+    def _worker(self):
+        while True:
+            paths = self._take_batch()
+            delay = SAVE_RETRY_INITIAL
+            while paths:
+                try:
+                    paths = self._send(paths)
+                except Exception as e:
+                    paths = self._remaining(paths)
+                    if not paths:
+                        break
+                    print(f"⚠️ No se pudo guardar en DB (reintento en {delay:.0f}s): {e}")
+                    self._count("retry", 1)
+                    time.sleep(delay)
+                    delay = min(delay * 2, SAVE_RETRY_MAX)
+
+    def _remaining(self, paths):
+        """Archivos del lote que siguen pendientes tras un fallo. Los apartados
+        a failed/ ya se contaron; uno que ha desaparecido del spool no se
+        puede reenviar y se da por terminado."""
+        remaining = []
+        for path in paths:
+            if os.path.exists(path):
+                remaining.append(path)
+            elif not os.path.exists(os.path.join(self.failed_dir, os.path.basename(path))):
+                print(f"⚠️ El guardado ya no está en el spool: {path}")
+                self._done()
+        return remaining
+
+    def _send(self, paths):
+        """Envía los archivos juntos; devuelve los que queda por enviar"""
+        batches = []
+        for path in paths:
+            try:
+                with open(path) as f:
+                    items = json.load(f)["items"]
+            except FileNotFoundError:
+                print(f"⚠️ El guardado ya no está en el spool: {path}")
+                self._done()
+                continue
+            except (OSError, ValueError) as e:
+                print(f"⚠️ Guardado ilegible en el spool, se aparta: {path}: {e}")
+                self._discard(path)
+                continue
+            try:
+                batches.append((path, [self._upload_files(item) for item in items]))
+            except FileNotFoundError as e:
+                print(f"⚠️ Falta un archivo del guardado, se aparta: {path}: {e}")
+                self._discard(path)
+        if not batches:
+            return []
+
+        items = [item for _, batch in batches for item in batch]
+        resp = self.client.post("save_bulk", json={"items": items})
+        if 400 <= resp.status_code < 500:
+            if len(batches) > 1:
+                # Un archivo inválido no debe arrastrar a los demás: se
+                # reenvían por separado para aislarlo
+                for path, _ in batches[1:]:
+                    self._queue.put(path)
+                return [batches[0][0]]
+            print(f"⚠️ La DB rechazó un guardado ({resp.status_code}): {resp.text[:200]}")
+            self._count("rejected", len(items))
+            self._discard(batches[0][0])
+            return []
+        resp.raise_for_status()
+
+        self._count("saved", len(items))
+        for path, _ in batches:
+            for name in [os.path.basename(path)] + self._blob_files(path):
+                try:
+                    os.remove(os.path.join(self.spool_dir, name))
+                except FileNotFoundError:
+                    pass
+        self._done(len(batches))
+        return []
+
+    def _upload_files(self, item):
+        """Sube los archivos de un guardado de submit_files() y devuelve el
+        item con los hashes de sus blobs (subir dos veces el mismo contenido
+        no lo duplica: los blobs se direccionan por contenido)"""
+        files = item.get("blob_files")
+        if not files:
+            return item
+        item = {key: value for key, value in item.items() if key != "blob_files"}
+        kwargs = {} if self.upload_timeout is None else {"timeout": self.upload_timeout}
+        for field, name in files.items():
+            with open(os.path.join(self.spool_dir, name), "rb") as f:
+                resp = self.client.post("blobs", data=f, **kwargs)
+            resp.raise_for_status()
+            item[field] = resp.json()["hash"]
+        return item
+
+    def _blob_files(self, path):
+        stem = os.path.basename(path)[:-len(".json")] + "."
+        return [name for name in os.listdir(self.spool_dir)
+                if name.startswith(stem) and name.endswith(".blob")]
+
+    def _discard(self, path):
+        for name in [os.path.basename(path)] + self._blob_files(path):
+            try:
+                os.replace(os.path.join(self.spool_dir, name), os.path.join(self.failed_dir, name))
+            except FileNotFoundError:
+                pass
+        self._done()
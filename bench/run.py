@@ -0,0 +1,368 @@
+"""Benchmarks de los caminos críticos: parser, alineadores, DB, análisis y visor.
+
+Uso:
+    python bench/run.py --preset quick --output bench.json
+    python bench/run.py --output nuevo.json --baseline bench.json
+
+Los resultados (mediana, mínimo y ejecuciones de cada caso, más el entorno)
+se escriben en JSON. Con --baseline se comparan con otra ejecución y el proceso
+sale con código 1 si algún caso empeora más que --threshold (por defecto se
+compara el mínimo, menos sensible al ruido que la mediana).
+"""
+import argparse
+import gc
+import importlib.util
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.join(ROOT, "bench")
+STANDIN = os.path.join(BENCH_DIR, "standin_aligner.py")
+
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+from synthetic import aligned_family, to_fasta, unaligned  # noqa: E402
+
+# Tamaños (secuencias x columnas) por preset
+PRESETS = {
+    "quick": {
+        "analysis": [(50, 300), (200, 1000)],
+        "aligner": [(10, 300), (50, 300)],
+        "db": {"clients": 4, "requests": 25, "size": (20, 300)},
+        "repeat": 3,
+    },
+    "default": {
+        "analysis": [(50, 300), (200, 1000), (1000, 2000)],
+        "aligner": [(10, 300), (50, 500), (200, 500)],
+        "db": {"clients": 8, "requests": 100, "size": (50, 500)},
+        "repeat": 5,
+    },
+}
+
+SECTIONS = ("parse", "aligner", "db", "analysis", "viewer")
+
+
+def load_module(name, path):
+    """Importa un archivo con un nombre propio (db/app.py y backend/app.py se llaman igual)"""
+    sys.path.insert(0, os.path.dirname(path))
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def measure(fn, repeat, setup=None, warmup=1):
+    """Tiempos de fn(setup()) en segundos; setup no se mide.
+
+    Como timeit, el recolector de basura se desactiva durante cada medida.
+    """
+    runs = []
+    for i in range(warmup + repeat):
+        arg = setup() if setup else None
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            fn(arg) if setup else fn()
+            elapsed = time.perf_counter() - start
+        finally:
+            gc.enable()
+        if i >= warmup:
+            runs.append(elapsed)
+    return {
+        "median": statistics.median(runs),
+        "min": min(runs),
+        "mean": statistics.fmean(runs),
+        "runs": runs,
+    }
+
+
+def size_label(n, length):
+    return f"{n}x{length}"
+
+
+def family(n, length, seed=0):
+    return aligned_family(n, length, divergence=0.1, gap_rate=0.02, seed=seed)
+
+
+def bench_parse(preset, repeat):
+    from common.fasta import parse_alignment, scan_fasta
+
+    results = {}
+    for n, length in preset["analysis"]:
+        data = to_fasta(family(n, length)).encode()
+        with tempfile.NamedTemporaryFile(suffix=".fasta", delete=False) as f:
+            f.write(data)
+        try:
+            label = size_label(n, length)
+            results[f"parse.parse_alignment[{label}]"] = measure(lambda: parse_alignment(data), repeat)
+            results[f"parse.scan_fasta[{label}]"] = measure(lambda: scan_fasta(f.name), repeat)
+        finally:
+            os.remove(f.name)
+    return results
+
+
+def aligner_executables():
+    """Ejecutables reales si están disponibles; si no, el sustituto local"""
+    muscle = shutil.which(os.environ.get("MUSCLE_EXE", "muscle"))
+    msaligner = os.environ.get("MSALIGNER_EXE", os.path.join(ROOT, "backend", "exec", "MSAligner"))
+    if not os.access(msaligner, os.X_OK):
+        msaligner = None
+    return muscle, msaligner
+
+
+def bench_aligner(preset, repeat):
+    muscle, msaligner = aligner_executables()
+    # aligner.py lee los ejecutables del entorno al importarse
+    os.environ["MUSCLE_EXE"] = muscle or STANDIN
+    os.environ["MSALIGNER_EXE"] = msaligner or STANDIN
+    aligner = load_module("bench_aligner", os.path.join(ROOT, "backend", "aligner.py"))
+
+    results = {}
+    workdir = tempfile.mkdtemp(prefix="bench_align_")
+    try:
+        for n, length in preset["aligner"]:
+            input_path = os.path.join(workdir, "input.fasta")
+            with open(input_path, "w") as f:
+                f.write(to_fasta(unaligned(family(n, length))))
+            prefix = os.path.join(workdir, "out")
+            for concurrent in (True, False):
+                name = "run_alignment" if concurrent else "run_alignment_sequential"
+                result = measure(lambda: aligner.run_alignment(input_path, prefix, concurrent=concurrent),
+                                 repeat)
+                result["muscle"] = "standin" if muscle is None else muscle
+                result["msaligner"] = "standin" if msaligner is None else msaligner
+                results[f"aligner.{name}[{size_label(n, length)}]"] = result
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def percentiles(latencies):
+    latencies = sorted(latencies)
+    pick = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))]  # noqa: E731
+    return {"p50": pick(0.5), "p95": pick(0.95), "p99": pick(0.99), "max": latencies[-1]}
+
+
+def bench_db(preset, repeat):
+    """/save, /list, /get, /get/<id>/window y /get/<id>/summary con varios
+    clientes concurrentes (en proceso, sin red)"""
+    config = preset["db"]
+    workdir = tempfile.mkdtemp(prefix="bench_db_")
+    os.environ["DB_PATH"] = os.path.join(workdir, "bench.db")
+    db = load_module("bench_db_app", os.path.join(ROOT, "db", "app.py"))
+    db.init_db()
+
+    n, length = config["size"]
+    text = to_fasta(family(n, length))
+    # Como en producción, el resumen llega ya calculado por el backend
+    from common.analysis import summarize_fasta
+    summary = summarize_fasta((">0-0\n" + text).encode())
+    results = {}
+    try:
+        def run_clients(request):
+            latencies = []
+            lock = threading.Lock()
+
+            def client(worker):
+                local = []
+                with db.app.test_client() as c:
+                    for i in range(config["requests"]):
+                        start = time.perf_counter()
+                        resp = request(c, worker, i)
+                        local.append(time.perf_counter() - start)
+                        if resp.status_code >= 400:
+                            raise RuntimeError(f"{resp.status_code}: {resp.get_data(as_text=True)}")
+                with lock:
+                    latencies.extend(local)
+
+            threads = [threading.Thread(target=client, args=(w,)) for w in range(config["clients"])]
+            start = time.perf_counter()
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            elapsed = time.perf_counter() - start
+            return {
+                "median": statistics.median(latencies),
+                "min": min(latencies),
+                "mean": statistics.fmean(latencies),
+                "throughput": len(latencies) / elapsed,
+                "clients": config["clients"],
+                "requests": len(latencies),
+                **percentiles(latencies),
+            }
+
+        # Cada cliente guarda contenido distinto (la deduplicación no lo oculta)
+        results["db.save"] = run_clients(lambda c, w, i: c.post("/save", json={
+            "filename": f"bench_{w}_{i}.fasta",
+            "muscle_content": f">{w}-{i}\n" + text,
+            "msa_content": f">{w}-{i}-msa\n" + text,
+            "summaries": {"muscle": summary, "msa": summary},
+        }))
+        results["db.list"] = run_clients(lambda c, w, i: c.get("/list", query_string={"limit": 20}))
+        total = config["clients"] * config["requests"]
+        results["db.get"] = run_clients(
+            lambda c, w, i: c.get(f"/get/{(w * config['requests'] + i) % total + 1}")
+        )
+        # Lo que pide el visor: 100 columnas x 40 filas en binario, sin el FASTA completo
+        results["db.window"] = run_clients(lambda c, w, i: c.get(
+            f"/get/{(w * config['requests'] + i) % total + 1}/window",
+            query_string={"start": length // 2, "end": length // 2 + 100, "row_end": 40}
+        ))
+        # Lo que pide el historial al abrir un alineamiento: métricas sin el contenido
+        results["db.summary"] = run_clients(lambda c, w, i: c.get(
+            f"/get/{(w * config['requests'] + i) % total + 1}/summary"
+        ))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def bench_analysis(preset, repeat):
+    sys.path.insert(0, os.path.join(ROOT, "frontend"))
+    import numpy as np
+    from analysis import EncodedAlignment
+    from common.analysis import compare
+    from common.fasta import parse_alignment
+
+    results = {}
+    for n, length in preset["analysis"]:
+        data = to_fasta(family(n, length)).encode()
+        label = size_label(n, length)
+        # Alineamiento nuevo en cada ejecución: EncodedAlignment cachea sus resultados
+        fresh = lambda: EncodedAlignment.from_fasta(data)  # noqa: E731
+        results[f"analysis.from_fasta[{label}]"] = measure(lambda: EncodedAlignment.from_fasta(data), repeat)
+        results[f"analysis.identity_matrix[{label}]"] = measure(lambda a: a.identity_matrix(), repeat, fresh)
+        results[f"analysis.conservation[{label}]"] = measure(lambda a: a.conservation(), repeat, fresh)
+        results[f"analysis.mutations[{label}]"] = measure(lambda a: a.mutations(0), repeat, fresh)
+        results[f"analysis.mutation_rows[{label}]"] = measure(
+            lambda a: a.mutations(0).rows(slice(None), a.names), repeat, fresh
+        )
+        # Comparación entre alineadores: el mismo alineamiento desplazado una columna
+        headers, matrix = parse_alignment(data, unique_ids=False)
+        shifted = np.roll(matrix, 1, axis=1)
+        results[f"analysis.compare[{label}]"] = measure(
+            lambda: compare(headers, matrix, headers, shifted), repeat
+        )
+    return results
+
+
+def bench_viewer(preset, repeat):
+    sys.path.insert(0, os.path.join(ROOT, "frontend"))
+    from io import BytesIO
+
+    import matplotlib.pyplot as plt
+    from analysis import EncodedAlignment
+    from viewer import create_msa_visualization
+
+    def render(alignment, end_pos, row_end):
+        fig = create_msa_visualization(alignment, "Clustal", 0, end_pos, 0, row_end)
+        fig.savefig(BytesIO(), format="png")
+        plt.close(fig)
+
+    results = {}
+    for n, length in preset["analysis"]:
+        alignment = EncodedAlignment.from_fasta(to_fasta(family(n, length)).encode())
+        label = size_label(n, length)
+        results[f"viewer.window_100x40[{label}]"] = measure(lambda: render(alignment, 100, 40), repeat)
+        results[f"viewer.full[{label}]"] = measure(lambda: render(alignment, length, n), repeat)
+    return results
+
+
+BENCHMARKS = {
+    "parse": bench_parse,
+    "aligner": bench_aligner,
+    "db": bench_db,
+    "analysis": bench_analysis,
+    "viewer": bench_viewer,
+}
+
+
+def environment(preset_name):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True, timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    import numpy
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "commit": commit,
+        "preset": preset_name,
+        "python": platform.python_version(),
+        "numpy": numpy.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def compare(results, baseline, threshold, metric="min"):
+    """Filas (caso, valor base, valor nuevo, ratio) y lista de regresiones"""
+    rows, regressions = [], []
+    for name, result in sorted(results.items()):
+        base = baseline.get(name)
+        if base is None:
+            continue
+        ratio = result[metric] / base[metric] if base[metric] else float("inf")
+        rows.append((name, base[metric], result[metric], ratio))
+        if ratio > threshold:
+            regressions.append(name)
+    return rows, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="quick")
+    parser.add_argument("--only", default=",".join(SECTIONS),
+                        help=f"secciones separadas por comas ({', '.join(SECTIONS)})")
+    parser.add_argument("--repeat", type=int, help="repeticiones por caso (por defecto, las del preset)")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", help="JSON de una ejecución anterior para comparar")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="ratio nuevo/base a partir del cual se considera regresión")
+    parser.add_argument("--metric", choices=("min", "median", "mean"), default="min",
+                        help="estadístico que se compara con la línea base")
+    args = parser.parse_args()
+
+    preset = PRESETS[args.preset]
+    repeat = args.repeat or preset["repeat"]
+    results = {}
+    for section in args.only.split(","):
+        section = section.strip()
+        print(f"▶ {section}...", file=sys.stderr)
+        section_results = BENCHMARKS[section](preset, repeat)
+        for name, result in section_results.items():
+            print(f"  {name:55s} {result['median'] * 1000:10.2f} ms", file=sys.stderr)
+        results.update(section_results)
+
+    report = {"environment": environment(args.preset), "results": results}
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Resultados en {args.output}", file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        rows, regressions = compare(results, baseline, args.threshold, args.metric)
+        for name, before, after, ratio in rows:
+            flag = "  ⚠️" if name in regressions else ""
+            print(f"{name:55s} {before * 1000:10.2f} → {after * 1000:10.2f} ms  x{ratio:.2f}{flag}")
+        if regressions:
+            print(f"{len(regressions)} regresiones por encima de x{args.threshold}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
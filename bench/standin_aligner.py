@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""Alineador de sustitución para medir el pipeline sin MUSCLE/MSAligner.
+
+Acepta las dos formas de invocación de backend/aligner.py:
+    standin_aligner.py -align <input> -output <output>   (MUSCLE)
+    standin_aligner.py <input> <output>                  (MSAligner)
+y escribe las secuencias rellenadas con gaps hasta la misma longitud.
+Mide el coste del lanzamiento, la lectura y la escritura, no el alineamiento.
+"""
+import sys
+
+
+def main(argv):
+    if argv and argv[0] == "-version":
+        print("standin 1.0")
+        return 0
+    if argv and argv[0] == "-align":
+        input_path, output_path = argv[1], argv[3]
+    else:
+        input_path, output_path = argv[0], argv[1]
+
+    records = []
+    with open(input_path) as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith(">"):
+                records.append([line, []])
+            elif line and records:
+                records[-1][1].append(line)
+
+    sequences = [(h, "".join(parts)) for h, parts in records]
+    length = max((len(s) for _, s in sequences), default=0)
+    with open(output_path, "w") as f:
+        for h, seq in sequences:
+            f.write(f"{h}\n{seq.ljust(length, '-')}\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
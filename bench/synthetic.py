@@ -0,0 +1,81 @@
+"""Generador de FASTA sintéticos con la forma de backend/in/example.fasta.
+
+Cada familia parte de una secuencia ancestral aleatoria; cada secuencia
+deriva de ella con sustituciones (`divergence`) e indels (`gap_rate`). El
+alineamiento "verdadero" (con gaps) sirve para los análisis del frontend y
+la versión sin gaps como entrada de los alineadores. Todo es determinista
+dado `seed`.
+"""
+import argparse
+import random
+
+AMINO_ACIDS = "ACDEFGHIKLMNPQRSTVWY"
+LINE_WIDTH = 70  # como los FASTA de NCBI del ejemplo
+
+SPECIES = [
+    ("Raton", "Mus musculus"), ("Rata", "Rattus norvegicus"), ("Perro", "Canis lupus familiaris"),
+    ("Rhesus", "Macaca mulatta"), ("Humano", "Homo sapiens"), ("Vaca", "Bos taurus"),
+    ("Caballo", "Equus caballus"), ("Pollo", "Gallus gallus"), ("Pez", "Danio rerio"),
+]
+
+
+def header(i, rng):
+    common, species = SPECIES[i % len(SPECIES)]
+    gi = rng.randrange(10 ** 6, 10 ** 9)
+    return f"{common}{i} gi|{gi}|ref|XP_{gi % 10 ** 6:06d}.1| synthetic protein {i} [{species}]"
+
+
+def aligned_family(n, length, divergence=0.1, gap_rate=0.02, seed=0):
+    """Lista de (cabecera, fila alineada) de `n` secuencias de `length` columnas"""
+    rng = random.Random(seed)
+    ancestor = [rng.choice(AMINO_ACIDS) for _ in range(length)]
+    records = []
+    for i in range(n):
+        row = []
+        for residue in ancestor:
+            r = rng.random()
+            if r < gap_rate:
+                row.append("-")
+            elif r < gap_rate + divergence:
+                row.append(rng.choice(AMINO_ACIDS))
+            else:
+                row.append(residue)
+        records.append((header(i, rng), "".join(row)))
+    return records
+
+
+def unaligned(records):
+    """Las mismas secuencias sin gaps (entrada de los alineadores)"""
+    return [(h, seq.replace("-", "")) for h, seq in records]
+
+
+def to_fasta(records, width=LINE_WIDTH):
+    lines = []
+    for h, seq in records:
+        lines.append(f">{h}")
+        lines.extend(seq[i:i + width] for i in range(0, len(seq), width))
+    return "\n".join(lines) + "\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", "--sequences", type=int, default=100)
+    parser.add_argument("-l", "--length", type=int, default=500)
+    parser.add_argument("-d", "--divergence", type=float, default=0.1)
+    parser.add_argument("-g", "--gap-rate", type=float, default=0.02)
+    parser.add_argument("-s", "--seed", type=int, default=0)
+    parser.add_argument("--aligned", action="store_true", help="conservar los gaps")
+    parser.add_argument("-o", "--output", default="-")
+    args = parser.parse_args()
+
+    records = aligned_family(args.sequences, args.length, args.divergence, args.gap_rate, args.seed)
+    text = to_fasta(records if args.aligned else unaligned(records))
+    if args.output == "-":
+        print(text, end="")
+    else:
+        with open(args.output, "w") as f:
+            f.write(text)
+
+
+if __name__ == "__main__":
+    main()
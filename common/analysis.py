@@ -0,0 +1,295 @@
+import mmap
+import os
+from collections import defaultdict
+
+import numpy as np
+
+from common.fasta import GAP, PAD, map_file, parse_alignment
+
+# Celdas (filas x columnas) comparadas por bloque: acota la memoria temporal
+CHUNK_CELLS = 4_000_000
+
+# Número de bits a 1 de cada byte (popcount de las máscaras empaquetadas)
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def identity_matrix(matrix, chunk_cells=CHUNK_CELLS):
+    """Matriz de identidad por pares (%) de un alineamiento codificado.
+
+    Para cada par: coincidencias (mismo residuo, ninguno gap) entre posiciones
+    válidas (al menos uno no es gap), en el tramo común a ambas secuencias.
+    Solo se calcula el triángulo superior, por bloques de filas, y las
+    posiciones válidas se cuentan sobre máscaras de bits empaquetadas.
+    """
+    n, length = matrix.shape
+    identity = np.zeros((n, n))
+    if n == 0:
+        return identity
+
+    residue = (matrix != GAP) & (matrix != PAD)
+    packed_residue = np.packbits(residue, axis=1)
+    real = matrix != PAD
+    packed_real = None if real.all() else np.packbits(real, axis=1)
+
+    rows_per_chunk = max(1, chunk_cells // max(length, 1))
+    for i in range(n - 1):
+        for start in range(i + 1, n, rows_per_chunk):
+            stop = min(start + rows_per_chunk, n)
+
+            matches = ((matrix[start:stop] == matrix[i]) & residue[i]).sum(axis=1)
+
+            either = packed_residue[start:stop] | packed_residue[i]
+            if packed_real is not None:
+                either &= packed_real[start:stop] & packed_real[i]
+            valid = POPCOUNT[either].sum(axis=1, dtype=np.int64)
+
+            with np.errstate(divide="ignore", invalid="ignore"):
+                scores = np.where(valid > 0, matches / valid * 100, 0.0)
+            identity[i, start:stop] = scores
+            identity[start:stop, i] = scores
+
+    np.fill_diagonal(identity, 100.0)
+    return identity
+
+
+def column_counts(matrix, chunk_cells=CHUNK_CELLS):
+    """Cuenta residuos por columna (sin gaps ni relleno).
+
+    Devuelve (alphabet, counts): `alphabet` son los códigos de residuo
+    presentes y `counts[k, j]` cuántas veces aparece alphabet[k] en la
+    columna j. Se procesa por bloques de columnas para acotar la memoria.
+    """
+    n, length = matrix.shape
+    residue = (matrix != GAP) & (matrix != PAD)
+    alphabet = np.unique(matrix[residue])
+    k = len(alphabet)
+
+    # Código de residuo → índice compacto 0..K-1 (-1 para gaps/relleno)
+    lookup = np.full(256, -1, dtype=np.int64)
+    lookup[alphabet] = np.arange(k)
+
+    counts = np.zeros((k, length), dtype=np.int64)
+    cols_per_chunk = max(1, chunk_cells // max(n, 1))
+    for start in range(0, length, cols_per_chunk):
+        stop = min(start + cols_per_chunk, length)
+        width = stop - start
+        index = lookup[matrix[:, start:stop]]
+        present = index >= 0
+        flat = (index * width + np.arange(width))[present]
+        counts[:, start:stop] = np.bincount(flat, minlength=k * width).reshape(k, width)
+    return alphabet, counts
+
+
+def conservation_from_counts(counts):
+    """Score de conservación (0-1) por columna a partir de la tabla de cuentas.
+
+    1 - H / Hmax, con H la entropía de Shannon de los residuos de la columna
+    y Hmax = log2(min(20, residuos distintos)). Columnas solo con gaps: 0.
+    """
+    total = counts.sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        p = counts / total
+        plogp = np.where(counts > 0, p * np.log2(p), 0.0)
+    entropy = -plogp.sum(axis=0)
+
+    distinct = (counts > 0).sum(axis=0)
+    with np.errstate(divide="ignore"):
+        max_entropy = np.log2(np.minimum(20, distinct))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = np.where(max_entropy > 0, entropy / max_entropy, 0.0)
+    return np.where(total > 0, 1 - ratio, 0.0)
+
+
+def conservation_scores(matrix, chunk_cells=CHUNK_CELLS):
+    _, counts = column_counts(matrix, chunk_cells)
+    return conservation_from_counts(counts)
+
+
+# Umbrales de las métricas de conservación (los mismos que muestra el frontend)
+HIGHLY_CONSERVED = 0.8
+VARIABLE = 0.5
+
+# La matriz de identidad crece con N² (en tamaño y en tiempo): por encima de
+# este número de secuencias el resumen no la incluye
+SUMMARY_MAX_IDENTITY = int(os.environ.get("SUMMARY_MAX_IDENTITY", "500"))
+
+
+def summarize(matrix, max_identity=SUMMARY_MAX_IDENTITY):
+    """Resumen de un alineamiento codificado para guardarlo junto a él.
+
+    Escalares (secuencias, longitud, fracción de gaps, longitud media sin
+    gaps, posiciones muy conservadas y variables), el perfil de conservación
+    y, si hay como mucho `max_identity` secuencias, la matriz de identidad.
+    """
+    n, length = matrix.shape
+    residue = (matrix != GAP) & (matrix != PAD)
+    cells = int((matrix != PAD).sum())
+    conservation = conservation_scores(matrix)
+    identity = identity_matrix(matrix) if 0 < n <= max_identity else None
+    return {
+        "sequences": n,
+        "length": length,
+        "gap_fraction": round(float((matrix == GAP).sum()) / cells, 6) if cells else 0.0,
+        "mean_length": float(residue.sum(axis=1).mean()) if n else 0.0,
+        "highly_conserved": int((conservation > HIGHLY_CONSERVED).sum()),
+        "variable": int((conservation < VARIABLE).sum()),
+        "conservation": np.round(conservation, 4).tolist(),
+        "identity": None if identity is None else np.round(identity, 2).tolist(),
+    }
+
+
+def summarize_fasta(data, max_identity=SUMMARY_MAX_IDENTITY):
+    """summarize() de un alineamiento FASTA (bytes o mmap)"""
+    _, matrix = parse_alignment(data, unique_ids=False)
+    return summarize(matrix, max_identity)
+
+
+def summarize_file(path, max_identity=SUMMARY_MAX_IDENTITY):
+    """summarize() de un archivo FASTA alineado, leído con mmap"""
+    data = map_file(path)
+    try:
+        return summarize_fasta(data, max_identity)
+    finally:
+        if isinstance(data, mmap.mmap):
+            data.close()
+
+
+# Comparación de dos alineamientos del mismo input (MUSCLE frente a MSAligner)
+
+# Tramos de columnas del mapa de desacuerdo y secuencias hasta las que se
+# incluye (el mapa ocupa secuencias x tramos)
+COMPARISON_REGIONS = int(os.environ.get("COMPARISON_REGIONS", "100"))
+COMPARISON_MAX_MAP = int(os.environ.get("COMPARISON_MAX_MAP", "500"))
+
+
+def _pairs(counts):
+    """Pares de residuos en grupos de `counts` residuos: k(k-1)/2"""
+    counts = counts.astype(np.int64)
+    return counts * (counts - 1) // 2
+
+
+def match_sequences(headers_a, headers_b):
+    """Índices (ia, ib) de las secuencias comunes, emparejadas por
+    identificador (primera palabra de la cabecera) en orden de aparición:
+    los alineadores pueden reordenarlas o recortar la descripción"""
+    pool = defaultdict(list)
+    for i, header in enumerate(headers_b):
+        pool[header.split()[0] if header.split() else ""].append(i)
+    ia, ib = [], []
+    for i, header in enumerate(headers_a):
+        candidates = pool.get(header.split()[0] if header.split() else "")
+        if candidates:
+            ia.append(i)
+            ib.append(candidates.pop(0))
+    return ia, ib
+
+
+def compare(headers_a, matrix_a, headers_b, matrix_b, regions=COMPARISON_REGIONS,
+            max_map=COMPARISON_MAX_MAP):
+    """Compara dos alineamientos de las mismas secuencias (A = referencia).
+
+    Cada residuo se identifica por (secuencia, posición sin gaps) y se sitúa
+    en su columna de A y de B. Dos residuos están alineados en un
+    alineamiento si comparten columna; agrupando los residuos por el par
+    (columna A, columna B) se cuentan a la vez, sin recorrer pares:
+
+    - `sp`: fracción de los pares alineados en uno que el otro reproduce
+      (sum-of-pairs; `b_vs_a` toma A como referencia) y `sp_symmetric`,
+      pares comunes sobre la media de ambos.
+    - `tc`: fracción de columnas (con 2+ residuos) idénticas en el otro.
+    - `divergence`: por secuencia, 1 - pares comunes / pares en alguno.
+    - `column_disagreement`: por columna de A, media del desacuerdo de sus
+      residuos; `region_map`: lo mismo por secuencia y tramo de columnas
+      de A (solo hasta `max_map` secuencias).
+
+    Las secuencias sin pareja o cuyos residuos no coinciden (distinta
+    longitud sin gaps) no entran en la comparación y se listan aparte.
+    """
+    ia, ib = match_sequences(headers_a, headers_b)
+    a, b = matrix_a[ia], matrix_b[ib]
+    residue_a = (a != GAP) & (a != PAD)
+    residue_b = (b != GAP) & (b != PAD)
+    same = residue_a.sum(axis=1) == residue_b.sum(axis=1)
+    matched_a, matched_b = set(ia), set(ib)
+    mismatched = [headers_a[i] for i, ok in zip(ia, same) if not ok]
+    unmatched = ([h for i, h in enumerate(headers_a) if i not in matched_a]
+                 + [h for i, h in enumerate(headers_b) if i not in matched_b])
+
+    keep = np.flatnonzero(same)
+    names = [headers_a[ia[i]] for i in keep]
+    n, length_a, length_b = len(keep), matrix_a.shape[1], matrix_b.shape[1]
+    # np.nonzero recorre por filas: el k-ésimo residuo de cada fila en A es
+    # el k-ésimo en B (misma secuencia y misma longitud sin gaps)
+    rows, col_a = np.nonzero(residue_a[keep])
+    _, col_b = np.nonzero(residue_b[keep])
+
+    count_a = np.bincount(col_a, minlength=length_a)
+    count_b = np.bincount(col_b, minlength=length_b)
+    groups, group_of, count_ab = np.unique(col_a.astype(np.int64) * max(length_b, 1) + col_b,
+                                           return_inverse=True, return_counts=True)
+    pairs_a, pairs_b, pairs_ab = _pairs(count_a).sum(), _pairs(count_b).sum(), _pairs(count_ab).sum()
+
+    # Columnas idénticas: todos sus residuos en una sola columna del otro y nada más
+    group_a, group_b = groups // max(length_b, 1), groups % max(length_b, 1)
+    identical = int(((count_ab >= 2) & (count_ab == count_a[group_a])
+                     & (count_ab == count_b[group_b])).sum())
+
+    # Compañeros de columna de cada residuo: en A, en B y en ambos
+    partners_a = count_a[col_a] - 1
+    partners_b = count_b[col_b] - 1
+    partners_ab = count_ab[group_of.ravel()] - 1
+    either = partners_a + partners_b - partners_ab
+    with np.errstate(divide="ignore", invalid="ignore"):
+        disagreement = np.where(either > 0, 1 - partners_ab / either, 0.0)
+        shared = np.bincount(rows, partners_ab, minlength=n)
+        union = np.bincount(rows, either, minlength=n)
+        divergence = np.where(union > 0, 1 - shared / union, 0.0)
+        column = np.bincount(col_a, disagreement, minlength=length_a) / count_a
+    column = np.nan_to_num(column)
+
+    region_map = None
+    bins = max(1, min(regions, length_a))
+    if n <= max_map:
+        cell = rows * bins + col_a * bins // max(length_a, 1)
+        cells = np.bincount(cell, minlength=n * bins)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            region_map = np.where(cells > 0, np.bincount(cell, disagreement, minlength=n * bins) / cells, 0.0)
+        region_map = np.round(region_map.reshape(n, bins), 3).tolist()
+
+    def ratio(x, y):
+        return round(float(x) / float(y), 6) if y else 1.0
+
+    return {
+        "sequences": n,
+        "columns": {"a": length_a, "b": length_b},
+        "names": names,
+        "unmatched": unmatched,
+        "mismatched": mismatched,
+        "sp": {"b_vs_a": ratio(pairs_ab, pairs_a), "a_vs_b": ratio(pairs_ab, pairs_b)},
+        "sp_symmetric": ratio(2 * pairs_ab, pairs_a + pairs_b),
+        "tc": {"b_vs_a": ratio(identical, (count_a >= 2).sum()),
+               "a_vs_b": ratio(identical, (count_b >= 2).sum())},
+        "identical_columns": identical,
+        "divergence": np.round(divergence, 4).tolist(),
+        "column_disagreement": np.round(column, 4).tolist(),
+        "regions": bins,
+        "region_map": region_map,
+    }
+
+
+def compare_fasta(data_a, data_b):
+    """compare() de dos alineamientos FASTA (bytes o mmap)"""
+    headers_a, matrix_a = parse_alignment(data_a, unique_ids=False)
+    headers_b, matrix_b = parse_alignment(data_b, unique_ids=False)
+    return compare(headers_a, matrix_a, headers_b, matrix_b)
+
+
+def compare_files(path_a, path_b):
+    """compare() de dos archivos FASTA alineados, leídos con mmap"""
+    data_a, data_b = map_file(path_a), map_file(path_b)
+    try:
+        return compare_fasta(data_a, data_b)
+    finally:
+        for data in (data_a, data_b):
+            if isinstance(data, mmap.mmap):
+                data.close()
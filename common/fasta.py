@@ -0,0 +1,156 @@
+import hashlib
+import mmap
+import os
+import re
+from collections import namedtuple
+
+import numpy as np
+
+# Códigos del alineamiento codificado: cada residuo es su byte ASCII
+GAP = ord('-')
+PAD = 0  # relleno cuando las secuencias no tienen la misma longitud
+
+# Residuos aceptados: letras IUPAC (mayúsculas o minúsculas), gaps y stop
+ALPHABET = bytes(range(ord('A'), ord('Z') + 1)) + bytes(range(ord('a'), ord('z') + 1)) + b"-.*"
+WHITESPACE = b" \t\r\n\v\f"
+# Primer byte que no es espacio (re busca sobre el mmap sin copiarlo)
+CONTENT = re.compile(rb"[^ \t\r\n\v\f]")
+
+FastaStats = namedtuple("FastaStats", ["sequences", "residues", "max_length", "digest"])
+
+
+class FastaError(ValueError):
+    """FASTA mal formado: se rechaza antes de lanzar ningún alineador"""
+
+
+class FastaTooLarge(FastaError):
+    """FASTA válido pero fuera de los límites configurados"""
+
+
+def iter_fasta(data, check_alphabet=True, unique_ids=True):
+    """Recorre un FASTA en memoria (bytes o mmap) y genera (cabecera, secuencia).
+
+    La cabecera es texto sin el '>' y la secuencia son bytes sin espacios ni
+    saltos de línea (acepta secuencias partidas en varias líneas y CRLF).
+    Los registros se localizan con búsquedas de bytes, sin dividir el texto
+    en líneas, así que un mmap se recorre sin cargarlo entero.
+    """
+    start = data.find(b">")
+    if start == -1:
+        if CONTENT.search(data):
+            raise FastaError("El archivo no contiene cabeceras FASTA ('>')")
+        return
+    if CONTENT.search(data, 0, start):
+        raise FastaError("Hay contenido antes de la primera cabecera")
+
+    seen = set()
+    size = len(data)
+    while start != -1:
+        eol = data.find(b"\n", start)
+        if eol == -1:
+            eol = size
+        header = data[start + 1:eol].strip().decode("utf-8", "replace")
+        if not header:
+            raise FastaError("Cabecera vacía")
+
+        nxt = data.find(b"\n>", eol)
+        end = size if nxt == -1 else nxt
+        sequence = data[eol:end].translate(None, WHITESPACE)
+
+        if check_alphabet:
+            invalid = sequence.translate(None, ALPHABET)
+            if invalid:
+                raise FastaError(f"Carácter no válido {chr(invalid[0])!r} en la secuencia '{header}'")
+        if unique_ids:
+            seq_id = header.split()[0]
+            if seq_id in seen:
+                raise FastaError(f"Nombre de secuencia duplicado: '{seq_id}'")
+            seen.add(seq_id)
+
+        yield header, sequence
+        start = -1 if nxt == -1 else nxt + 1
+
+
+def map_file(path):
+    """Contenido de un archivo como mmap de solo lectura (b"" si está vacío)"""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def read_fasta(path):
+    """Lista de (cabecera, secuencia) de un archivo FASTA"""
+    data = map_file(path)
+    try:
+        return list(iter_fasta(data))
+    finally:
+        if isinstance(data, mmap.mmap):
+            data.close()
+
+
+def scan_fasta(path, max_sequences=None, max_residues=None, max_length=None, max_bytes=None):
+    """Valida un FASTA sin cargarlo en memoria y devuelve sus FastaStats.
+
+    Corta en el primer error o en cuanto se supera un límite. `digest` es el
+    hash del FASTA normalizado (cabeceras y residuos, sin el formato de
+    líneas), que sirve como clave de caché.
+    """
+    size = os.path.getsize(path)
+    if max_bytes is not None and size > max_bytes:
+        raise FastaTooLarge(f"El archivo ocupa {size} bytes (máximo {max_bytes})")
+
+    digest = hashlib.sha256()
+    sequences = residues = longest = 0
+    data = map_file(path)
+    try:
+        for header, sequence in iter_fasta(data):
+            if not sequence:
+                raise FastaError(f"La secuencia '{header}' está vacía")
+            sequences += 1
+            residues += len(sequence)
+            longest = max(longest, len(sequence))
+            if max_sequences is not None and sequences > max_sequences:
+                raise FastaTooLarge(f"Demasiadas secuencias (máximo {max_sequences})")
+            if max_residues is not None and residues > max_residues:
+                raise FastaTooLarge(f"Demasiados residuos en total (máximo {max_residues})")
+            if max_length is not None and len(sequence) > max_length:
+                raise FastaTooLarge(
+                    f"La secuencia '{header}' tiene {len(sequence)} residuos (máximo {max_length})"
+                )
+            digest.update(b">" + header.encode() + b"\n" + sequence + b"\n")
+    finally:
+        if isinstance(data, mmap.mmap):
+            data.close()
+
+    if sequences == 0:
+        raise FastaError("El archivo no contiene secuencias")
+    return FastaStats(sequences, residues, longest, digest.hexdigest())
+
+
+def encode_sequences(sequences):
+    """Codifica una lista de secuencias (bytes o str) como matriz uint8 (N x L).
+
+    Las secuencias más cortas se rellenan con PAD, que no cuenta ni como
+    residuo ni como gap.
+    """
+    if not sequences:
+        return np.zeros((0, 0), dtype=np.uint8)
+    raw = [s if isinstance(s, bytes) else s.encode("ascii", "replace") for s in sequences]
+    length = max(len(r) for r in raw)
+    if all(len(r) == length for r in raw):
+        return np.frombuffer(b"".join(raw), dtype=np.uint8).reshape(len(raw), length).copy()
+
+    matrix = np.full((len(raw), length), PAD, dtype=np.uint8)
+    for i, r in enumerate(raw):
+        matrix[i, :len(r)] = np.frombuffer(r, dtype=np.uint8)
+    return matrix
+
+
+def parse_alignment(data, unique_ids=True):
+    """Parsea un alineamiento FASTA directamente a (cabeceras, matriz uint8)"""
+    headers, sequences = [], []
+    for header, sequence in iter_fasta(data, unique_ids=unique_ids):
+        headers.append(header)
+        sequences.append(sequence)
+    return headers, encode_sequences(sequences)
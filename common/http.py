@@ -0,0 +1,69 @@
+import os
+from urllib.parse import urljoin
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Timeouts por defecto (segundos): conectar debe ser casi inmediato dentro de
+# la red de docker-compose; la lectura cubre respuestas lentas pero acotadas
+CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", "3"))
+READ_TIMEOUT = float(os.environ.get("HTTP_READ_TIMEOUT", "30"))
+
+# Reintentos con backoff exponencial (0.5s, 1s, 2s...) ante errores de conexión
+# y respuestas 502/503/504. Solo para métodos idempotentes: un POST repetido
+# podría duplicar lo que ya se guardó.
+RETRIES = int(os.environ.get("HTTP_RETRIES", "3"))
+BACKOFF = float(os.environ.get("HTTP_BACKOFF", "0.5"))
+RETRY_STATUS = (502, 503, 504)
+
+# Conexiones keep-alive que se conservan por host (una por hilo concurrente)
+POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", "32"))
+
+
+def retry_policy(retries=RETRIES, backoff=BACKOFF, methods=Retry.DEFAULT_ALLOWED_METHODS):
+    return Retry(
+        total=retries, connect=retries, read=retries, status=retries,
+        backoff_factor=backoff, status_forcelist=RETRY_STATUS,
+        allowed_methods=frozenset(methods), respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+
+
+class Client:
+    """Cliente HTTP de un servicio: URL base, sesión con pool de conexiones
+    keep-alive, timeouts acotados y reintentos con backoff.
+
+    Una instancia se comparte entre hilos (el pool de urllib3 es seguro entre
+    hilos); no usa cookies. Los métodos aceptan los mismos argumentos que
+    `requests` y rutas relativas a `base_url`.
+    """
+
+    def __init__(self, base_url, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT),
+                 retries=RETRIES, backoff=BACKOFF, pool_size=POOL_SIZE):
+        self.base_url = base_url.rstrip("/") + "/"
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size,
+                              max_retries=retry_policy(retries, backoff))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def url(self, path):
+        return urljoin(self.base_url, path.lstrip("/"))
+
+    def request(self, method, path, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.request(method, self.url(path), **kwargs)
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    def put(self, path, **kwargs):
+        return self.request("PUT", path, **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.request("DELETE", path, **kwargs)
@@ -0,0 +1,223 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Buckets por defecto (segundos): de peticiones rápidas a alineamientos largos
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+# Buckets de memoria (bytes): 16 MB .. 16 GB
+MEMORY_BUCKETS = tuple(16 * 1024 ** 2 * 2 ** i for i in range(11))
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in list(zip(names, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Métrica con etiquetas; cada combinación de valores es una serie"""
+
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: etiquetas {sorted(labels)} != {sorted(self.labelnames)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def samples(self):
+        """Lista de (sufijo, etiquetas extra, valores de etiquetas, valor)"""
+        with self._lock:
+            return [("", (), key, value) for key, value in self._series.items()]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, extra, key, value in self.samples():
+            labels = _format_labels(self.labelnames, key, extra)
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """Valor instantáneo. Con `callback` se calcula al exportar: debe devolver
+    un número (sin etiquetas) o un dict {tupla de valores de etiquetas: número}."""
+
+    kind = "gauge"
+
+    def __init__(self, name, help, labels=(), callback=None):
+        super().__init__(name, help, labels)
+        self.callback = callback
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = value
+
+    def samples(self):
+        if self.callback is None:
+            return super().samples()
+        try:
+            values = self.callback()
+        except Exception:
+            # Una fuente caída (p. ej. la DB) no debe romper todo /metrics
+            return []
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [("", (), tuple(str(v) for v in key), value) for key, value in values.items()]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            snapshot = [(key, list(counts), total, count)
+                        for key, (counts, total, count) in self._series.items()]
+        samples = []
+        for key, counts, total, count in snapshot:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                samples.append(("_bucket", (("le", _format_value(float(bound))),), key, cumulative))
+            samples.append(("_sum", (), key, total))
+            samples.append(("_count", (), key, count))
+        return samples
+
+
+class Registry:
+    """Conjunto de métricas de un servicio, exportadas en formato Prometheus"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=(), callback=None):
+        return self.register(Gauge(name, help, labels, callback))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def render(self):
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+
+def instrument_flask(app, registry, prefix):
+    """Histograma de latencia por ruta, método y código de estado.
+
+    En respuestas en streaming mide hasta que se empieza a enviar el cuerpo.
+    """
+    from flask import g, request
+
+    latency = registry.histogram(
+        f"{prefix}_http_request_duration_seconds", "Latencia de las peticiones HTTP",
+        ("method", "endpoint", "status")
+    )
+
+    @app.before_request
+    def _start_timer():
+        g._request_started = time.perf_counter()
+
+    @app.after_request
+    def _observe_latency(response):
+        started = g.pop("_request_started", None)
+        if started is not None:
+            latency.observe(time.perf_counter() - started, method=request.method,
+                            endpoint=request.endpoint or "unknown", status=response.status_code)
+        return response
+
+    return latency
+
+
+class StageTimer:
+    """Tiempos por etapa (span) de una operación.
+
+    Cada etapa se acumula en `stages` (para devolverla con el resultado) y,
+    si se pasa un histograma con etiqueta `stage`, también se observa en él.
+    """
+
+    def __init__(self, histogram=None):
+        self.histogram = histogram
+        self.stages = {}
+        self._open = {}
+
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+        if self.histogram is not None:
+            self.histogram.observe(seconds, stage=name)
+
+    def begin(self, name):
+        """Abre una etapa que se cerrará con end() (p. ej. desde otro hilo)"""
+        self._open[name] = time.perf_counter()
+
+    def end(self, name):
+        """Cierra una etapa abierta con begin(); si no lo está, no hace nada"""
+        start = self._open.pop(name, None)
+        if start is not None:
+            self.add(name, time.perf_counter() - start)
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def to_dict(self):
+        return {name: round(seconds, 6) for name, seconds in self.stages.items()}
@@ -0,0 +1,67 @@
+"""Formato binario de alineamiento (application/x-msa).
+
+    cabecera (HEADER, little-endian, 36 bytes)
+        magic b"MSA1", versión, reservado,
+        filas y columnas de la matriz,
+        fila y columna de inicio dentro del alineamiento completo,
+        filas y columnas del alineamiento completo,
+        bytes del índice de nombres
+    índice de nombres: cabeceras FASTA en UTF-8 separadas por "\\n"
+    matriz: filas x columnas uint8 (un byte ASCII por residuo, GAP para los
+        gaps y PAD para el relleno de filas cortas), por filas
+
+Sirve tanto para un alineamiento completo como para una ventana (rango de
+columnas y subconjunto de filas) que la DB extrae de sus teselas: la
+cabecera indica qué parte del alineamiento completo contiene.
+"""
+import struct
+from collections import namedtuple
+
+import numpy as np
+
+MAGIC = b"MSA1"
+VERSION = 1
+HEADER = struct.Struct("<4sHH7I")
+CONTENT_TYPE = "application/x-msa"
+
+MsaWindow = namedtuple("MsaWindow", [
+    "names", "matrix", "row_start", "col_start", "total_rows", "total_cols",
+])
+
+
+class MsaFormatError(ValueError):
+    pass
+
+
+def pack(names, matrix, row_start=0, col_start=0, total_rows=None, total_cols=None):
+    """Serializa nombres + matriz (una ventana o el alineamiento completo)"""
+    matrix = np.ascontiguousarray(matrix, dtype=np.uint8)
+    n_rows, n_cols = matrix.shape
+    if len(names) != n_rows:
+        raise MsaFormatError(f"{len(names)} nombres para {n_rows} filas")
+    index = "\n".join(names).encode()
+    header = HEADER.pack(
+        MAGIC, VERSION, 0, n_rows, n_cols, row_start, col_start,
+        n_rows if total_rows is None else total_rows,
+        n_cols if total_cols is None else total_cols,
+        len(index),
+    )
+    return b"".join([header, index, matrix.tobytes()])
+
+
+def unpack(buffer):
+    """MsaWindow sobre `buffer` (bytes o memoryview) sin copiar la matriz"""
+    if len(buffer) < HEADER.size:
+        raise MsaFormatError("Cabecera incompleta")
+    (magic, version, _, n_rows, n_cols, row_start, col_start,
+     total_rows, total_cols, names_size) = HEADER.unpack_from(buffer)
+    if magic != MAGIC or version != VERSION:
+        raise MsaFormatError(f"Formato desconocido: {magic!r} v{version}")
+
+    offset = HEADER.size + names_size
+    if len(buffer) < offset + n_rows * n_cols:
+        raise MsaFormatError("Matriz incompleta")
+    names = bytes(buffer[HEADER.size:offset]).decode().split("\n") if n_rows else []
+    matrix = np.frombuffer(buffer, dtype=np.uint8, count=n_rows * n_cols, offset=offset)
+    return MsaWindow(names, matrix.reshape(n_rows, n_cols), row_start, col_start,
+                     total_rows, total_cols)
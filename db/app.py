@@ -1,14 +1,211 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g, Response
 import sqlite3
+import functools
+import os
+import queue
+import re
+import time
+from contextlib import contextmanager
 from datetime import datetime
+from storage import (init_blobs, put_blob, put_blob_stream, get_blob, iter_blob, blob_size,
+                     blob_exists, delete_unreferenced, init_matrices, ensure_matrix, matrix_shape,
+                     matrix_info, read_window, delete_matrices, init_summaries, put_summary,
+                     ensure_summary, get_summary, init_comparisons, put_comparison,
+                     ensure_comparison, get_comparison)
+from common.fasta import FastaError
+from common.metrics import CONTENT_TYPE, Registry, instrument_flask
+from common.msa import CONTENT_TYPE as MSA_CONTENT_TYPE, pack
 
 app = Flask(__name__)
-DB_PATH = "alignments.db"
+DB_PATH = os.environ.get("DB_PATH", "alignments.db")
+
+# Conexiones SQLite
+POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "8"))  # conexiones inactivas que se conservan
+BUSY_TIMEOUT = float(os.environ.get("DB_BUSY_TIMEOUT", "10"))  # segundos esperando un bloqueo
+STATEMENT_CACHE = 256  # sentencias preparadas que guarda cada conexión
+
+# Paginación del historial
+LIST_DEFAULT_LIMIT = 20
+LIST_MAX_LIMIT = 200
+
+# Límite de la caché de resultados (bytes de texto almacenados)
+CACHE_MAX_BYTES = int(os.environ.get("CACHE_MAX_BYTES", 512 * 1024 * 1024))
+
+# Métricas (GET /metrics, formato Prometheus)
+metrics = Registry()
+instrument_flask(app, metrics, "db")
+QUERY_SECONDS = metrics.histogram(
+    "db_sqlite_query_seconds", "Duración de las sentencias SQLite", ("operation", "table")
+)
+CONNECTIONS_OPENED = metrics.counter(
+    "db_sqlite_connections_opened_total", "Conexiones SQLite abiertas"
+)
+
+TABLE_PATTERN = re.compile(r"\b(?:FROM|INTO|UPDATE|TABLE(?: IF NOT EXISTS)?)\s+(\w+)", re.IGNORECASE)
+
+
+@functools.lru_cache(maxsize=1024)
+def statement_labels(sql):
+    """Etiquetas de una sentencia: operación (SELECT, INSERT...) y tabla principal"""
+    words = sql.split(None, 1)
+    table = TABLE_PATTERN.search(sql)
+    return {
+        "operation": words[0].upper() if words else "",
+        "table": table.group(1) if table else "",
+    }
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor que mide cada sentencia en db_sqlite_query_seconds"""
+
+    def execute(self, sql, parameters=()):
+        with QUERY_SECONDS.time(**statement_labels(sql)):
+            return super().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        with QUERY_SECONDS.time(**statement_labels(sql)):
+            return super().executemany(sql, seq_of_parameters)
+
+
+class TimedConnection(sqlite3.Connection):
+    """Conexión cuyos cursores (y commits) se miden"""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def commit(self):
+        with QUERY_SECONDS.time(operation="COMMIT", table=""):
+            super().commit()
+
+
+def connect():
+    """Abre una conexión configurada para acceso concurrente.
+
+    WAL permite lectores simultáneos a un escritor y synchronous=NORMAL es
+    seguro con WAL (solo se arriesga la última transacción ante un corte de
+    luz). Cada conexión guarda en caché sus sentencias preparadas, así que al
+    reutilizarla entre peticiones no se vuelven a compilar.
+    """
+    conn = sqlite3.connect(DB_PATH, timeout=BUSY_TIMEOUT, check_same_thread=False,
+                           cached_statements=STATEMENT_CACHE, factory=TimedConnection)
+    CONNECTIONS_OPENED.inc()
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={int(BUSY_TIMEOUT * 1000)}")
+    return conn
+
+
+class ConnectionPool:
+    """Pool de conexiones persistentes.
+
+    Cada petición toma una conexión (en exclusiva) y la devuelve al terminar;
+    se conservan hasta `size` conexiones inactivas para la siguiente petición.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._idle = queue.LifoQueue()
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return connect()
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        if self._idle.qsize() < self.size:
+            self._idle.put(conn)
+        else:
+            conn.close()
+
+    def close_all(self):
+        """Cierra las conexiones inactivas. Una conexión SQLite no debe
+        cruzar un fork(): gunicorn lo llama en el maestro antes de crear
+        cada worker (ver gunicorn.conf.py)."""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+pool = ConnectionPool(POOL_SIZE)
+metrics.gauge("db_pool_idle_connections", "Conexiones inactivas en el pool",
+              callback=lambda: pool._idle.qsize())
+
+
+def get_db():
+    """Conexión de la petición actual (tomada del pool)"""
+    if "db" not in g:
+        g.db = pool.acquire()
+    return g.db
+
+
+@app.teardown_appcontext
+def release_db(exc):
+    conn = g.pop("db", None)
+    if conn is not None:
+        pool.release(conn)
+
+
+@contextmanager
+def pooled_connection():
+    """Conexión del pool fuera de una petición (p. ej. al exportar métricas)"""
+    conn = pool.acquire()
+    try:
+        yield conn
+    finally:
+        pool.release(conn)
+
+
+# Columnas que apuntan a la tabla blobs
+BLOB_REFERENCES = [
+    ("alignments", "muscle_blob"), ("alignments", "msa_blob"),
+    ("result_cache", "muscle_blob"), ("result_cache", "msa_blob"),
+]
+
+
+def table_columns(cursor, table):
+    cursor.execute(f"PRAGMA table_info({table})")
+    return {row[1] for row in cursor.fetchall()}
+
+
+def migrate_alignment_blobs(conn, batch_size=100):
+    """Mueve el texto plano de filas antiguas a blobs comprimidos.
+
+    Devuelve (filas migradas, bytes de texto liberados).
+    """
+    cursor = conn.cursor()
+    migrated = freed = 0
+    while True:
+        cursor.execute(
+            "SELECT id, muscle_content, msa_content FROM alignments "
+            "WHERE muscle_blob IS NULL AND (muscle_content IS NOT NULL OR msa_content IS NOT NULL) "
+            "LIMIT ?", (batch_size,)
+        )
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        for aln_id, muscle, msa in rows:
+            cursor.execute(
+                "UPDATE alignments SET muscle_blob=?, msa_blob=?, muscle_content=NULL, msa_content=NULL "
+                "WHERE id=?",
+                (put_blob(cursor, muscle or ""), put_blob(cursor, msa), aln_id)
+            )
+            freed += len((muscle or "").encode()) + len((msa or "").encode())
+        migrated += len(rows)
+        conn.commit()
+    return migrated, freed
 
 
 # Inicializar DB
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect()
     cursor = conn.cursor()
     cursor.execute('''CREATE TABLE IF NOT EXISTS alignments (
                         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -17,80 +214,554 @@ def init_db():
                         msa_content TEXT,
                         created_at TEXT
                     )''')
+    # muscle_content/msa_content quedan solo para filas antiguas: el contenido
+    # vive comprimido en la tabla blobs
+    columns = table_columns(cursor, "alignments")
+    for column in ("muscle_blob", "msa_blob", "save_key"):
+        if column not in columns:
+            cursor.execute(f"ALTER TABLE alignments ADD COLUMN {column} TEXT")
+    # Índices para filtrar el historial sin recorrer toda la tabla
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_alignments_filename ON alignments (filename, id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_alignments_created ON alignments (created_at, id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_alignments_muscle_blob ON alignments (muscle_blob)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_alignments_msa_blob ON alignments (msa_blob)")
+    # Clave de idempotencia de los guardados reintentados (NULL en los demás)
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_alignments_save_key ON alignments (save_key)")
+    init_blobs(cursor)
+    # Las matrices de filas antiguas se construyen al pedirlas por primera vez
+    init_matrices(cursor)
+    # Igual con los resúmenes: los nuevos llegan calculados desde el backend
+    init_summaries(cursor)
+    init_comparisons(cursor)
+
+    # La caché guardaba texto plano: al ser solo una caché se descarta
+    if "muscle_content" in table_columns(cursor, "result_cache"):
+        cursor.execute("DROP TABLE result_cache")
+    cursor.execute('''CREATE TABLE IF NOT EXISTS result_cache (
+                        key TEXT PRIMARY KEY,
+                        muscle_blob TEXT,
+                        msa_blob TEXT,
+                        size INTEGER,
+                        created_at TEXT,
+                        last_access REAL
+                    )''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_result_cache_access ON result_cache (last_access)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_result_cache_muscle_blob ON result_cache (muscle_blob)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_result_cache_msa_blob ON result_cache (msa_blob)")
+    cursor.execute('''CREATE TABLE IF NOT EXISTS cache_stats (
+                        name TEXT PRIMARY KEY,
+                        value INTEGER
+                    )''')
+    cursor.executemany("INSERT OR IGNORE INTO cache_stats (name, value) VALUES (?, 0)",
+                       [("hits",), ("misses",), ("evictions",)])
     conn.commit()
+
+    migrated, freed = migrate_alignment_blobs(conn)
+    if migrated:
+        # Recuperar en disco el espacio del texto plano
+        conn.execute("VACUUM")
+        print(f"🗜️ Migrados {migrated} alineamientos a blobs comprimidos ({freed} bytes de texto liberados)")
     conn.close()
 
 
 init_db()
 
+# Alineadores de cada fila: nombre en la API → columna con el hash de su blob
+ALIGNERS = {"muscle": "muscle_blob", "msa": "msa_blob"}
 
-@app.route("/save", methods=["POST"])
-def save_alignment():
-    """Guarda un alineamiento en la base de datos"""
-    data = request.get_json()
-    filename = data.get("filename")
-    muscle = data.get("muscle_content")
-    msa = data.get("msa_content")
 
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+def insert_alignment(cursor, data, created_at):
+    """Inserta un alineamiento (texto o hashes de blobs) y devuelve su id.
+
+    Con `save_key` el guardado es idempotente: si ya se insertó uno con esa
+    clave (un reintento) se devuelve su id sin duplicarlo. `created_at` del
+    propio alineamiento tiene prioridad (guardados diferidos). `summaries`
+    ({alineador: resumen}) y `comparison` (MUSCLE frente a MSAligner) llegan
+    ya calculados por el backend; lo que falte se calcula aquí, salvo con
+    `defer_analysis` (alineamientos grandes), que lo deja para la primera
+    vez que se pida en /get/<id>/summary o /get/<id>/comparison.
+    Lanza LookupError si referencia un blob que no existe.
+    """
+    save_key = data.get("save_key")
+    if save_key is not None:
+        cursor.execute("SELECT id FROM alignments WHERE save_key=?", (save_key,))
+        row = cursor.fetchone()
+        if row is not None:
+            return row[0]
+
+    muscle_blob = data.get("muscle_blob") or put_blob(cursor, data.get("muscle_content"))
+    msa_blob = data.get("msa_blob") or put_blob(cursor, data.get("msa_content"))
+    for digest in (muscle_blob, msa_blob):
+        if digest is not None and not blob_exists(cursor, digest):
+            raise LookupError(f"Blob desconocido: {digest}")
+
     cursor.execute(
-        "INSERT INTO alignments (filename, muscle_content, msa_content, created_at) VALUES (?, ?, ?, ?)",
-        (filename, muscle, msa, datetime.now().isoformat())
+        "INSERT INTO alignments (filename, muscle_blob, msa_blob, created_at, save_key) "
+        "VALUES (?, ?, ?, ?, ?)",
+        (data.get("filename"), muscle_blob, msa_blob, data.get("created_at") or created_at, save_key)
     )
+    aln_id = cursor.lastrowid
+
+    # Matriz en teselas para servir ventanas (/get/<id>/window) sin el FASTA
+    # completo, y resumen para el historial y las métricas (/get/<id>/summary)
+    summaries = data.get("summaries") or {}
+    defer = bool(data.get("defer_analysis"))
+    for aligner, digest in zip(ALIGNERS, (muscle_blob, msa_blob)):
+        if digest is None:
+            continue
+        try:
+            ensure_matrix(cursor, digest)
+            if summaries.get(aligner):
+                put_summary(cursor, digest, summaries[aligner])
+            elif not defer:
+                ensure_summary(cursor, digest)
+        except (KeyError, TypeError, ValueError) as e:
+            # FastaError es un ValueError: contenido que no es un alineamiento
+            print(f"⚠️ Alineamiento {aln_id} ({aligner}) sin matriz o resumen: {e}")
+    if muscle_blob is not None and msa_blob is not None:
+        try:
+            if data.get("comparison"):
+                put_comparison(cursor, muscle_blob, msa_blob, data["comparison"])
+            elif not defer:
+                ensure_comparison(cursor, muscle_blob, msa_blob)
+        except (KeyError, TypeError, ValueError) as e:
+            print(f"⚠️ Alineamiento {aln_id} sin comparación: {e}")
+    return aln_id
+
+
+@app.route("/save", methods=["POST"])
+def save_alignment():
+    """Guarda un alineamiento en la base de datos.
+
+    Acepta el contenido como texto (`muscle_content`/`msa_content`) o como
+    hashes de blobs ya subidos con POST /blobs (`muscle_blob`/`msa_blob`).
+    """
+    conn = get_db()
+    try:
+        insert_alignment(conn.cursor(), request.get_json(), datetime.now().isoformat())
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 400
     conn.commit()
-    conn.close()
 
     return jsonify({"status": "saved"})
 
 
+@app.route("/save_bulk", methods=["POST"])
+def save_alignments_bulk():
+    """Guarda una lista de alineamientos (`items`, mismo formato que /save)
+    en una sola transacción: o se guardan todos o ninguno."""
+    items = request.get_json().get("items") or []
+    created_at = datetime.now().isoformat()
+
+    conn = get_db()
+    cursor = conn.cursor()
+    try:
+        ids = [insert_alignment(cursor, item, created_at) for item in items]
+    except LookupError as e:
+        conn.rollback()
+        return jsonify({"error": str(e)}), 400
+    conn.commit()
+
+    return jsonify({"status": "saved", "count": len(ids), "ids": ids})
+
+
+@app.route("/blobs", methods=["POST"])
+def upload_blob():
+    """Sube un contenido en streaming (cuerpo crudo) y devuelve su hash"""
+    conn = get_db()
+    cursor = conn.cursor()
+    digest = put_blob_stream(cursor, request.stream)
+    conn.commit()
+    return jsonify({"hash": digest})
+
+
+@app.route("/blobs/<digest>", methods=["GET"])
+def download_blob(digest):
+    """Devuelve un contenido descomprimiéndolo por trozos"""
+    chunks = iter_blob(get_db().cursor(), digest)
+    if chunks is None:
+        return jsonify({"error": "Not found"}), 404
+    return Response(chunks, mimetype="text/plain")
+
+
 @app.route("/list", methods=["GET"])
 def list_alignments():
-    """Devuelve historial resumido de alineamientos"""
-    conn = sqlite3.connect(DB_PATH)
+    """Devuelve una página del historial resumido de alineamientos.
+
+    Paginación por cursor (keyset): `cursor` es el id del último elemento de
+    la página anterior, así que cada página cuesta lo mismo sin importar el
+    tamaño de la tabla. Filtros opcionales: `prefix` (inicio del filename),
+    `since` / `until` (rango ISO de created_at, `until` exclusivo).
+    """
+    try:
+        limit = min(max(int(request.args.get("limit", LIST_DEFAULT_LIMIT)), 1), LIST_MAX_LIMIT)
+        cursor_id = int(request.args["cursor"]) if request.args.get("cursor") else None
+    except ValueError:
+        return jsonify({"error": "Parámetros de paginación inválidos"}), 400
+
+    where, params = [], []
+    if cursor_id is not None:
+        where.append("id < ?")
+        params.append(cursor_id)
+    prefix = request.args.get("prefix")
+    if prefix:
+        # Rango en lugar de LIKE para que SQLite use el índice de filename
+        where.append("filename >= ? AND filename < ?")
+        params += [prefix, prefix + "\U0010ffff"]
+    if request.args.get("since"):
+        where.append("created_at >= ?")
+        params.append(request.args["since"])
+    if request.args.get("until"):
+        where.append("created_at < ?")
+        params.append(request.args["until"])
+
+    # Dimensiones del alineamiento de MUSCLE desde su resumen y acuerdo entre
+    # alineadores desde su comparación (si ya existen)
+    sql = ("SELECT id, filename, created_at, sequences, length, sp_symmetric FROM alignments "
+           "LEFT JOIN summaries ON summaries.hash = alignments.muscle_blob "
+           "LEFT JOIN comparisons ON comparisons.hash_a = alignments.muscle_blob "
+           "AND comparisons.hash_b = alignments.msa_blob")
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY id DESC LIMIT ?"
+    params.append(limit + 1)
+
+    conn = get_db()
     cursor = conn.cursor()
-    cursor.execute("SELECT id, filename, created_at FROM alignments ORDER BY id DESC")
+    cursor.execute(sql, params)
     rows = cursor.fetchall()
-    conn.close()
 
-    return jsonify([
-        {"id": r[0], "filename": r[1], "created_at": r[2]}
-        for r in rows
-    ])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return jsonify({
+        "items": [
+            {"id": r[0], "filename": r[1], "created_at": r[2], "sequences": r[3], "length": r[4],
+             "agreement": r[5]}
+            for r in rows
+        ],
+        "next_cursor": rows[-1][0] if has_more else None
+    })
 
 
 @app.route("/get/<int:aln_id>", methods=["GET"])
 def get_alignment(aln_id):
     """Devuelve un alineamiento específico con todo su contenido"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_db()
     cursor = conn.cursor()
-    cursor.execute("SELECT id, filename, muscle_content, msa_content, created_at FROM alignments WHERE id=?", (aln_id,))
+    cursor.execute(
+        "SELECT id, filename, muscle_content, msa_content, created_at, muscle_blob, msa_blob "
+        "FROM alignments WHERE id=?", (aln_id,)
+    )
     row = cursor.fetchone()
-    conn.close()
 
     if row:
         return jsonify({
             "id": row[0],
             "filename": row[1],
-            "muscle_content": row[2],
-            "msa_content": row[3],
+            "muscle_content": row[2] if row[5] is None else get_blob(cursor, row[5]),
+            "msa_content": row[3] if row[6] is None else get_blob(cursor, row[6]),
             "created_at": row[4]
         })
     else:
         return jsonify({"error": "Not found"}), 404
 
-@app.route("/get/<int:alignment_id>", methods=["GET"])
-def get_alignment_db(alignment_id):
-    conn = sqlite3.connect("alignments.db")
+def alignment_blob(cursor, aln_id, aligner):
+    """Hash del blob FASTA de un alineador, o None si no existe"""
+    cursor.execute(f"SELECT {ALIGNERS[aligner]} FROM alignments WHERE id=?", (aln_id,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def alignment_matrix(conn, aln_id, aligner):
+    """Hash del blob con su matriz ya construida (la crea la primera vez en
+    filas guardadas antes de existir las matrices). Lanza LookupError si no
+    existe y FastaError si el contenido no es un alineamiento."""
+    cursor = conn.cursor()
+    digest = alignment_blob(cursor, aln_id, aligner)
+    if digest is None or not ensure_matrix(cursor, digest):
+        raise LookupError("Not found")
+    if conn.in_transaction:
+        conn.commit()
+    return digest
+
+
+def parse_range(name, default, low, high):
+    value = request.args.get(name, type=int)
+    return default if value is None else min(max(value, low), high)
+
+
+@app.route("/get/<int:aln_id>/info", methods=["GET"])
+def get_alignment_info(aln_id):
+    """Dimensiones, nombres y longitudes sin gaps de cada alineador (sin la
+    matriz): lo necesario para pedir después solo ventanas"""
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute("SELECT filename, created_at FROM alignments WHERE id=?", (aln_id,))
+    row = cursor.fetchone()
+    if row is None:
+        return jsonify({"error": "Not found"}), 404
+
+    alignments = {}
+    for aligner in ALIGNERS:
+        try:
+            digest = alignment_matrix(conn, aln_id, aligner)
+            alignments[aligner] = {"hash": digest, **matrix_info(cursor, digest)}
+        except (LookupError, FastaError) as e:
+            alignments[aligner] = {"error": str(e)}
+    return jsonify({"id": aln_id, "filename": row[0], "created_at": row[1], "alignments": alignments})
+
+
+@app.route("/get/<int:aln_id>/summary", methods=["GET"])
+def get_alignment_summary(aln_id):
+    """Resumen de cada alineador: dimensiones, fracción de gaps, perfil de
+    conservación y matriz de identidad (se omite con `identity=0`). Se
+    calcula la primera vez en filas guardadas antes de existir los resúmenes."""
+    identity = request.args.get("identity", "1") != "0"
+    conn = get_db()
     cursor = conn.cursor()
-    cursor.execute("SELECT id, name, data FROM alignments WHERE id=?", (alignment_id,))
+    cursor.execute("SELECT filename, created_at FROM alignments WHERE id=?", (aln_id,))
+    row = cursor.fetchone()
+    if row is None:
+        return jsonify({"error": "Not found"}), 404
+
+    summaries = {}
+    for aligner in ALIGNERS:
+        try:
+            digest = alignment_blob(cursor, aln_id, aligner)
+            if digest is None or not ensure_summary(cursor, digest):
+                raise LookupError("Not found")
+            summaries[aligner] = {"hash": digest, **get_summary(cursor, digest, identity)}
+        except (LookupError, FastaError) as e:
+            summaries[aligner] = {"error": str(e)}
+    if conn.in_transaction:
+        conn.commit()
+    return jsonify({"id": aln_id, "filename": row[0], "created_at": row[1], "summaries": summaries})
+
+
+@app.route("/get/<int:aln_id>/comparison", methods=["GET"])
+def get_alignment_comparison(aln_id):
+    """Comparación de MUSCLE (referencia, `a`) con MSAligner (`b`): SP y TC
+    en ambos sentidos, divergencia por secuencia y desacuerdo por columna y
+    por tramo (ver common.analysis.compare). Se calcula la primera vez en
+    filas guardadas antes de existir las comparaciones."""
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute("SELECT filename, created_at, muscle_blob, msa_blob FROM alignments WHERE id=?",
+                   (aln_id,))
+    row = cursor.fetchone()
+    if row is None or row[2] is None or row[3] is None:
+        return jsonify({"error": "Not found"}), 404
+    try:
+        if not ensure_comparison(cursor, row[2], row[3]):
+            return jsonify({"error": "Not found"}), 404
+    except FastaError as e:
+        return jsonify({"error": f"No es un alineamiento válido: {e}"}), 422
+    if conn.in_transaction:
+        conn.commit()
+    return jsonify({"id": aln_id, "filename": row[0], "created_at": row[1],
+                    "a": "muscle", "b": "msa", **get_comparison(cursor, row[2], row[3])})
+
+
+@app.route("/get/<int:aln_id>/window", methods=["GET"])
+def get_alignment_window(aln_id):
+    """Ventana de un alineamiento en formato binario (common.msa).
+
+    `aligner` (muscle | msa), columnas `start`..`end` (0-based, `end`
+    exclusivo) y filas `row_start`..`row_end` o una lista `rows=3,7,12`.
+    Sin parámetros devuelve el alineamiento completo.
+    """
+    aligner = request.args.get("aligner", "muscle")
+    if aligner not in ALIGNERS:
+        return jsonify({"error": f"Alineador desconocido: {aligner}"}), 400
+    conn = get_db()
+    try:
+        digest = alignment_matrix(conn, aln_id, aligner)
+    except LookupError:
+        return jsonify({"error": "Not found"}), 404
+    except FastaError as e:
+        return jsonify({"error": f"No es un alineamiento válido: {e}"}), 422
+
+    cursor = conn.cursor()
+    n_rows, n_cols = matrix_shape(cursor, digest)
+    try:
+        start = parse_range("start", 0, 0, n_cols)
+        end = parse_range("end", n_cols, start, n_cols)
+        if request.args.get("rows"):
+            rows = [int(r) for r in request.args["rows"].split(",")]
+            if any(r < 0 or r >= n_rows for r in rows):
+                raise ValueError
+        else:
+            row_start = parse_range("row_start", 0, 0, n_rows)
+            rows = range(row_start, parse_range("row_end", n_rows, row_start, n_rows))
+    except ValueError:
+        return jsonify({"error": "Rango de filas o columnas inválido"}), 400
+
+    names, window = read_window(cursor, digest, rows, start, end)
+    body = pack(names, window, rows[0] if len(rows) else 0, start, n_rows, n_cols)
+    return Response(body, mimetype=MSA_CONTENT_TYPE)
+
+
+@app.route("/get/<int:aln_id>/fasta", methods=["GET"])
+def get_alignment_fasta(aln_id):
+    """FASTA de un alineador, descomprimido en streaming"""
+    aligner = request.args.get("aligner", "muscle")
+    if aligner not in ALIGNERS:
+        return jsonify({"error": f"Alineador desconocido: {aligner}"}), 400
+    cursor = get_db().cursor()
+    digest = alignment_blob(cursor, aln_id, aligner)
+    chunks = iter_blob(cursor, digest) if digest else None
+    if chunks is None:
+        return jsonify({"error": "Not found"}), 404
+    return Response(chunks, mimetype="text/plain")
+
+
+def bump_stat(cursor, name, amount=1):
+    cursor.execute("UPDATE cache_stats SET value = value + ? WHERE name=?", (amount, name))
+
+
+def evict_lru(cursor):
+    """Borra las entradas menos usadas hasta quedar bajo CACHE_MAX_BYTES"""
+    cursor.execute("SELECT COALESCE(SUM(size), 0) FROM result_cache")
+    excess = cursor.fetchone()[0] - CACHE_MAX_BYTES
+    if excess <= 0:
+        return
+
+    cursor.execute("SELECT key, size, muscle_blob, msa_blob FROM result_cache ORDER BY last_access ASC")
+    victims, digests = [], []
+    for key, size, muscle_blob, msa_blob in cursor.fetchall():
+        if excess <= 0:
+            break
+        victims.append((key,))
+        digests += [muscle_blob, msa_blob]
+        excess -= size
+    cursor.executemany("DELETE FROM result_cache WHERE key=?", victims)
+    delete_unreferenced(cursor, digests, BLOB_REFERENCES)
+    delete_matrices(cursor, digests)
+    bump_stat(cursor, "evictions", len(victims))
+
+
+def read_cache_stats(conn):
+    """Contadores de aciertos/fallos y ocupación de la caché"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT name, value FROM cache_stats")
+    stats = dict(cursor.fetchall())
+    cursor.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM result_cache")
+    stats["entries"], stats["bytes"] = cursor.fetchone()
+
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+    stats["max_bytes"] = CACHE_MAX_BYTES
+    return stats
+
+
+@app.route("/cache/stats", methods=["GET"])
+def cache_stats():
+    return jsonify(read_cache_stats(get_db()))
+
+
+def cache_metrics():
+    with pooled_connection() as conn:
+        return read_cache_stats(conn)
+
+
+metrics.gauge(
+    "db_result_cache_events", "Aciertos, fallos y desalojos acumulados de la caché", ("event",),
+    callback=lambda: {(event,): value for event, value in cache_metrics().items()
+                      if event in ("hits", "misses", "evictions")}
+)
+metrics.gauge("db_result_cache_hit_ratio", "Aciertos / consultas de la caché",
+              callback=lambda: cache_metrics()["hit_rate"])
+metrics.gauge("db_result_cache_bytes", "Bytes ocupados por la caché",
+              callback=lambda: cache_metrics()["bytes"])
+
+
+@app.route("/cache/<key>", methods=["GET"])
+def cache_get(key):
+    """Devuelve un resultado cacheado y lo marca como usado recientemente
+    (con ?refs=1 solo los hashes de sus blobs)"""
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute("SELECT muscle_blob, msa_blob FROM result_cache WHERE key=?", (key,))
     row = cursor.fetchone()
-    conn.close()
     if row:
-        return jsonify({"id": row[0], "name": row[1], "data": row[2]})
+        cursor.execute("UPDATE result_cache SET last_access=? WHERE key=?", (time.time(), key))
+    bump_stat(cursor, "hits" if row else "misses")
+    conn.commit()
+
+    if row and request.args.get("refs"):
+        # Solo las referencias: el cliente descarga los blobs en streaming
+        return jsonify({"muscle_blob": row[0], "msa_blob": row[1]})
+    if row:
+        return jsonify({"muscle_content": get_blob(cursor, row[0]), "msa_content": get_blob(cursor, row[1])})
     else:
-        return jsonify({"error": "Alineamiento no encontrado"}), 404
+        return jsonify({"error": "Not found"}), 404
+
+
+@app.route("/cache/<key>", methods=["PUT"])
+def cache_put(key):
+    """Guarda un resultado en la caché aplicando la expulsión LRU.
+
+    Igual que /save, acepta texto o hashes de blobs ya subidos.
+    """
+    data = request.get_json()
+    conn = get_db()
+    cursor = conn.cursor()
+    muscle_blob = data.get("muscle_blob") or put_blob(cursor, data.get("muscle_content"))
+    msa_blob = data.get("msa_blob") or put_blob(cursor, data.get("msa_content"))
+    for digest in (muscle_blob, msa_blob):
+        if not blob_exists(cursor, digest):
+            return jsonify({"error": f"Blob desconocido: {digest}"}), 400
+    # Se contabiliza el tamaño comprimido: es lo que ocupa en disco
+    size = blob_size(cursor, muscle_blob) + blob_size(cursor, msa_blob)
+    cursor.execute(
+        "INSERT OR REPLACE INTO result_cache (key, muscle_blob, msa_blob, size, created_at, last_access) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        (key, muscle_blob, msa_blob, size, datetime.now().isoformat(), time.time())
+    )
+    evict_lru(cursor)
+    conn.commit()
+
+    return jsonify({"status": "cached"})
+
+
+@app.route("/storage/stats", methods=["GET"])
+def storage_stats():
+    """Bytes ahorrados por compresión y deduplicación de blobs"""
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*), COALESCE(SUM(raw_size), 0), COALESCE(SUM(stored_size), 0) FROM blobs")
+    blobs, unique_bytes, stored_bytes = cursor.fetchone()
+    # Tamaño lógico: lo que ocuparía cada referencia guardada como texto plano
+    cursor.execute(
+        "SELECT COALESCE(SUM(b.raw_size), 0) FROM "
+        "(SELECT muscle_blob AS hash FROM alignments UNION ALL SELECT msa_blob FROM alignments) r "
+        "JOIN blobs b ON b.hash = r.hash"
+    )
+    logical_bytes = cursor.fetchone()[0]
+    cursor.execute(
+        "SELECT COALESCE(SUM(COALESCE(LENGTH(muscle_content), 0) + COALESCE(LENGTH(msa_content), 0)), 0) "
+        "FROM alignments"
+    )
+    legacy_bytes = cursor.fetchone()[0]
+
+    return jsonify({
+        "blobs": blobs,
+        "logical_bytes": logical_bytes,
+        "unique_bytes": unique_bytes,
+        "stored_bytes": stored_bytes,
+        "legacy_text_bytes": legacy_bytes,
+        "saved_by_dedup": logical_bytes - unique_bytes,
+        "saved_by_compression": unique_bytes - stored_bytes,
+        "saved_total": logical_bytes - stored_bytes,
+    })
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """Métricas en formato de texto de Prometheus"""
+    return Response(metrics.render(), content_type=CONTENT_TYPE)
 
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=6000)
+    # Servidor de desarrollo; en producción: gunicorn -c gunicorn.conf.py app:app
+    app.run(host="0.0.0.0", port=6000, threaded=True)
@@ -0,0 +1,30 @@
+# Configuración de gunicorn para el servicio db:
+#   gunicorn -c gunicorn.conf.py app:app
+import os
+
+chdir = os.path.dirname(os.path.abspath(__file__))
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:6000")
+
+# SQLite en WAL admite lectores concurrentes con un escritor (y busy_timeout
+# serializa las escrituras), así que varios procesos son seguros. Cada worker
+# exporta sus propias métricas en /metrics: con más de uno, cada scrape ve las
+# del proceso que responde.
+workers = int(os.environ.get("GUNICORN_WORKERS", "2"))
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", "8"))
+
+# init_db() (creación de tablas y migraciones) corre una sola vez, en el
+# maestro, en lugar de competir entre workers
+preload_app = True
+
+timeout = 60
+keepalive = 5
+graceful_timeout = int(os.environ.get("GRACEFUL_TIMEOUT", "30"))
+
+accesslog = "-"
+
+
+def pre_fork(server, worker):
+    # Ninguna conexión SQLite abierta en el maestro debe heredarse
+    from app import pool
+    pool.close_all()
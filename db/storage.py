@@ -0,0 +1,388 @@
+import hashlib
+import json
+import os
+import zlib
+
+import numpy as np
+
+from common.analysis import compare, summarize
+from common.fasta import GAP, PAD, parse_alignment
+
+# Nivel de compresión zlib: 6 es el equilibrio estándar velocidad/tamaño
+COMPRESSION_LEVEL = 6
+
+# Teselas de las matrices de alineamiento: cada una (filas x columnas) se
+# comprime por separado, así una ventana solo descomprime las que toca
+TILE_ROWS = int(os.environ.get("MATRIX_TILE_ROWS", "256"))
+TILE_COLS = int(os.environ.get("MATRIX_TILE_COLS", "1024"))
+
+
+def init_blobs(cursor):
+    cursor.execute('''CREATE TABLE IF NOT EXISTS blobs (
+                        hash TEXT PRIMARY KEY,
+                        codec TEXT,
+                        raw_size INTEGER,
+                        stored_size INTEGER,
+                        data BLOB
+                    )''')
+
+
+def put_blob(cursor, text):
+    """Guarda `text` comprimido y direccionado por contenido; devuelve su hash.
+
+    Si ya existe un blob con el mismo contenido no se vuelve a escribir.
+    """
+    if text is None:
+        return None
+    raw = text.encode()
+    digest = hashlib.sha256(raw).hexdigest()
+    cursor.execute("SELECT 1 FROM blobs WHERE hash=?", (digest,))
+    if cursor.fetchone() is None:
+        data = zlib.compress(raw, COMPRESSION_LEVEL)
+        cursor.execute(
+            "INSERT INTO blobs (hash, codec, raw_size, stored_size, data) VALUES (?, ?, ?, ?, ?)",
+            (digest, "zlib", len(raw), len(data), data)
+        )
+    return digest
+
+
+def get_blob_bytes(cursor, digest):
+    if digest is None:
+        return None
+    cursor.execute("SELECT codec, data FROM blobs WHERE hash=?", (digest,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    codec, data = row
+    if codec == "zlib":
+        data = zlib.decompress(data)
+    return data
+
+
+def get_blob(cursor, digest):
+    data = get_blob_bytes(cursor, digest)
+    return None if data is None else data.decode()
+
+
+def blob_size(cursor, digest):
+    cursor.execute("SELECT stored_size FROM blobs WHERE hash=?", (digest,))
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def delete_unreferenced(cursor, digests, references):
+    """Borra los blobs de `digests` que ya no aparecen en ninguna referencia.
+
+    `references` es una lista de (tabla, columna) que apuntan a blobs.
+    """
+    orphan_check = " AND ".join(
+        f"NOT EXISTS (SELECT 1 FROM {table} WHERE {column}=blobs.hash)"
+        for table, column in references
+    )
+    cursor.executemany(
+        f"DELETE FROM blobs WHERE hash=? AND {orphan_check}",
+        [(d,) for d in set(digests) if d is not None]
+    )
+
+
+def put_blob_stream(cursor, stream, chunk_size=1024 * 1024):
+    """Como put_blob pero leyendo `stream` por trozos: el texto sin comprimir
+    nunca está entero en memoria (solo la versión comprimida)."""
+    digest = hashlib.sha256()
+    compressor = zlib.compressobj(COMPRESSION_LEVEL)
+    parts = []
+    raw_size = 0
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        raw_size += len(chunk)
+        digest.update(chunk)
+        parts.append(compressor.compress(chunk))
+    parts.append(compressor.flush())
+
+    digest = digest.hexdigest()
+    data = b"".join(parts)
+    cursor.execute(
+        "INSERT OR IGNORE INTO blobs (hash, codec, raw_size, stored_size, data) VALUES (?, ?, ?, ?, ?)",
+        (digest, "zlib", raw_size, len(data), data)
+    )
+    return digest
+
+
+def iter_blob(cursor, digest, chunk_size=1024 * 1024):
+    """Descomprime un blob por trozos (para respuestas en streaming)"""
+    cursor.execute("SELECT codec, data FROM blobs WHERE hash=?", (digest,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    codec, data = row
+
+    def chunks():
+        if codec != "zlib":
+            for i in range(0, len(data), chunk_size):
+                yield data[i:i + chunk_size]
+            return
+        decompressor = zlib.decompressobj()
+        view = memoryview(data)
+        for i in range(0, len(data), chunk_size):
+            # max_length acota cada trozo descomprimido (el FASTA comprime mucho)
+            pending = view[i:i + chunk_size]
+            while pending:
+                out = decompressor.decompress(pending, chunk_size)
+                if out:
+                    yield out
+                pending = decompressor.unconsumed_tail
+        tail = decompressor.flush()
+        if tail:
+            yield tail
+
+    return chunks()
+
+
+def blob_exists(cursor, digest):
+    cursor.execute("SELECT 1 FROM blobs WHERE hash=?", (digest,))
+    return cursor.fetchone() is not None
+
+
+def init_matrices(cursor):
+    """Matrices uint8 de los alineamientos, derivadas de sus blobs FASTA
+    (misma clave: el hash del blob) y guardadas en teselas"""
+    cursor.execute('''CREATE TABLE IF NOT EXISTS matrices (
+                        hash TEXT PRIMARY KEY,
+                        n_rows INTEGER,
+                        n_cols INTEGER,
+                        tile_rows INTEGER,
+                        tile_cols INTEGER,
+                        names BLOB,
+                        residues BLOB
+                    )''')
+    cursor.execute('''CREATE TABLE IF NOT EXISTS matrix_tiles (
+                        hash TEXT,
+                        row_block INTEGER,
+                        col_block INTEGER,
+                        data BLOB,
+                        PRIMARY KEY (hash, row_block, col_block)
+                    ) WITHOUT ROWID''')
+
+
+def put_matrix(cursor, digest, names, matrix, tile_rows=TILE_ROWS, tile_cols=TILE_COLS):
+    """Guarda la matriz de un alineamiento en teselas comprimidas"""
+    n_rows, n_cols = matrix.shape
+    residues = ((matrix != GAP) & (matrix != PAD)).sum(axis=1).astype("<u4")
+    cursor.execute(
+        "INSERT OR IGNORE INTO matrices (hash, n_rows, n_cols, tile_rows, tile_cols, names, residues) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (digest, n_rows, n_cols, tile_rows, tile_cols,
+         zlib.compress("\n".join(names).encode(), COMPRESSION_LEVEL), residues.tobytes())
+    )
+    cursor.executemany(
+        "INSERT OR IGNORE INTO matrix_tiles (hash, row_block, col_block, data) VALUES (?, ?, ?, ?)",
+        ((digest, r // tile_rows, c // tile_cols,
+          zlib.compress(np.ascontiguousarray(matrix[r:r + tile_rows, c:c + tile_cols]).tobytes(),
+                        COMPRESSION_LEVEL))
+         for r in range(0, n_rows, tile_rows) for c in range(0, n_cols, tile_cols))
+    )
+
+
+def ensure_matrix(cursor, digest):
+    """Construye la matriz de un blob FASTA si aún no existe.
+
+    Devuelve False si el blob no existe. Lanza common.fasta.FastaError si el
+    contenido no es un alineamiento válido.
+    """
+    cursor.execute("SELECT 1 FROM matrices WHERE hash=?", (digest,))
+    if cursor.fetchone() is not None:
+        return True
+    data = get_blob_bytes(cursor, digest)
+    if data is None:
+        return False
+    headers, matrix = parse_alignment(data, unique_ids=False)
+    put_matrix(cursor, digest, headers, matrix)
+    return True
+
+
+def matrix_shape(cursor, digest):
+    """(filas, columnas) de la matriz, o None"""
+    cursor.execute("SELECT n_rows, n_cols FROM matrices WHERE hash=?", (digest,))
+    return cursor.fetchone()
+
+
+def matrix_info(cursor, digest):
+    """Dimensiones, nombres y residuos (sin gaps) por fila, o None"""
+    cursor.execute("SELECT n_rows, n_cols, names, residues FROM matrices WHERE hash=?", (digest,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    n_rows, n_cols, names, residues = row
+    return {
+        "rows": n_rows,
+        "cols": n_cols,
+        "names": zlib.decompress(names).decode().split("\n") if n_rows else [],
+        "ungapped_lengths": np.frombuffer(residues, dtype="<u4").tolist(),
+    }
+
+
+def read_window(cursor, digest, rows, col_start, col_end):
+    """Submatriz (filas `rows` x columnas col_start..col_end) y sus nombres.
+
+    Solo se leen y descomprimen las teselas que cortan la ventana. `rows` es
+    una lista de índices de fila (en el orden en que se quieren). Devuelve
+    None si la matriz no existe.
+    """
+    cursor.execute("SELECT n_rows, tile_rows, tile_cols, names FROM matrices WHERE hash=?", (digest,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    n_rows, tile_rows, tile_cols, names = row
+    names = zlib.decompress(names).decode().split("\n") if n_rows else []
+
+    rows = np.asarray(rows, dtype=np.int64)
+    window = np.empty((len(rows), col_end - col_start), dtype=np.uint8)
+    if window.size == 0:
+        return [names[i] for i in rows.tolist()], window
+
+    row_blocks = rows // tile_rows
+    wanted = np.unique(row_blocks).tolist()
+    cursor.execute(
+        f"SELECT row_block, col_block, data FROM matrix_tiles WHERE hash=? "
+        f"AND row_block IN ({','.join('?' * len(wanted))}) AND col_block BETWEEN ? AND ?",
+        [digest, *wanted, col_start // tile_cols, (col_end - 1) // tile_cols]
+    )
+    for row_block, col_block, data in cursor.fetchall():
+        tile = np.frombuffer(zlib.decompress(data), dtype=np.uint8)
+        tile_top, tile_left = row_block * tile_rows, col_block * tile_cols
+        tile = tile.reshape(min(tile_rows, n_rows - tile_top), -1)
+        # Tramo de columnas de la tesela que cae en la ventana
+        left = max(col_start, tile_left)
+        right = min(col_end, tile_left + tile.shape[1])
+        selected = np.flatnonzero(row_blocks == row_block)
+        window[selected, left - col_start:right - col_start] = \
+            tile[rows[selected] - tile_top, left - tile_left:right - tile_left]
+    return [names[i] for i in rows.tolist()], window
+
+
+def init_summaries(cursor):
+    """Resúmenes de los alineamientos (common.analysis.summarize), con la
+    misma clave que su blob: escalares en columnas (para listarlos en el
+    historial) y perfil de conservación e identidad en JSON comprimido"""
+    cursor.execute('''CREATE TABLE IF NOT EXISTS summaries (
+                        hash TEXT PRIMARY KEY,
+                        sequences INTEGER,
+                        length INTEGER,
+                        gap_fraction REAL,
+                        mean_length REAL,
+                        highly_conserved INTEGER,
+                        variable INTEGER,
+                        conservation BLOB,
+                        identity BLOB
+                    )''')
+
+
+def _pack_json(value):
+    return None if value is None else zlib.compress(json.dumps(value).encode(), COMPRESSION_LEVEL)
+
+
+def put_summary(cursor, digest, summary):
+    """Guarda el resumen de un blob. Lanza KeyError/TypeError si está incompleto"""
+    cursor.execute(
+        "INSERT OR IGNORE INTO summaries (hash, sequences, length, gap_fraction, mean_length, "
+        "highly_conserved, variable, conservation, identity) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (digest, int(summary["sequences"]), int(summary["length"]), float(summary["gap_fraction"]),
+         float(summary["mean_length"]), int(summary["highly_conserved"]), int(summary["variable"]),
+         _pack_json(list(summary["conservation"])), _pack_json(summary.get("identity")))
+    )
+
+
+def ensure_summary(cursor, digest):
+    """Calcula el resumen de un blob a partir de su matriz si aún no existe.
+
+    Devuelve False si el blob no existe. Lanza common.fasta.FastaError si el
+    contenido no es un alineamiento válido.
+    """
+    cursor.execute("SELECT 1 FROM summaries WHERE hash=?", (digest,))
+    if cursor.fetchone() is not None:
+        return True
+    if not ensure_matrix(cursor, digest):
+        return False
+    n_rows, n_cols = matrix_shape(cursor, digest)
+    _, matrix = read_window(cursor, digest, range(n_rows), 0, n_cols)
+    put_summary(cursor, digest, summarize(matrix))
+    return True
+
+
+def get_summary(cursor, digest, identity=True):
+    """Resumen de un blob (sin la matriz de identidad si `identity` es
+    False), o None"""
+    cursor.execute(
+        "SELECT sequences, length, gap_fraction, mean_length, highly_conserved, variable, "
+        f"conservation, {'identity' if identity else 'NULL'} FROM summaries WHERE hash=?", (digest,)
+    )
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    summary = dict(zip(
+        ("sequences", "length", "gap_fraction", "mean_length", "highly_conserved", "variable"), row
+    ))
+    summary["conservation"] = json.loads(zlib.decompress(row[6]))
+    summary["identity"] = json.loads(zlib.decompress(row[7])) if row[7] is not None else None
+    return summary
+
+
+def init_comparisons(cursor):
+    """Comparaciones entre los dos alineamientos de un mismo input
+    (common.analysis.compare), por par de blobs: referencia (`hash_a`) y
+    comparado (`hash_b`)"""
+    cursor.execute('''CREATE TABLE IF NOT EXISTS comparisons (
+                        hash_a TEXT,
+                        hash_b TEXT,
+                        sp_symmetric REAL,
+                        data BLOB,
+                        PRIMARY KEY (hash_a, hash_b)
+                    ) WITHOUT ROWID''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_comparisons_hash_b ON comparisons (hash_b)")
+
+
+def put_comparison(cursor, hash_a, hash_b, comparison):
+    """Guarda una comparación. Lanza KeyError/TypeError si está incompleta"""
+    cursor.execute(
+        "INSERT OR IGNORE INTO comparisons (hash_a, hash_b, sp_symmetric, data) VALUES (?, ?, ?, ?)",
+        (hash_a, hash_b, float(comparison["sp_symmetric"]), _pack_json(dict(comparison)))
+    )
+
+
+def ensure_comparison(cursor, hash_a, hash_b):
+    """Compara dos blobs a partir de sus matrices si aún no se hizo.
+
+    Devuelve False si falta alguno de los blobs. Lanza
+    common.fasta.FastaError si alguno no es un alineamiento válido.
+    """
+    cursor.execute("SELECT 1 FROM comparisons WHERE hash_a=? AND hash_b=?", (hash_a, hash_b))
+    if cursor.fetchone() is not None:
+        return True
+    aligned = []
+    for digest in (hash_a, hash_b):
+        if not ensure_matrix(cursor, digest):
+            return False
+        n_rows, n_cols = matrix_shape(cursor, digest)
+        aligned.extend(read_window(cursor, digest, range(n_rows), 0, n_cols))
+    put_comparison(cursor, hash_a, hash_b, compare(*aligned))
+    return True
+
+
+def get_comparison(cursor, hash_a, hash_b):
+    """Comparación de dos blobs, o None"""
+    cursor.execute("SELECT data FROM comparisons WHERE hash_a=? AND hash_b=?", (hash_a, hash_b))
+    row = cursor.fetchone()
+    return json.loads(zlib.decompress(row[0])) if row else None
+
+
+def delete_matrices(cursor, digests):
+    """Borra las matrices, resúmenes y comparaciones de `digests` cuyo blob
+    ya no existe"""
+    orphans = [(d,) for d in set(digests) if d is not None and not blob_exists(cursor, d)]
+    cursor.executemany("DELETE FROM matrix_tiles WHERE hash=?", orphans)
+    cursor.executemany("DELETE FROM matrices WHERE hash=?", orphans)
+    cursor.executemany("DELETE FROM summaries WHERE hash=?", orphans)
+    cursor.executemany("DELETE FROM comparisons WHERE hash_a=?", orphans)
+    cursor.executemany("DELETE FROM comparisons WHERE hash_b=?", orphans)
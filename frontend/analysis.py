@@ -0,0 +1,195 @@
+import numpy as np
+
+from common.analysis import column_counts, conservation_from_counts, identity_matrix
+from common.fasta import GAP, PAD, encode_sequences, parse_alignment
+from common.msa import unpack
+
+
+class MutationTable:
+    """Sustituciones respecto a una secuencia de referencia, en columnas.
+
+    Cada fila i es una mutación: `sequence[i]` (índice de fila en el
+    alineamiento), `position[i]` (1-based), `reference[i]` y `mutant[i]`
+    (códigos de residuo). Incluye los totales por secuencia y por posición.
+    """
+
+    def __init__(self, ref_index, sequence, position, reference, mutant, n_sequences, length):
+        self.ref_index = ref_index
+        self.sequence = sequence
+        self.position = position
+        self.reference = reference
+        self.mutant = mutant
+        self.per_sequence = np.bincount(sequence, minlength=n_sequences)
+        self.per_position = np.bincount(position - 1, minlength=length)
+        # Las filas vienen ordenadas por secuencia: offsets de cada una
+        self._offsets = np.concatenate([[0], np.cumsum(self.per_sequence)])
+
+    def __len__(self):
+        return len(self.sequence)
+
+    def for_sequence(self, i):
+        """Índices de las mutaciones de la secuencia i"""
+        return np.arange(self._offsets[i], self._offsets[i + 1])
+
+    def select(self, sequences=None, start=None, end=None):
+        """Índices de las mutaciones de `sequences` entre las posiciones start..end"""
+        keep = np.ones(len(self), dtype=bool)
+        if sequences is not None:
+            keep &= np.isin(self.sequence, sequences)
+        if start is not None:
+            keep &= self.position >= start
+        if end is not None:
+            keep &= self.position <= end
+        return np.flatnonzero(keep)
+
+    def rows(self, indices, names):
+        """Columnas legibles (dict de listas) de las mutaciones `indices`"""
+        reference = self.reference[indices].tobytes().decode("ascii")
+        mutant = self.mutant[indices].tobytes().decode("ascii")
+        position = self.position[indices].tolist()
+        return {
+            'sequence': [names[i] for i in self.sequence[indices].tolist()],
+            'position': position,
+            'reference': list(reference),
+            'mutant': list(mutant),
+            'change': [f"{r}{p}{m}" for r, p, m in zip(reference, position, mutant)],
+        }
+
+
+def find_mutations(matrix, residue_mask, ref_index):
+    """Compara todo el alineamiento con la fila de referencia en una operación"""
+    ref = matrix[ref_index]
+    mask = (matrix != ref) & residue_mask & residue_mask[ref_index]
+    sequence, column = np.nonzero(mask)
+    return MutationTable(ref_index, sequence, column + 1, ref[column], matrix[sequence, column],
+                         matrix.shape[0], matrix.shape[1])
+
+
+def display_name(header):
+    """Nombre corto de una cabecera: la descripción tras el último '|' sin
+    la especie entre corchetes, o el identificador si no queda nada"""
+    name = header.split('|')[-1].split('[')[0].strip()
+    return name or header.split()[0]
+
+
+def display_names(headers):
+    """Nombres cortos únicos: si dos cabeceras dan el mismo nombre se usa el
+    identificador (y un sufijo numérico si aún se repite)"""
+    names = []
+    used = set()
+    for header in headers:
+        name = display_name(header)
+        if name in used:
+            name = header.split()[0]
+        base, n = name, 2
+        while name in used:
+            name = f"{base} ({n})"
+            n += 1
+        used.add(name)
+        names.append(name)
+    return names
+
+
+class EncodedAlignment:
+    """Alineamiento codificado una sola vez y compartido por todos los análisis.
+
+    Guarda la matriz uint8 de residuos (N x L), las máscaras de gap/residuo y
+    los nombres; las estadísticas (cuentas por columna, conservación,
+    identidad...) se calculan la primera vez que se piden y quedan en caché.
+    """
+
+    def __init__(self, names, matrix):
+        self.names = list(names)
+        self.matrix = matrix
+        self.gap_mask = matrix == GAP
+        self.residue_mask = ~self.gap_mask & (matrix != PAD)
+        self._cache = {}
+
+    @classmethod
+    def from_sequences(cls, sequences):
+        """Construye el alineamiento desde un dict {nombre: secuencia}"""
+        return cls(sequences.keys(), encode_sequences(list(sequences.values())))
+
+    @classmethod
+    def from_fasta(cls, data):
+        """Construye el alineamiento directamente desde el FASTA (bytes)"""
+        headers, matrix = parse_alignment(data, unique_ids=False)
+        return cls(display_names(headers), matrix)
+
+    @classmethod
+    def from_msa(cls, data):
+        """Construye el alineamiento desde el formato binario (common.msa)"""
+        msa = unpack(data)
+        return cls(display_names(msa.names), msa.matrix)
+
+    @property
+    def n_sequences(self):
+        return self.matrix.shape[0]
+
+    @property
+    def length(self):
+        return self.matrix.shape[1]
+
+    def _cached(self, key, compute):
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
+
+    def window(self, start=0, end=None, row_start=0, row_end=None):
+        """Submatriz de filas row_start..row_end y columnas start..end"""
+        return self.matrix[row_start:row_end, start:end]
+
+    def row(self, i, start=0, end=None):
+        """Secuencia i (o un tramo) como texto"""
+        return self.matrix[i, start:end].tobytes().replace(bytes([PAD]), b"").decode("ascii")
+
+    def ungapped_lengths(self):
+        return self._cached("ungapped_lengths", lambda: self.residue_mask.sum(axis=1))
+
+    def column_counts(self):
+        return self._cached("column_counts", lambda: column_counts(self.matrix))
+
+    def conservation(self):
+        return self._cached("conservation", lambda: conservation_from_counts(self.column_counts()[1]))
+
+    def identity_matrix(self):
+        return self._cached("identity_matrix", lambda: identity_matrix(self.matrix))
+
+    def mutations(self, ref_index):
+        """Tabla de mutaciones frente a la fila ref_index.
+
+        Solo se guarda la de la última referencia pedida: cada tabla puede
+        tener millones de filas.
+        """
+        cached = self._cache.get("mutations")
+        if cached is None or cached.ref_index != ref_index:
+            cached = find_mutations(self.matrix, self.residue_mask, ref_index)
+            self._cache["mutations"] = cached
+        return cached
+
+
+class WindowedAlignment:
+    """Alineamiento guardado del que solo se conocen nombres y dimensiones.
+
+    Para el visor: cada ventana se pide con `fetch(start, end, row_start,
+    row_end)`, que devuelve la submatriz uint8, sin descargar el resto. Los
+    análisis que necesitan todas las columnas requieren un EncodedAlignment.
+    """
+
+    def __init__(self, names, length, ungapped_lengths, fetch):
+        self.names = list(names)
+        self.length = length
+        self._ungapped_lengths = np.asarray(ungapped_lengths)
+        self._fetch = fetch
+
+    @property
+    def n_sequences(self):
+        return len(self.names)
+
+    def window(self, start=0, end=None, row_start=0, row_end=None):
+        end = self.length if end is None else min(end, self.length)
+        row_end = self.n_sequences if row_end is None else min(row_end, self.n_sequences)
+        return self._fetch(start, end, row_start, row_end)
+
+    def ungapped_lengths(self):
+        return self._ungapped_lengths
@@ -1,18 +1,40 @@
+import startup  # el primero: marca el inicio de los imports
 import streamlit as st
-import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-from io import StringIO, BytesIO
-import re
-from collections import Counter
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
+from io import BytesIO
+import importlib
+import sys
+import time
 import requests
-import base64
-import tempfile
-import os
+from analysis import EncodedAlignment, WindowedAlignment, display_names
+from common.analysis import HIGHLY_CONSERVED, VARIABLE
+from common.fasta import iter_fasta
+from common.http import CONNECT_TIMEOUT, Client
+from common.msa import unpack
+from viewer import COLOR_SCHEMES, create_msa_visualization
+import hashlib
+from datetime import timedelta
+
+IMPORT_SECONDS = time.perf_counter() - startup.STARTED
+
+
+def lazy_import(name):
+    """Importa una biblioteca pesada (pandas, plotly, matplotlib) la primera
+    vez que una sección la necesita: la página inicial no la espera. Registra
+    cuánto tarda cada una en cargarse (una vez por proceso)."""
+    if name in sys.modules:
+        return importlib.import_module(name)
+    started = time.perf_counter()
+    module = importlib.import_module(name)
+    print(f"📦 {name} importado en {time.perf_counter() - started:.2f}s")
+    return module
+
+
+@st.cache_resource(show_spinner=False)
+def log_startup():
+    # Una vez por proceso (la primera ejecución del script): los reruns
+    # reutilizan los módulos ya importados y no vuelven a medirse
+    print(f"🚀 Frontend: imports iniciales en {IMPORT_SECONDS:.2f}s")
 
 # Configuración de la página
 st.set_page_config(
@@ -20,182 +42,120 @@ st.set_page_config(
     page_icon="🧬",
     layout="wide"
 )
+log_startup()
 
 # URL del backend (ajusta según tu configuración)
 BACKEND_URL = "http://172.19.0.3:5000"  # Cambia esto por la URL de tu backend
 
-# Esquemas de coloración para aminoácidos
-COLOR_SCHEMES = {
-    'Clustal': {
-        'A': '#80a0f0', 'R': '#f01505', 'N': '#00ff00', 'D': '#c048c0',
-        'C': '#f08080', 'Q': '#00ff00', 'E': '#c048c0', 'G': '#f09048',
-        'H': '#15a4a4', 'I': '#80a0f0', 'L': '#80a0f0', 'K': '#f01505',
-        'M': '#80a0f0', 'F': '#80a0f0', 'P': '#ffff00', 'S': '#00ff00',
-        'T': '#00ff00', 'W': '#80a0f0', 'Y': '#15a4a4', 'V': '#80a0f0',
-        '-': '#ffffff', 'X': '#ffffff'
-    },
-    'Hydrophobicity': {
-        'A': '#ad0052', 'R': '#0000ff', 'N': '#0c00f3', 'D': '#0c00f3',
-        'C': '#c2003d', 'Q': '#0c00f3', 'E': '#0c00f3', 'G': '#6a0095',
-        'H': '#1500ea', 'I': '#ff0000', 'L': '#ea0015', 'K': '#0000ff',
-        'M': '#b0004f', 'F': '#cb0034', 'P': '#4600b9', 'S': '#5e00a1',
-        'T': '#61009e', 'W': '#4f00b0', 'Y': '#1500ea', 'V': '#f60009',
-        '-': '#ffffff', 'X': '#ffffff'
-    },
-    'Chemistry': {
-        'A': '#c8c8c8', 'R': '#145aff', 'N': '#00dcdc', 'D': '#e60a0a',
-        'C': '#e6e600', 'Q': '#00dcdc', 'E': '#e60a0a', 'G': '#ebebeb',
-        'H': '#8282d2', 'I': '#0f820f', 'L': '#0f820f', 'K': '#145aff',
-        'M': '#e6e600', 'F': '#3232aa', 'P': '#dc9682', 'S': '#fa9600',
-        'T': '#fa9600', 'W': '#b45ab4', 'Y': '#3232aa', 'V': '#0f820f',
-        '-': '#ffffff', 'X': '#ffffff'
-    }
-}
+# Secuencias visibles por defecto en el visor del alineamiento
+VIEW_ROWS = 40
+
+# Tamaño de las cachés entre reruns/sesiones
+ALIGNMENT_CACHE_ENTRIES = 16  # alineamientos parseados
+FIGURE_CACHE_ENTRIES = 64  # figuras y resultados por alineamiento
+HISTORY_TTL = 10  # segundos que se reutiliza una página del historial
+
+# Alineamientos del historial hasta este tamaño (celdas) se descargan enteros
+# al abrirlos; los mayores solo por ventanas hasta que se piden los análisis
+FULL_LOAD_CELLS = 2_000_000
+DOWNLOAD_TIMEOUT = 300  # segundos para descargar un FASTA completo
+
+# Sondeo de trabajos de alineamiento
+JOB_POLL_INTERVAL = 1.0  # segundos entre consultas
+JOB_MAX_WAIT = 30 * 60  # tiempo máximo de espera por trabajo
 
 class MSAAnalyzer:
-    def __init__(self, sequences):
-        self.sequences = sequences
-        self.seq_names = list(sequences.keys())
-        self.alignment_length = len(list(sequences.values())[0]) if sequences else 0
+    def __init__(self, alignment):
+        # Acepta un EncodedAlignment ya construido o un dict {nombre: secuencia}
+        if isinstance(alignment, dict):
+            alignment = EncodedAlignment.from_sequences(alignment)
+        self.alignment = alignment
+        self.seq_names = alignment.names
+        self.alignment_length = alignment.length
         
     def parse_fasta_file(self, file_content):
         """Parsea un archivo FASTA con múltiples secuencias"""
-        sequences = {}
-        current_name = None
-        current_seq = []
-        
-        for line in file_content.strip().split('\n'):
-            if line.startswith('>'):
-                if current_name:
-                    sequences[current_name] = ''.join(current_seq)
-                # Extraer nombre más limpio
-                current_name = line[1:].split('|')[-1].split('[')[0].strip()
-                if not current_name:
-                    current_name = line[1:].split()[0]
-                current_seq = []
-            else:
-                current_seq.append(line.strip())
-        
-        if current_name:
-            sequences[current_name] = ''.join(current_seq)
-            
-        return sequences
+        records = list(iter_fasta(file_content.encode(), unique_ids=False))
+        names = display_names([header for header, _ in records])
+        return {name: seq.decode("ascii") for name, (_, seq) in zip(names, records)}
     
     def calculate_identity_matrix(self):
         """Calcula matriz de identidad por pares"""
-        n_seqs = len(self.sequences)
-        identity_matrix = np.zeros((n_seqs, n_seqs))
-        
-        seq_list = list(self.sequences.values())
-        
-        for i in range(n_seqs):
-            for j in range(n_seqs):
-                if i == j:
-                    identity_matrix[i][j] = 100.0
-                else:
-                    seq1, seq2 = seq_list[i], seq_list[j]
-                    matches = sum(1 for a, b in zip(seq1, seq2) if a == b and a != '-' and b != '-')
-                    valid_positions = sum(1 for a, b in zip(seq1, seq2) if a != '-' or b != '-')
-                    identity_matrix[i][j] = (matches / valid_positions * 100) if valid_positions > 0 else 0
-        
-        return identity_matrix
+        return self.alignment.identity_matrix()
     
     def find_mutations(self, ref_seq_name=None):
         """Encuentra mutaciones comparando con secuencia de referencia"""
         if not ref_seq_name:
             ref_seq_name = self.seq_names[0]
         
-        ref_seq = self.sequences[ref_seq_name]
+        ref_index = self.seq_names.index(ref_seq_name)
+        table = self.alignment.mutations(ref_index)
         mutations = {}
         
-        for name, seq in self.sequences.items():
+        for i, name in enumerate(self.seq_names):
             if name != ref_seq_name:
-                seq_mutations = []
-                for pos, (ref_aa, seq_aa) in enumerate(zip(ref_seq, seq)):
-                    if ref_aa != seq_aa and ref_aa != '-' and seq_aa != '-':
-                        seq_mutations.append({
-                            'position': pos + 1,
-                            'reference': ref_aa,
-                            'mutant': seq_aa,
-                            'change': f"{ref_aa}{pos+1}{seq_aa}"
-                        })
-                mutations[name] = seq_mutations
+                rows = table.rows(table.for_sequence(i), self.seq_names)
+                mutations[name] = [
+                    {'position': pos, 'reference': ref_aa, 'mutant': seq_aa, 'change': change}
+                    for pos, ref_aa, seq_aa, change in zip(
+                        rows['position'], rows['reference'], rows['mutant'], rows['change'])
+                ]
         
         return mutations
     
     def calculate_conservation(self):
         """Calcula el grado de conservación por posición"""
-        conservation_scores = []
-        
-        for pos in range(self.alignment_length):
-            column = [seq[pos] for seq in self.sequences.values()]
-            # Excluir gaps para el cálculo
-            amino_acids = [aa for aa in column if aa != '-']
-            
-            if amino_acids:
-                # Calcular entropía de Shannon (inversa de conservación)
-                counter = Counter(amino_acids)
-                total = len(amino_acids)
-                entropy = -sum((count/total) * np.log2(count/total) for count in counter.values())
-                # Convertir a score de conservación (0-1)
-                max_entropy = np.log2(min(20, len(set(amino_acids))))
-                conservation = 1 - (entropy / max_entropy if max_entropy > 0 else 0)
-            else:
-                conservation = 0
-            
-            conservation_scores.append(conservation)
-        
-        return conservation_scores
+        return self.alignment.conservation().tolist()
 
-def create_msa_visualization(sequences, color_scheme='Clustal', start_pos=0, end_pos=100):
-    """Crea visualización del MSA"""
-    colors = COLOR_SCHEMES[color_scheme]
-    
-    fig, ax = plt.subplots(figsize=(max(15, (end_pos-start_pos)*0.15), len(sequences)*0.5))
-    
-    seq_names = list(sequences.keys())
-    y_positions = range(len(seq_names))
-    
-    # Crear matriz de colores
-    for i, (name, seq) in enumerate(sequences.items()):
-        subseq = seq[start_pos:end_pos]
-        for j, aa in enumerate(subseq):
-            color = colors.get(aa.upper(), '#ffffff')
-            rect = plt.Rectangle((j, len(seq_names)-i-1), 1, 1, 
-                               facecolor=color, edgecolor='black', linewidth=0.1)
-            ax.add_patch(rect)
-            
-            # Añadir texto del aminoácido
-            ax.text(j+0.5, len(seq_names)-i-0.5, aa, 
-                   ha='center', va='center', fontsize=8, fontweight='bold')
-    
-    # Configurar ejes
-    ax.set_xlim(0, end_pos-start_pos)
-    ax.set_ylim(0, len(seq_names))
-    ax.set_yticks([i+0.5 for i in range(len(seq_names))])
-    ax.set_yticklabels(reversed(seq_names))
-    ax.set_xlabel('Posición en el alineamiento')
-    ax.set_title(f'Alineamiento Múltiple de Secuencias ({color_scheme})')
-    
-    # Añadir números de posición
-    step = max(1, (end_pos-start_pos)//20)
-    ax.set_xticks(range(0, end_pos-start_pos, step))
-    ax.set_xticklabels(range(start_pos, end_pos, step))
-    
-    plt.tight_layout()
-    return fig
+@st.cache_resource(max_entries=4, show_spinner=False)
+def backend_client(url):
+    """Cliente del backend: conexiones keep-alive compartidas entre reruns y
+    sesiones, timeouts y reintentos de las consultas"""
+    return Client(url)
 
 def send_to_backend(uploaded_file):
-    """Envía archivo al backend para alineamiento"""
+    """Envía el archivo como trabajo y espera (sondeando) a que termine"""
     try:
         files = {"file": uploaded_file}
-        response = requests.post(f"{BACKEND_URL}/align", files=files, timeout=60)
-        
-        if response.status_code == 200:
-            return response.json()
-        else:
+        backend = backend_client(BACKEND_URL)
+        response = backend.post("jobs", files=files, timeout=(CONNECT_TIMEOUT, 60))
+
+        if response.status_code == 503:
+            queue = response.json().get("queue", {})
+            st.error(f"Servidor ocupado: {queue.get('queued', '?')} trabajos en cola. "
+                     "Inténtalo de nuevo en unos segundos.")
+            return None
+        if response.status_code in (400, 413):
+            st.error(f"Archivo FASTA rechazado: {response.json().get('error')}")
+            return None
+        if response.status_code != 202:
             st.error(f"Error del servidor: {response.status_code}")
             return None
+
+        job_id = response.json()["job_id"]
+        status_box = st.empty()
+        started = time.time()
+        while time.time() - started < JOB_MAX_WAIT:
+            job = backend.get(f"jobs/{job_id}", timeout=(CONNECT_TIMEOUT, 10)).json()
+            if job["status"] == "done":
+                status_box.empty()
+                result = backend.get(f"jobs/{job_id}/result", timeout=(CONNECT_TIMEOUT, 60))
+                return result.json()
+            if job["status"] in ("failed", "cancelled"):
+                status_box.empty()
+                st.error(f"El alineamiento falló: {job.get('error')}")
+                return None
+
+            queue = job.get("queue", {})
+            if job["status"] == "queued":
+                status_box.info(f"⏳ En cola ({queue.get('queued', '?')} trabajos esperando)...")
+            else:
+                status_box.info(f"⚙️ Alineando... {time.time() - started:.0f}s")
+            time.sleep(JOB_POLL_INTERVAL)
+
+        st.error("El alineamiento tardó demasiado; se canceló el trabajo.")
+        backend.delete(f"jobs/{job_id}", timeout=(CONNECT_TIMEOUT, 10))
+        return None
     except requests.exceptions.RequestException as e:
         st.error(f"Error de conexión: {str(e)}")
         return None
@@ -205,11 +165,193 @@ def decode_fasta_content(data):
     return data
 
 
-def render_analysis_tab(sequences, tab_name, color_scheme):
-    """Renderiza una pestaña de análisis completo"""
-    analyzer = MSAAnalyzer(sequences)
+# CACHÉ ENTRE RERUNS Y SESIONES
+# Streamlit reejecuta todo el script en cada interacción: los resultados se
+# guardan por hash del contenido del alineamiento, así solo se recalcula lo
+# que depende de un control que realmente cambió. Todas las cachés están
+# acotadas (max_entries) y expulsan las entradas más antiguas.
+
+def content_hash(content):
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+@st.cache_resource(max_entries=ALIGNMENT_CACHE_ENTRIES, show_spinner=False)
+def get_alignment(alignment_hash, _content):
+    """Alineamiento parseado y codificado, compartido entre sesiones.
+
+    El objeto guarda además sus estadísticas (identidad, conservación...)
+    la primera vez que se calculan.
+    """
+    return EncodedAlignment.from_fasta(_content.encode())
+
+
+@st.cache_data(max_entries=FIGURE_CACHE_ENTRIES, show_spinner=False)
+def fetch_window(backend_url, aln_id, aligner, start=None, end=None, row_start=None, row_end=None):
+    """Ventana de un alineamiento guardado en formato binario (common.msa):
+    solo viajan las celdas pedidas. Sin rango, el alineamiento completo."""
+    params = {"aligner": aligner, "start": start, "end": end, "row_start": row_start, "row_end": row_end}
+    response = backend_client(backend_url).get(
+        f"alignment/{aln_id}/window", params={k: v for k, v in params.items() if v is not None},
+        timeout=(CONNECT_TIMEOUT, DOWNLOAD_TIMEOUT)
+    )
+    response.raise_for_status()
+    return response.content
+
+
+@st.cache_resource(max_entries=ALIGNMENT_CACHE_ENTRIES, show_spinner=False)
+def get_stored_alignment(alignment_hash, backend_url, aln_id, aligner):
+    """Alineamiento guardado completo: la matriz llega ya codificada, sin
+    FASTA que parsear (compartido entre sesiones como get_alignment)"""
+    return EncodedAlignment.from_msa(fetch_window(backend_url, aln_id, aligner))
+
+
+def windowed_alignment(backend_url, aln_id, aligner, info):
+    """Alineamiento guardado del que solo se descargan las ventanas visibles"""
+    def fetch(start, end, row_start, row_end):
+        return unpack(fetch_window(backend_url, aln_id, aligner, start, end, row_start, row_end)).matrix
+    return WindowedAlignment(display_names(info['names']), info['cols'], info['ungapped_lengths'], fetch)
+
+
+@st.cache_data(max_entries=FIGURE_CACHE_ENTRIES, show_spinner=False)
+def msa_window_png(alignment_hash, _alignment, color_scheme, start_pos, end_pos, row_start, row_end):
+    """Ventana del visor ya renderizada como PNG"""
+    plt = lazy_import("matplotlib.pyplot")
+    fig = create_msa_visualization(_alignment, color_scheme, start_pos, end_pos, row_start, row_end)
+    buffer = BytesIO()
+    fig.savefig(buffer, format="png")
+    plt.close(fig)
+    return buffer.getvalue()
+
+
+@st.cache_data(max_entries=FIGURE_CACHE_ENTRIES, show_spinner=False)
+def identity_figure(alignment_hash, _names, _identity_matrix):
+    go = lazy_import("plotly.graph_objects")
+    identity_matrix = np.asarray(_identity_matrix)
     
-    if not sequences:
+    # Crear heatmap con plotly
+    fig_identity = go.Figure(data=go.Heatmap(
+        z=identity_matrix,
+        x=_names,
+        y=_names,
+        colorscale='RdYlBu_r',
+        text=np.round(identity_matrix, 1),
+        texttemplate="%{text}%",
+        textfont={"size": 10},
+        colorbar=dict(title="Identidad (%)")
+    ))
+    
+    fig_identity.update_layout(
+        title="Matriz de Identidad por Pares",
+        xaxis_title="Secuencias",
+        yaxis_title="Secuencias",
+        width=700,
+        height=600
+    )
+    return fig_identity
+
+
+@st.cache_data(max_entries=FIGURE_CACHE_ENTRIES, show_spinner=False)
+def conservation_figure(alignment_hash, _conservation_scores, tab_name):
+    px = lazy_import("plotly.express")
+    conservation_scores = np.asarray(_conservation_scores)
+    
+    # Gráfico de conservación
+    fig_cons = px.line(x=np.arange(1, len(conservation_scores)+1), 
+                     y=conservation_scores,
+                     title=f"Grado de Conservación por Posición - {tab_name}")
+    fig_cons.update_xaxes(title="Posición")
+    fig_cons.update_yaxes(title="Score de Conservación (0-1)")
+    fig_cons.add_hline(y=0.8, line_dash="dash", line_color="red", 
+                     annotation_text="Altamente conservado (>0.8)")
+    return fig_cons
+
+
+@st.cache_data(ttl=HISTORY_TTL, max_entries=FIGURE_CACHE_ENTRIES, show_spinner=False)
+def fetch_history(backend_url, params):
+    """Página del historial; se cachea unos segundos para no pedirla en cada rerun"""
+    response = backend_client(backend_url).get("alignments", params=dict(params))
+    response.raise_for_status()
+    return response.json()
+
+
+def load_alignments(muscle_content, msa_content, summaries=None, comparison=None):
+    """Guarda ambos alineamientos en la sesión (se parsean una sola vez por contenido)"""
+    st.session_state.pop('stored_alignment', None)
+    st.session_state['summaries'] = summaries or {}
+    st.session_state['comparison'] = comparison
+    st.session_state['muscle_content'] = muscle_content
+    st.session_state['msa_content'] = msa_content
+    st.session_state['muscle_hash'] = content_hash(muscle_content)
+    st.session_state['msa_hash'] = content_hash(msa_content)
+    st.session_state['alignments_ready'] = True
+
+
+def load_stored_alignment(info, summaries=None, comparison=None):
+    """Abre un alineamiento del historial a partir de su descripción
+    (/alignment/<id>/info), sus resúmenes (/alignment/<id>/summary) y su
+    comparación (/alignment/<id>/comparison): el contenido se pide después,
+    según haga falta"""
+    for key in ('muscle_content', 'msa_content', 'muscle_hash', 'msa_hash'):
+        st.session_state.pop(key, None)
+    st.session_state['stored_alignment'] = info
+    st.session_state['summaries'] = summaries or {}
+    st.session_state['comparison'] = comparison
+    st.session_state['alignments_ready'] = True
+
+
+def tab_summary(aligner):
+    """Resumen precalculado por el backend (common.analysis.summarize), o
+    None si no está disponible: entonces se calcula con el alineamiento"""
+    summary = st.session_state.get('summaries', {}).get(aligner)
+    return summary if summary and 'error' not in summary else None
+
+
+def tab_alignment(aligner):
+    """(hash, alignment) de una pestaña: el recién subido o uno del historial.
+
+    Los del historial grandes se abren por ventanas hasta que se piden los
+    análisis completos. Devuelve (None, None) si el alineamiento no es válido.
+    """
+    stored = st.session_state.get('stored_alignment')
+    if stored is None:
+        alignment_hash = st.session_state[f'{aligner}_hash']
+        return alignment_hash, get_alignment(alignment_hash, st.session_state[f'{aligner}_content'])
+
+    info = stored['alignments'][aligner]
+    if 'error' in info:
+        st.error(f"No se pudo abrir el alineamiento: {info['error']}")
+        return None, None
+    if (info['rows'] * info['cols'] <= FULL_LOAD_CELLS
+            or st.session_state.get(f"full_{stored['id']}_{aligner}")):
+        return info['hash'], get_stored_alignment(info['hash'], BACKEND_URL, stored['id'], aligner)
+    return info['hash'], windowed_alignment(BACKEND_URL, stored['id'], aligner, info)
+
+
+def fasta_download(aligner):
+    """Contenido del botón de descarga: el texto si está en la sesión o, para
+    alineamientos del historial, una función que lo pide solo al pulsarlo"""
+    stored = st.session_state.get('stored_alignment')
+    if stored is None:
+        return st.session_state[f'{aligner}_content']
+    backend_url = BACKEND_URL
+    return lambda: backend_client(backend_url).get(
+        f"alignment/{stored['id']}/fasta", params={"aligner": aligner},
+        timeout=(CONNECT_TIMEOUT, DOWNLOAD_TIMEOUT)
+    ).content
+
+
+def render_analysis_tab(alignment_hash, alignment, tab_name, color_scheme, full_key=None, summary=None):
+    """Renderiza una pestaña de análisis completo.
+
+    Con `summary` (resumen precalculado por el backend) las métricas, la
+    identidad y la conservación no recorren el alineamiento.
+    """
+    if alignment is None:
+        return
+    analyzer = MSAAnalyzer(alignment)
+    windowed = isinstance(alignment, WindowedAlignment)
+    
+    if alignment.n_sequences == 0:
         st.error("No se pudieron procesar las secuencias.")
         return
     
@@ -218,114 +360,229 @@ def render_analysis_tab(sequences, tab_name, color_scheme):
     # Información general
     col1, col2, col3 = st.columns(3)
     with col1:
-        st.metric("Número de secuencias", len(sequences))
+        st.metric("Número de secuencias", alignment.n_sequences)
     with col2:
         st.metric("Longitud del alineamiento", analyzer.alignment_length)
     with col3:
-        avg_length = np.mean([len(seq.replace('-', '')) for seq in sequences.values()])
+        if summary is not None:
+            avg_length = summary['mean_length']
+        else:
+            avg_length = np.mean(alignment.ungapped_lengths())
         st.metric("Longitud promedio (sin gaps)", f"{avg_length:.0f}")
     
     # Lista de secuencias
     st.write("🔍 **Secuencias en el alineamiento:**")
-    for i, name in enumerate(sequences.keys(), 1):
+    for i, name in enumerate(alignment.names, 1):
         st.write(f"{i}. {name}")
     
     # VISUALIZACIÓN MSA
     st.subheader("🎨 Visualización del Alineamiento")
     
-    # Controles de rango
+    # Controles de la ventana visible: ancho + desplazamiento horizontal y vertical
     col1, col2 = st.columns(2)
     with col1:
-        start_pos = st.number_input(f"Posición inicial ({tab_name}):", 
-                                  min_value=0, 
-                                  max_value=analyzer.alignment_length-1, 
-                                  value=0,
-                                  key=f"start_{tab_name}")
+        window_width = st.number_input(f"Columnas visibles ({tab_name}):",
+                                       min_value=10,
+                                       max_value=max(10, analyzer.alignment_length),
+                                       value=min(100, max(10, analyzer.alignment_length)),
+                                       step=10,
+                                       key=f"width_{tab_name}")
     with col2:
-        end_pos = st.number_input(f"Posición final ({tab_name}):", 
-                                min_value=start_pos+1, 
-                                max_value=analyzer.alignment_length, 
-                                value=min(100, analyzer.alignment_length),
-                                key=f"end_{tab_name}")
-    
-    # Crear y mostrar visualización
-    msa_fig = create_msa_visualization(sequences, color_scheme, start_pos, end_pos)
-    st.pyplot(msa_fig)
-    
+        visible_rows = st.number_input(f"Secuencias visibles ({tab_name}):",
+                                       min_value=1,
+                                       max_value=alignment.n_sequences,
+                                       value=min(VIEW_ROWS, alignment.n_sequences),
+                                       key=f"rows_{tab_name}")
+
+    start_pos = 0
+    if analyzer.alignment_length > window_width:
+        start_pos = st.slider(f"Desplazar posición ({tab_name}):",
+                              min_value=0,
+                              max_value=analyzer.alignment_length - window_width,
+                              value=0,
+                              key=f"start_{tab_name}")
+    end_pos = start_pos + window_width
+
+    row_start = 0
+    if alignment.n_sequences > visible_rows:
+        row_start = st.slider(f"Desplazar secuencias ({tab_name}):",
+                              min_value=0,
+                              max_value=alignment.n_sequences - visible_rows,
+                              value=0,
+                              key=f"row_start_{tab_name}")
+
+    # Crear y mostrar visualización (solo la ventana visible)
+    st.image(msa_window_png(alignment_hash, alignment, color_scheme, start_pos, end_pos,
+                            row_start, row_start + visible_rows),
+             use_container_width=True)
+
     # MATRIZ DE IDENTIDAD
     st.subheader("🔢 Análisis de Identidad por Pares")
     
-    identity_matrix = analyzer.calculate_identity_matrix()
+    if summary is not None and summary.get('identity') is not None:
+        identity_matrix = summary['identity']
+    elif not windowed:
+        identity_matrix = alignment.identity_matrix()
+    else:
+        identity_matrix = None
+        st.caption("Matriz de identidad no precalculada para tantas secuencias: "
+                   "carga el alineamiento completo para calcularla.")
+    if identity_matrix is not None:
+        st.plotly_chart(identity_figure(alignment_hash, alignment.names, identity_matrix),
+                        use_container_width=True, key=f"identity_{tab_name}")
     
-    # Crear heatmap con plotly
-    fig_identity = go.Figure(data=go.Heatmap(
-        z=identity_matrix,
-        x=analyzer.seq_names,
-        y=analyzer.seq_names,
-        colorscale='RdYlBu_r',
-        text=np.round(identity_matrix, 1),
-        texttemplate="%{text}%",
-        textfont={"size": 10},
-        colorbar=dict(title="Identidad (%)")
-    ))
+    # ANÁLISIS DE MUTACIONES
+    st.subheader("🧬 Análisis de Mutaciones")
     
-    fig_identity.update_layout(
-        title="Matriz de Identidad por Pares",
-        xaxis_title="Secuencias",
-        yaxis_title="Secuencias",
-        width=700,
-        height=600
-    )
+    # Alineamiento grande del historial: las mutaciones necesitan todas las columnas
+    if windowed:
+        cells = alignment.n_sequences * alignment.length
+        st.info(f"Alineamiento grande ({cells:,} celdas): el visor descarga solo la ventana visible.")
+        if st.button(f"📥 Cargar completo para identidad y mutaciones ({tab_name})",
+                     key=f"full_{tab_name}"):
+            st.session_state[full_key] = True
+            st.rerun()
+    else:
+        render_mutations(alignment, analyzer, tab_name)
     
-    st.plotly_chart(fig_identity, use_container_width=True)
+    # ANÁLISIS DE CONSERVACIÓN
+    st.subheader("📈 Análisis de Conservación")
     
-    # ANÁLISIS DE MUTACIONES
-    st.subheader("🧬 Análisis de Mutaciones")
+    if summary is not None:
+        conservation_scores = np.asarray(summary['conservation'])
+        highly_conserved = summary['highly_conserved']
+        variable_positions = summary['variable']
+    elif not windowed:
+        conservation_scores = alignment.conservation()
+        highly_conserved = int((conservation_scores > HIGHLY_CONSERVED).sum())
+        variable_positions = int((conservation_scores < VARIABLE).sum())
+    else:
+        st.caption("Conservación no disponible sin el alineamiento completo.")
+        return
+    st.plotly_chart(conservation_figure(alignment_hash, conservation_scores, tab_name),
+                    use_container_width=True, key=f"conservation_{tab_name}")
     
+    # Estadísticas de conservación
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Conservación promedio", f"{np.mean(conservation_scores):.3f}")
+    with col2:
+        st.metric("Posiciones altamente conservadas", f"{highly_conserved}")
+    with col3:
+        st.metric("Posiciones variables", f"{variable_positions}")
+
+
+def render_mutations(alignment, analyzer, tab_name):
+    """Tabla de mutaciones respecto a una secuencia de referencia"""
+    pd = lazy_import("pandas")
     # Seleccionar secuencia de referencia
     ref_seq = st.selectbox(f"Selecciona secuencia de referencia ({tab_name}):", 
                           analyzer.seq_names,
                           key=f"ref_{tab_name}")
     
-    mutations = analyzer.find_mutations(ref_seq)
+    ref_index = analyzer.seq_names.index(ref_seq)
+    mutations = alignment.mutations(ref_index)
+    other_names = [name for i, name in enumerate(alignment.names) if i != ref_index]
     
-    if mutations:
-        # Resumen de mutaciones
-        total_mutations = sum(len(muts) for muts in mutations.values())
-        st.write(f"**Total de mutaciones encontradas:** {total_mutations}")
-        
-        # Mostrar mutaciones por secuencia
-        for seq_name, seq_mutations in mutations.items():
-            if seq_mutations:
-                st.write(f"**Mutaciones en {seq_name}:**")
-                mut_df = pd.DataFrame(seq_mutations)
-                st.dataframe(mut_df)
-    
-    # ANÁLISIS DE CONSERVACIÓN
-    st.subheader("📈 Análisis de Conservación")
+    # Resumen de mutaciones
+    st.write(f"**Total de mutaciones encontradas:** {len(mutations)}")
+    col1, col2 = st.columns(2)
+    with col1:
+        st.write("**Mutaciones por secuencia:**")
+        st.dataframe(pd.DataFrame({
+            'sequence': other_names,
+            'mutations': np.delete(mutations.per_sequence, ref_index),
+        }), hide_index=True)
+    with col2:
+        st.write("**Mutaciones por posición:**")
+        st.bar_chart(pd.DataFrame({'mutations': mutations.per_position},
+                                  index=np.arange(1, alignment.length + 1)))
     
-    conservation_scores = analyzer.calculate_conservation()
+    # Tabla única, filtrable y paginada
+    col1, col2 = st.columns(2)
+    with col1:
+        selected = st.multiselect(f"Filtrar secuencias ({tab_name}):", other_names,
+                                  key=f"mut_seqs_{tab_name}")
+    with col2:
+        pos_range = st.slider(f"Rango de posiciones ({tab_name}):",
+                              min_value=1, max_value=max(2, alignment.length),
+                              value=(1, max(2, alignment.length)),
+                              key=f"mut_range_{tab_name}")
+    selected_idx = [alignment.names.index(name) for name in selected] or None
+    indices = mutations.select(selected_idx, pos_range[0], pos_range[1])
     
-    # Gráfico de conservación
-    fig_cons = px.line(x=range(1, len(conservation_scores)+1), 
-                     y=conservation_scores,
-                     title=f"Grado de Conservación por Posición - {tab_name}")
-    fig_cons.update_xaxes(title="Posición")
-    fig_cons.update_yaxes(title="Score de Conservación (0-1)")
-    fig_cons.add_hline(y=0.8, line_dash="dash", line_color="red", 
-                     annotation_text="Altamente conservado (>0.8)")
-    st.plotly_chart(fig_cons, use_container_width=True)
+    col1, col2 = st.columns(2)
+    with col1:
+        page_size = st.selectbox(f"Filas por página ({tab_name}):", [25, 50, 100, 500],
+                                 index=2, key=f"mut_page_size_{tab_name}")
+    n_pages = max(1, -(-len(indices) // page_size))
+    with col2:
+        page = st.number_input(f"Página ({tab_name}):", min_value=1, max_value=n_pages,
+                               value=1, key=f"mut_page_{tab_name}")
+    page_indices = indices[(page - 1) * page_size:page * page_size]
+    st.dataframe(pd.DataFrame(mutations.rows(page_indices, alignment.names)), hide_index=True)
+    st.caption(f"{len(indices)} mutaciones con los filtros actuales · página {page} de {n_pages}")
+
+def render_comparison_tab(comparison):
+    """Renderiza la comparación MUSCLE (referencia) frente a MSAligner,
+    calculada por el backend al alinear (common.analysis.compare)"""
+    st.subheader("⚖️ MUSCLE frente a MSAligner")
+    if not comparison:
+        st.info("Comparación no disponible para este alineamiento.")
+        return
+    pd = lazy_import("pandas")
+    px = lazy_import("plotly.express")
+    go = lazy_import("plotly.graph_objects")
     
-    # Estadísticas de conservación
+    # Acuerdo global: pares de residuos (SP) y columnas completas (TC)
     col1, col2, col3 = st.columns(3)
     with col1:
-        st.metric("Conservación promedio", f"{np.mean(conservation_scores):.3f}")
+        st.metric("Acuerdo SP (simétrico)", f"{comparison['sp_symmetric']:.3f}")
+        st.metric("Columnas idénticas", comparison['identical_columns'])
     with col2:
-        highly_conserved = sum(1 for score in conservation_scores if score > 0.8)
-        st.metric("Posiciones altamente conservadas", f"{highly_conserved}")
+        st.metric("SP de MSAligner (ref. MUSCLE)", f"{comparison['sp']['b_vs_a']:.3f}")
+        st.metric("TC de MSAligner (ref. MUSCLE)", f"{comparison['tc']['b_vs_a']:.3f}")
     with col3:
-        variable_positions = sum(1 for score in conservation_scores if score < 0.5)
-        st.metric("Posiciones variables", f"{variable_positions}")
+        st.metric("SP de MUSCLE (ref. MSAligner)", f"{comparison['sp']['a_vs_b']:.3f}")
+        st.metric("TC de MUSCLE (ref. MSAligner)", f"{comparison['tc']['a_vs_b']:.3f}")
+    st.caption(f"{comparison['sequences']} secuencias comparadas · "
+               f"{comparison['columns']['a']} columnas en MUSCLE, "
+               f"{comparison['columns']['b']} en MSAligner")
+    if comparison['unmatched'] or comparison['mismatched']:
+        st.warning(f"Fuera de la comparación: {len(comparison['unmatched'])} secuencias sin pareja "
+                   f"y {len(comparison['mismatched'])} con residuos distintos entre alineadores.")
+    
+    # Divergencia por secuencia: pares de residuos en los que no coinciden
+    names = display_names(comparison['names'])
+    st.write("**Divergencia por secuencia** (1 - pares alineados en ambos / pares alineados en alguno):")
+    st.bar_chart(pd.DataFrame({'divergencia': comparison['divergence']}, index=names))
+    
+    # Desacuerdo por región, en columnas de MUSCLE
+    fig_columns = px.line(x=np.arange(1, len(comparison['column_disagreement']) + 1),
+                          y=comparison['column_disagreement'],
+                          title="Desacuerdo por columna (coordenadas de MUSCLE)")
+    fig_columns.update_xaxes(title="Columna MUSCLE")
+    fig_columns.update_yaxes(title="Desacuerdo (0-1)")
+    st.plotly_chart(fig_columns, use_container_width=True, key="comparison_columns")
+    
+    if comparison['region_map'] is not None:
+        width = comparison['columns']['a'] / comparison['regions']
+        fig_map = go.Figure(data=go.Heatmap(
+            z=comparison['region_map'],
+            x=[int(i * width) + 1 for i in range(comparison['regions'])],
+            y=names,
+            colorscale='Reds',
+            zmin=0,
+            zmax=1,
+            colorbar=dict(title="Desacuerdo")
+        ))
+        fig_map.update_layout(
+            title="Mapa de desacuerdo por secuencia y región",
+            xaxis_title="Columna MUSCLE (inicio del tramo)",
+            yaxis_title="Secuencias",
+            height=max(400, min(1200, 20 * len(names)))
+        )
+        st.plotly_chart(fig_map, use_container_width=True, key="comparison_map")
 
 # INTERFAZ PRINCIPAL
 st.title("🧬 Visualizador MSA - Alineamiento Múltiple de Secuencias")
@@ -354,33 +611,84 @@ uploaded_file = st.file_uploader(
 # Mostrar historial de alineamientos
 st.header("📜 Historial de Alineamientos")
 
+# Filtros y paginación (por cursor) del historial
+col1, col2, col3, col4 = st.columns([2, 1, 1, 1])
+with col1:
+    history_prefix = st.text_input("Filtrar por nombre (prefijo):", key="history_prefix")
+with col2:
+    history_since = st.date_input("Desde:", value=None, key="history_since")
+with col3:
+    history_until = st.date_input("Hasta:", value=None, key="history_until")
+with col4:
+    history_page_size = st.selectbox("Por página:", [10, 20, 50, 100], index=1, key="history_page_size")
+
+# Al cambiar los filtros se vuelve a la primera página
+history_filters = (history_prefix, history_since, history_until, history_page_size)
+if st.session_state.get('history_filters') != history_filters:
+    st.session_state['history_filters'] = history_filters
+    st.session_state['history_cursors'] = [None]
+
+history_params = {"limit": history_page_size}
+if st.session_state['history_cursors'][-1] is not None:
+    history_params["cursor"] = st.session_state['history_cursors'][-1]
+if history_prefix:
+    history_params["prefix"] = history_prefix
+if history_since:
+    history_params["since"] = history_since.isoformat()
+if history_until:
+    # `until` es exclusivo: se incluye el día completo
+    history_params["until"] = (history_until + timedelta(days=1)).isoformat()
+
 try:
-    history_response = requests.get(f"{BACKEND_URL}/alignments")
-    if history_response.status_code == 200:
-        alignments = history_response.json()
-        if alignments:
-            for aln in alignments:
-                st.write(f"📂 {aln['filename']} - ⏰ {aln['created_at']}")
-
-                if st.button(f"🔍 Ver {aln['filename']}", key=f"view_{aln['id']}"):
-                    # cargar alineamiento específico
-                    detail = requests.get(f"{BACKEND_URL}/alignment/{aln['id']}")
-                    if detail.status_code == 200:
-                        data = detail.json()
-                        st.session_state['muscle_content'] = data['muscle_content']
-                        st.session_state['msa_content'] = data['msa_content']
-                        analyzer = MSAAnalyzer({})
-                        st.session_state['muscle_sequences'] = analyzer.parse_fasta_file(data['muscle_content'])
-                        st.session_state['msa_sequences'] = analyzer.parse_fasta_file(data['msa_content'])
-                        st.session_state['alignments_ready'] = True
-                        st.success(f"✅ Alineamiento {aln['filename']} cargado desde historial")
-        else:
-            st.info("No hay alineamientos guardados todavía.")
-    else:
-        st.warning("⚠️ No se pudo obtener el historial")
+    history_page = fetch_history(BACKEND_URL, tuple(sorted(history_params.items())))
+except requests.exceptions.HTTPError:
+    history_page = None
+    st.warning("⚠️ No se pudo obtener el historial")
 except Exception as e:
+    history_page = None
     st.error(f"Error al consultar historial: {str(e)}")
 
+if history_page is not None:
+    alignments = history_page["items"]
+    if alignments:
+        for aln in alignments:
+            # Dimensiones desde el resumen guardado (sin descargar el alineamiento)
+            size = (f" - 🧬 {aln['sequences']} secuencias × {aln['length']} columnas"
+                    if aln.get('sequences') is not None else "")
+            agreement = (f" - ⚖️ acuerdo {aln['agreement']:.0%}"
+                         if aln.get('agreement') is not None else "")
+            st.write(f"📂 {aln['filename']} - ⏰ {aln['created_at']}{size}{agreement}")
+
+            if st.button(f"🔍 Ver {aln['filename']}", key=f"view_{aln['id']}"):
+                # cargar alineamiento específico
+                # Solo dimensiones y nombres: el contenido se descarga en binario según se vea
+                backend = backend_client(BACKEND_URL)
+                detail = backend.get(f"alignment/{aln['id']}/info")
+                if detail.status_code == 200:
+                    # Métricas, identidad y conservación ya calculadas al guardarlo
+                    summary = backend.get(f"alignment/{aln['id']}/summary")
+                    comparison = backend.get(f"alignment/{aln['id']}/comparison")
+                    load_stored_alignment(detail.json(),
+                                          summary.json()["summaries"] if summary.status_code == 200 else None,
+                                          comparison.json() if comparison.status_code == 200 else None)
+                    st.session_state.pop('last_timings', None)
+                    st.success(f"✅ Alineamiento {aln['filename']} cargado desde historial")
+    else:
+        st.info("No hay alineamientos guardados todavía.")
+
+    # Controles de página
+    col1, col2, col3 = st.columns([1, 1, 4])
+    with col1:
+        if st.button("⬅️ Anterior", disabled=len(st.session_state['history_cursors']) == 1):
+            st.session_state['history_cursors'].pop()
+            st.rerun()
+    with col2:
+        if st.button("Siguiente ➡️", disabled=history_page["next_cursor"] is None):
+            st.session_state['history_cursors'].append(history_page["next_cursor"])
+            st.rerun()
+    with col3:
+        st.caption(f"Página {len(st.session_state['history_cursors'])}")
+
 if uploaded_file is not None:
     # Mostrar información del archivo
     st.success(f"✅ Archivo cargado: {uploaded_file.name}")
@@ -403,30 +711,38 @@ if uploaded_file is not None:
 
                             
                 if muscle_content and msa_content:
-                    # Parsear ambos alineamientos
-                    analyzer = MSAAnalyzer({})
-                    muscle_sequences = analyzer.parse_fasta_file(muscle_content)
-                    msa_sequences = analyzer.parse_fasta_file(msa_content)
-                                
-                    # Guardar en session state para persistencia
-                    st.session_state['muscle_sequences'] = muscle_sequences
-                    st.session_state['msa_sequences'] = msa_sequences
-                    st.session_state['muscle_content'] = muscle_content
-                    st.session_state['msa_content'] = msa_content
-                    st.session_state['alignments_ready'] = True
-
-                    # Guardar en la base de datos a través del backend
-                    save_payload = {
-                        "filename": uploaded_file.name,
-                        "muscle_content": st.session_state['muscle_content'],
-                        "msa_content": st.session_state['msa_content']
+                    # Parsear y codificar ambos alineamientos (una sola vez)
+                    load_alignments(muscle_content, msa_content, result.get('summaries'),
+                                    result.get('comparison'))
+                    st.session_state['last_timings'] = {
+                        'cached': result.get('cached', False),
+                        'stages': result.get('stages', {}),
+                        'aligners': result.get('timings', {}),
                     }
-                    save_response = requests.post(f"{BACKEND_URL}/save", json=save_payload)
+                    # El historial cacheado ya no incluye este alineamiento
+                    fetch_history.clear()
 
-                    if save_response.status_code == 200:
-                        st.success("🗄️ Alineamiento guardado en la base de datos!")
-                    else:
-                        st.warning("⚠️ No se pudo guardar el alineamiento en la base de datos")
+                    # El backend ya guardó el alineamiento en la base de datos
+                    st.success("🗄️ Alineamiento guardado en la base de datos!")
+
+# Tiempos por etapa del último alineamiento (los mide el backend)
+if st.session_state.get('last_timings'):
+    timings = st.session_state['last_timings']
+    with st.expander("⏱️ Tiempos del último alineamiento"):
+        pd = lazy_import("pandas")
+        if timings['cached']:
+            st.caption("Resultado servido desde la caché: no se ejecutaron los alineadores.")
+        if timings['stages']:
+            st.dataframe(pd.DataFrame({
+                'Etapa': list(timings['stages']),
+                'Segundos': list(timings['stages'].values()),
+            }), hide_index=True)
+        if timings['aligners']:
+            st.dataframe(pd.DataFrame([
+                {'Alineador': tool, 'Pared (s)': t['wall_time'], 'CPU (s)': t['cpu_time'],
+                 'Pico RSS (MB)': (t.get('max_rss') or 0) / 1024 ** 2}
+                for tool, t in timings['aligners'].items()
+            ]), hide_index=True)
 
 # Mostrar resultados si están disponibles
 if st.session_state.get('alignments_ready', False):
@@ -439,7 +755,7 @@ if st.session_state.get('alignments_ready', False):
     with col1:
         st.download_button(
             label="📥 Descargar MUSCLE (.fasta)",
-            data=st.session_state['muscle_content'],
+            data=fasta_download('muscle'),
             file_name="alignment_muscle.fasta",
             mime="text/plain"
         )
@@ -447,19 +763,25 @@ if st.session_state.get('alignments_ready', False):
     with col2:
         st.download_button(
             label="📥 Descargar MSA (.fasta)",
-            data=st.session_state['msa_content'],
+            data=fasta_download('msa'),
             file_name="alignment_msa.fasta",
             mime="text/plain"
         )
     
     # Pestañas para análisis
-    tab1, tab2 = st.tabs(["🔬 MUSCLE", "🧬 MSA"])
+    tab1, tab2, tab3 = st.tabs(["🔬 MUSCLE", "🧬 MSA", "⚖️ Comparación"])
     
+    stored_id = st.session_state.get('stored_alignment', {}).get('id')
     with tab1:
-        render_analysis_tab(st.session_state['muscle_sequences'], "MUSCLE", color_scheme)
+        render_analysis_tab(*tab_alignment('muscle'), "MUSCLE", color_scheme,
+                            full_key=f"full_{stored_id}_muscle", summary=tab_summary('muscle'))
     
     with tab2:
-        render_analysis_tab(st.session_state['msa_sequences'], "MSA", color_scheme)
+        render_analysis_tab(*tab_alignment('msa'), "MSA", color_scheme,
+                            full_key=f"full_{stored_id}_msa", summary=tab_summary('msa'))
+    
+    with tab3:
+        render_comparison_tab(st.session_state.get('comparison'))
 
 else:
     st.info("👆 Sube un archivo FASTA con secuencias sin alinear para comenzar el análisis.")
@@ -0,0 +1,5 @@
+"""Instante en que arranca el script del frontend: app.py lo importa antes
+que nada para medir cuánto tardan sus imports iniciales."""
+import time
+
+STARTED = time.perf_counter()
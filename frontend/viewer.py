@@ -0,0 +1,113 @@
+import functools
+
+import numpy as np
+
+from analysis import PAD
+
+# Esquemas de coloración para aminoácidos
+COLOR_SCHEMES = {
+    'Clustal': {
+        'A': '#80a0f0', 'R': '#f01505', 'N': '#00ff00', 'D': '#c048c0',
+        'C': '#f08080', 'Q': '#00ff00', 'E': '#c048c0', 'G': '#f09048',
+        'H': '#15a4a4', 'I': '#80a0f0', 'L': '#80a0f0', 'K': '#f01505',
+        'M': '#80a0f0', 'F': '#80a0f0', 'P': '#ffff00', 'S': '#00ff00',
+        'T': '#00ff00', 'W': '#80a0f0', 'Y': '#15a4a4', 'V': '#80a0f0',
+        '-': '#ffffff', 'X': '#ffffff'
+    },
+    'Hydrophobicity': {
+        'A': '#ad0052', 'R': '#0000ff', 'N': '#0c00f3', 'D': '#0c00f3',
+        'C': '#c2003d', 'Q': '#0c00f3', 'E': '#0c00f3', 'G': '#6a0095',
+        'H': '#1500ea', 'I': '#ff0000', 'L': '#ea0015', 'K': '#0000ff',
+        'M': '#b0004f', 'F': '#cb0034', 'P': '#4600b9', 'S': '#5e00a1',
+        'T': '#61009e', 'W': '#4f00b0', 'Y': '#1500ea', 'V': '#f60009',
+        '-': '#ffffff', 'X': '#ffffff'
+    },
+    'Chemistry': {
+        'A': '#c8c8c8', 'R': '#145aff', 'N': '#00dcdc', 'D': '#e60a0a',
+        'C': '#e6e600', 'Q': '#00dcdc', 'E': '#e60a0a', 'G': '#ebebeb',
+        'H': '#8282d2', 'I': '#0f820f', 'L': '#0f820f', 'K': '#145aff',
+        'M': '#e6e600', 'F': '#3232aa', 'P': '#dc9682', 'S': '#fa9600',
+        'T': '#fa9600', 'W': '#b45ab4', 'Y': '#3232aa', 'V': '#0f820f',
+        '-': '#ffffff', 'X': '#ffffff'
+    }
+}
+
+# Por encima de estos tamaños de ventana las letras no se leen (o cuestan
+# demasiados textos de matplotlib): solo color
+MAX_LETTER_COLUMNS = 120
+MAX_LETTER_ROWS = 60
+MAX_LETTER_CELLS = 3000
+
+# Tamaño fijo de la figura (pulgadas): no crece con la ventana
+FIGURE_WIDTH = 15
+ROW_HEIGHT = 0.3
+MAX_FIGURE_HEIGHT = 18
+
+
+@functools.lru_cache(maxsize=None)
+def color_lut(color_scheme):
+    """Tabla 256 x 3 (uint8) byte de residuo → color RGB del esquema"""
+    from matplotlib.colors import to_rgb
+
+    colors = COLOR_SCHEMES[color_scheme]
+    lut = np.full((256, 3), 255, dtype=np.uint8)
+    for aa, hex_color in colors.items():
+        rgb = np.round(np.array(to_rgb(hex_color)) * 255).astype(np.uint8)
+        lut[ord(aa)] = rgb
+        lut[ord(aa.lower())] = rgb
+    lut[PAD] = 255
+    return lut
+
+
+def render_window(window, color_scheme):
+    """Imagen RGB (filas x columnas x 3) de una ventana del alineamiento.
+
+    Es una sola indexación de la tabla de colores: el coste depende del
+    tamaño de la ventana, no del alineamiento completo.
+    """
+    return color_lut(color_scheme)[window]
+
+
+def create_msa_visualization(alignment, color_scheme='Clustal', start_pos=0, end_pos=100,
+                             row_start=0, row_end=None):
+    """Crea visualización del MSA (una ventana de columnas y filas)"""
+    row_end = alignment.n_sequences if row_end is None else min(row_end, alignment.n_sequences)
+    end_pos = min(end_pos, alignment.length)
+    n_rows = row_end - row_start
+    n_cols = end_pos - start_pos
+
+    # Solo se lee la ventana: en un alineamiento remoto se pide únicamente esa parte
+    window = alignment.window(start_pos, end_pos, row_start, row_end)
+    image = render_window(window, color_scheme)
+    fig_height = min(MAX_FIGURE_HEIGHT, max(2, n_rows * ROW_HEIGHT + 1.5))
+    # matplotlib se importa al dibujar la primera ventana, no al arrancar la app
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(FIGURE_WIDTH, fig_height))
+    ax.imshow(image, aspect='auto', interpolation='nearest',
+              extent=(0, n_cols, n_rows, 0))
+
+    # Letras solo cuando la ventana es lo bastante pequeña para leerlas
+    if (n_cols <= MAX_LETTER_COLUMNS and n_rows <= MAX_LETTER_ROWS
+            and n_cols * n_rows <= MAX_LETTER_CELLS):
+        fontsize = 8 if n_cols <= 60 else 6
+        for i in range(n_rows):
+            for j, aa in enumerate(window[i].tobytes().decode("ascii")):
+                if aa != chr(PAD):
+                    ax.text(j + 0.5, i + 0.5, aa, ha='center', va='center',
+                            fontsize=fontsize, fontweight='bold')
+
+    # Configurar ejes
+    names = alignment.names[row_start:row_end]
+    ax.set_yticks([i + 0.5 for i in range(n_rows)])
+    ax.set_yticklabels(names, fontsize=8 if n_rows <= MAX_LETTER_ROWS else 5)
+    ax.set_xlabel('Posición en el alineamiento')
+    ax.set_title(f'Alineamiento Múltiple de Secuencias ({color_scheme})')
+
+    # Añadir números de posición
+    step = max(1, n_cols // 20)
+    ax.set_xticks([x + 0.5 for x in range(0, n_cols, step)])
+    ax.set_xticklabels(range(start_pos + 1, end_pos + 1, step))
+
+    plt.tight_layout()
+    return fig
@@ -0,0 +1,105 @@
+"""Utilidades comunes de los tests.
+
+Los servicios son módulos sueltos (backend/aligner.py, backend/cache.py...)
+que se importan por su nombre, como en sus contenedores. db/app.py y
+backend/app.py se llaman igual: la app de la DB se carga con un nombre propio.
+"""
+import importlib.util
+import os
+import stat
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+for path in (os.path.join(ROOT, "db"), os.path.join(ROOT, "backend"), ROOT):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+def load_module(name, path):
+    """Importa un archivo con un nombre propio"""
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class Response:
+    """Respuesta de Flask con la interfaz de requests que usan los clientes"""
+
+    def __init__(self, resp):
+        self.status_code = resp.status_code
+        self.content = resp.get_data()
+        self.text = resp.get_data(as_text=True)
+
+    def json(self):
+        import json
+        return json.loads(self.text)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}: {self.text[:200]}")
+
+
+class FlaskClient:
+    """common.http.Client sobre el cliente de pruebas de Flask (sin red)"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+        self.requests = []
+
+    def request(self, method, path, params=None, json=None, data=None, **kwargs):
+        self.requests.append((method, path))
+        if hasattr(data, "read"):
+            data = data.read()
+        return Response(self.client.open("/" + path.lstrip("/"), method=method,
+                                         query_string=params, json=json, data=data))
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    def put(self, path, **kwargs):
+        return self.request("PUT", path, **kwargs)
+
+
+@pytest.fixture
+def db_app(tmp_path, monkeypatch):
+    """Servicio db sobre una base SQLite nueva (init_db corre al importarlo)"""
+    monkeypatch.setenv("DB_PATH", str(tmp_path / "alignments.db"))
+    module = load_module("db_app", os.path.join(ROOT, "db", "app.py"))
+    yield module
+    module.pool.close_all()
+
+
+@pytest.fixture
+def db_client(db_app):
+    return FlaskClient(db_app.app)
+
+
+@pytest.fixture
+def fake_aligner(tmp_path, monkeypatch):
+    """Alineador sustituto: reserva y toca `ALLOC_MB` MB, espera
+    `HOLD_SECONDS` y copia el input a la salida"""
+    import aligner
+    script = tmp_path / "fake_aligner.py"
+    script.write_text(
+        f"#!{sys.executable}\n"
+        "import os, shutil, sys, time\n"
+        "args = [a for a in sys.argv[1:] if not a.startswith('-')]\n"
+        "block = bytearray(int(os.environ.get('ALLOC_MB', '0')) * 1024 * 1024)\n"
+        "for i in range(0, len(block), 4096):\n"
+        "    block[i] = 1\n"
+        "time.sleep(float(os.environ.get('HOLD_SECONDS', '0')))\n"
+        "shutil.copy(args[0], args[1])\n"
+    )
+    script.chmod(script.stat().st_mode | stat.S_IXUSR)
+    monkeypatch.setattr(aligner, "MUSCLE_EXE", str(script))
+    monkeypatch.setattr(aligner, "MSA_EXE", str(script))
+    input_path = tmp_path / "in.fasta"
+    input_path.write_text(">s1\nACGT\n")
+    return str(input_path), str(tmp_path / "out")
@@ -0,0 +1,51 @@
+import os
+import signal
+import threading
+
+import pytest
+
+import aligner
+from aligner import AlignmentCancelled, AlignmentError, AlignmentTimeout, _supervise, _ToolRun, run_aligners
+
+
+def test_runs_both_tools(fake_aligner):
+    input_path, prefix = fake_aligner
+    results = run_aligners(input_path, prefix)
+    assert set(results) == {"muscle", "msaligner"}
+    for stats in results.values():
+        assert stats["returncode"] == 0
+        assert stats["wall_time"] > 0
+        with open(stats["output"]) as f:
+            assert f.read() == ">s1\nACGT\n"
+
+
+def test_timeout_kills_and_removes_outputs(fake_aligner, monkeypatch):
+    input_path, prefix = fake_aligner
+    monkeypatch.setenv("HOLD_SECONDS", "30")
+    with pytest.raises(AlignmentTimeout):
+        run_aligners(input_path, prefix, timeouts={"muscle": 0.5})
+    assert not os.path.exists(prefix + "_muscle.fasta")
+    assert not os.path.exists(prefix + "_msa.fasta")
+
+
+def test_failed_start_stops_started_runs(fake_aligner, monkeypatch, tmp_path):
+    input_path, prefix = fake_aligner
+    monkeypatch.setenv("HOLD_SECONDS", "30")
+    runs = [
+        _ToolRun("muscle", [aligner.MUSCLE_EXE, input_path, prefix + "_a"], prefix + "_a", None),
+        _ToolRun("msaligner", [str(tmp_path / "missing")], prefix + "_b", None),
+    ]
+    with pytest.raises(AlignmentError, match="no se pudo ejecutar"):
+        _supervise(runs, None)
+    assert runs[0].done.is_set()
+    assert runs[0].returncode == -signal.SIGKILL
+
+
+def test_kill_while_exiting_does_not_raise():
+    # kill() puede llegar justo cuando el proceso termina y se recoge
+    for _ in range(20):
+        run = _ToolRun("true", ["true"], None, None)
+        run.start(threading.Event())
+        while not run.done.is_set():
+            run.kill(AlignmentCancelled)
+        assert run.returncode in (0, -signal.SIGKILL)
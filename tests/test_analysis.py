@@ -0,0 +1,135 @@
+import itertools
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from common.analysis import compare, conservation_scores, identity_matrix, summarize
+from common.fasta import encode_sequences
+
+RESIDUES = "ACDEFGHIKLMNPQRSTVWY"
+
+
+def random_alignment(rng, n, length, gap_rate=0.2):
+    alphabet = list(RESIDUES[:6])
+    rows = ["".join("-" if rng.random() < gap_rate else rng.choice(alphabet) for _ in range(length))
+            for _ in range(n)]
+    return rows, encode_sequences(rows)
+
+
+def regap(rng, sequences, length):
+    """Otro alineamiento de las mismas secuencias: gaps en posiciones al azar"""
+    rows = []
+    for seq in sequences:
+        slots = sorted(rng.choice(length, len(seq), replace=False))
+        row = ["-"] * length
+        for slot, residue in zip(slots, seq):
+            row[slot] = residue
+        rows.append("".join(row))
+    return rows
+
+
+# Implementaciones originales (bucles de Python) como referencia
+
+def loop_identity(rows):
+    n = len(rows)
+    identity = np.zeros((n, n))
+    for i in range(n):
+        for j in range(n):
+            if i == j:
+                identity[i][j] = 100.0
+            else:
+                matches = sum(1 for a, b in zip(rows[i], rows[j]) if a == b and a != '-' and b != '-')
+                valid = sum(1 for a, b in zip(rows[i], rows[j]) if a != '-' or b != '-')
+                identity[i][j] = (matches / valid * 100) if valid > 0 else 0
+    return identity
+
+
+def loop_conservation(rows):
+    scores = []
+    for pos in range(len(rows[0])):
+        residues = [row[pos] for row in rows if row[pos] != '-']
+        if residues:
+            total = len(residues)
+            entropy = -sum((c / total) * np.log2(c / total) for c in Counter(residues).values())
+            max_entropy = np.log2(min(20, len(set(residues))))
+            scores.append(1 - (entropy / max_entropy if max_entropy > 0 else 0))
+        else:
+            scores.append(0)
+    return scores
+
+
+def aligned_pairs(rows):
+    """Pares de residuos ((secuencia, índice), (secuencia, índice)) que comparten columna"""
+    columns = {}
+    for s, row in enumerate(rows):
+        k = 0
+        for col, c in enumerate(row):
+            if c != "-":
+                columns.setdefault(col, []).append((s, k))
+                k += 1
+    return {pair for members in columns.values() for pair in itertools.combinations(members, 2)}
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_identity_matches_loop(seed):
+    rows, matrix = random_alignment(np.random.default_rng(seed), 9, 60)
+    np.testing.assert_allclose(identity_matrix(matrix, chunk_cells=50), loop_identity(rows))
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_conservation_matches_loop(seed):
+    rows, matrix = random_alignment(np.random.default_rng(seed), 12, 80, gap_rate=0.4)
+    rows[0] = "-" * 80
+    rows[1] = rows[1][:10] + "-" * 70
+    matrix = encode_sequences(rows)
+    np.testing.assert_allclose(conservation_scores(matrix, chunk_cells=100), loop_conservation(rows))
+
+
+def test_summarize_counts():
+    matrix = encode_sequences(["AC-A", "AC-T", "ACGT"])
+    summary = summarize(matrix, max_identity=2)
+    assert (summary["sequences"], summary["length"]) == (3, 4)
+    assert summary["gap_fraction"] == round(2 / 12, 6)
+    assert summary["highly_conserved"] == 3
+    assert summary["identity"] is None
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_compare_matches_pair_counts(seed):
+    rng = np.random.default_rng(seed)
+    rows_a, matrix_a = random_alignment(rng, 8, 40, gap_rate=0.3)
+    sequences = [row.replace("-", "") for row in rows_a]
+    rows_b = regap(rng, sequences, 45)
+    names = [f"s{i} desc" for i in range(8)]
+    # B devuelve las secuencias en otro orden y sin la descripción
+    order = rng.permutation(8)
+    result = compare(names, matrix_a, [f"s{i}" for i in order],
+                     encode_sequences([rows_b[i] for i in order]))
+
+    pairs_a, pairs_b = aligned_pairs(rows_a), aligned_pairs(rows_b)
+    common = pairs_a & pairs_b
+    assert result["sequences"] == 8
+    assert result["sp"]["b_vs_a"] == pytest.approx(len(common) / len(pairs_a), abs=1e-6)
+    assert result["sp"]["a_vs_b"] == pytest.approx(len(common) / len(pairs_b), abs=1e-6)
+    assert result["sp_symmetric"] == pytest.approx(2 * len(common) / (len(pairs_a) + len(pairs_b)),
+                                                   abs=1e-6)
+    for s, divergence in enumerate(result["divergence"]):
+        mine_a = {p for p in pairs_a if s in (p[0][0], p[1][0])}
+        mine_b = {p for p in pairs_b if s in (p[0][0], p[1][0])}
+        union = mine_a | mine_b
+        expected = 1 - len(mine_a & mine_b) / len(union) if union else 0.0
+        assert divergence == pytest.approx(expected, abs=1e-4)
+
+
+def test_compare_identical_and_unmatched():
+    rows = ["AC-GT", "ACAGT", "A--GT"]
+    matrix = encode_sequences(rows)
+    result = compare(["a", "b", "c"], matrix, ["a", "b", "x"], matrix)
+    assert result["sp_symmetric"] == 1.0
+    assert result["tc"] == {"b_vs_a": 1.0, "a_vs_b": 1.0}
+    assert result["unmatched"] == ["c", "x"]
+
+    result = compare(["a", "b"], matrix[:2], ["a", "b"], encode_sequences(["AC-GT", "ACAG-"]))
+    assert result["mismatched"] == ["b"]
+    assert result["sequences"] == 1
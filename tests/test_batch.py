@@ -0,0 +1,75 @@
+import os
+import threading
+
+import batch
+from batch import BatchEntry, remove_inputs, run_batch
+from jobs import DONE, FAILED, RUNNING
+from scheduler import FAST, Scheduler
+
+
+def entries(tmp_path, count):
+    result = []
+    for i in range(count):
+        path = tmp_path / f"{i}.fasta"
+        path.write_text(f">s{i}\nACGT\n")
+        result.append(BatchEntry(i, f"{i}.fasta", str(path), f"digest{i}", FAST, None, None))
+    return result
+
+
+def align(path, digest, limits, cancel_event=None):
+    os.remove(path)
+    return digest
+
+
+def run(generator, timeout=5):
+    """Consume el lote en un hilo aparte para no colgar el test si no termina"""
+    results = []
+    thread = threading.Thread(target=lambda: results.extend(generator), daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "el lote no terminó"
+    return results
+
+
+def test_run_batch_runs_every_entry(tmp_path):
+    lanes = Scheduler(2, 1)
+    results = run(run_batch(lanes, entries(tmp_path, 5), align, concurrency=2))
+    assert sorted(entry.index for entry, _ in results) == [0, 1, 2, 3, 4]
+    assert all(job.status == DONE and job.result == entry.digest for entry, job in results)
+    # Los trabajos internos no se quedan registrados
+    assert lanes.lanes[FAST]._jobs == {}
+
+
+def test_closed_lane_fails_remaining_entries(tmp_path):
+    lanes = Scheduler(1, 1)
+    lanes.lanes[FAST].close()
+    batch = entries(tmp_path, 3)
+    results = run(run_batch(lanes, batch, align, concurrency=2))
+    assert [job.status for _, job in results] == [FAILED] * 3
+    assert "cerrada" in results[0][1].error
+    assert not any(os.path.exists(entry.path) for entry in batch)
+
+
+def test_full_lane_fails_remaining_entries_after_timeout(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch, "BATCH_RETRY_INTERVAL", 0.01)
+    monkeypatch.setattr(batch, "BATCH_QUEUE_TIMEOUT", 0.1)
+    release = threading.Event()
+    lanes = Scheduler(1, 1)
+    # Otro cliente ocupa el carril: un trabajo corriendo y otro en espera
+    busy = lanes.lanes[FAST].submit(lambda cancel_event=None: release.wait(5))
+    while busy.status != RUNNING:
+        threading.Event().wait(0.01)
+    lanes.lanes[FAST].submit(lambda cancel_event=None: release.wait(5))
+    batch_entries = entries(tmp_path, 2)
+    results = run(run_batch(lanes, batch_entries, align, concurrency=2))
+    release.set()
+    assert [job.status for _, job in results] == [FAILED] * 2
+    assert "llena" in results[0][1].error
+    assert not any(os.path.exists(entry.path) for entry in batch_entries)
+
+
+def test_remove_inputs_tolerates_missing_files(tmp_path):
+    path = tmp_path / "a.fasta"
+    path.write_text(">a\nA\n")
+    remove_inputs([str(path), str(path), None, str(tmp_path / "missing.fasta")])
+    assert not path.exists()
@@ -0,0 +1,71 @@
+import random
+
+import cache
+from cache import ResultCache, cache_key
+
+
+def random_fasta(seed, n=4, length=400):
+    rng = random.Random(seed)
+    return "".join(f">s{i}\n{''.join(rng.choice('ACGT') for _ in range(length))}\n" for i in range(n))
+
+
+def test_cache_key_depends_on_fasta_and_aligners(monkeypatch):
+    monkeypatch.setattr(cache, "aligner_fingerprint", lambda: {"muscle": {"version": "5.1"}})
+    key = cache_key("a" * 64)
+    assert key == cache_key("a" * 64)
+    assert key != cache_key("b" * 64)
+
+    monkeypatch.setattr(cache, "aligner_fingerprint", lambda: {"muscle": {"version": "5.2"}})
+    assert cache_key("a" * 64) != key
+
+
+def test_result_cache_roundtrip(db_client):
+    results = ResultCache(db_client)
+    assert results.lookup("k1") is None
+    results.store("k1", "ACGT", "AC-GT")
+    assert results.lookup("k1") == {"muscle_content": "ACGT", "msa_content": "AC-GT"}
+    refs = results.lookup("k1", refs=True)
+    assert set(refs) == {"muscle_blob", "msa_blob"}
+    assert results.stats()["hits"] == 2
+    assert results.stats()["misses"] == 1
+
+
+def test_result_cache_evicts_least_recently_used(db_app, db_client):
+    results = ResultCache(db_client)
+    results.store("a", random_fasta(1), random_fasta(2))
+    results.store("b", random_fasta(3), random_fasta(4))
+    entry_size = results.stats()["bytes"] / 2
+    b_refs = results.lookup("b", refs=True)
+    # "a" pasa a ser la más reciente: al no caber tres entradas sale "b"
+    assert results.lookup("a") is not None
+    db_app.CACHE_MAX_BYTES = int(entry_size * 2.5)
+
+    results.store("c", random_fasta(5), random_fasta(6))
+    assert results.lookup("b") is None
+    assert results.lookup("a") is not None
+    assert results.lookup("c") is not None
+    stats = results.stats()
+    assert stats["evictions"] == 1
+    assert stats["entries"] == 2
+    # Sus blobs ya no los referencia nadie: se borran con la entrada
+    assert db_client.get(f"blobs/{b_refs['muscle_blob']}").status_code == 404
+
+
+def test_cache_refs_point_to_streamed_blobs(db_client):
+    digest = db_client.post("blobs", data=random_fasta(7).encode()).json()["hash"]
+    assert db_client.put("cache/k", json={"muscle_blob": digest, "msa_blob": digest}).status_code == 200
+    assert ResultCache(db_client).lookup("k", refs=True) == {"muscle_blob": digest, "msa_blob": digest}
+    assert db_client.get(f"blobs/{digest}").text == random_fasta(7)
+    assert db_client.get(f"blobs/{'0' * 64}").status_code == 404
+
+
+def test_result_cache_failures_are_misses():
+    class Down:
+        def get(self, path, **kwargs):
+            raise ConnectionError("sin DB")
+
+        put = get
+
+    results = ResultCache(Down())
+    assert results.lookup("k") is None
+    results.store("k", "A", "A")
@@ -0,0 +1,95 @@
+import os
+import sqlite3
+
+from conftest import ROOT, load_module
+
+ALIGNMENT = ">s1\nAC-GT\n>s2\nACAGT\n"
+
+
+def save(client, filename, created_at, muscle=ALIGNMENT, msa=ALIGNMENT):
+    resp = client.post("save", json={"filename": filename, "created_at": created_at,
+                                     "muscle_content": muscle, "msa_content": msa})
+    assert resp.status_code == 200
+
+
+def pages(client, **params):
+    cursor, seen = None, []
+    while True:
+        body = client.get("list", params={**params, "cursor": cursor}).json()
+        seen.append([item["id"] for item in body["items"]])
+        cursor = body["next_cursor"]
+        if cursor is None:
+            return seen
+
+
+def test_list_keyset_pages(db_client):
+    for i in range(7):
+        save(db_client, f"f{i}.fasta", f"2024-01-0{i + 1}T00:00:00")
+
+    assert pages(db_client, limit=3) == [[7, 6, 5], [4, 3, 2], [1]]
+    first = db_client.get("list", params={"limit": 1}).json()["items"][0]
+    assert first["filename"] == "f6.fasta"
+    assert (first["sequences"], first["length"], first["agreement"]) == (2, 5, 1.0)
+
+
+def test_list_filters(db_client):
+    for i, name in enumerate(["alpha.fa", "alpine.fa", "beta.fa", "alpha2.fa"]):
+        save(db_client, name, f"2024-02-0{i + 1}T00:00:00")
+
+    assert pages(db_client, prefix="alp", limit=2) == [[4, 2], [1]]
+    assert pages(db_client, since="2024-02-02", until="2024-02-04") == [[3, 2]]
+    assert db_client.get("list", params={"limit": "x"}).status_code == 400
+    assert db_client.get("list", params={"cursor": "abc"}).status_code == 400
+
+
+def test_save_is_idempotent_by_key(db_client):
+    item = {"filename": "a.fa", "muscle_content": ALIGNMENT, "msa_content": ALIGNMENT,
+            "save_key": "k1"}
+    first = db_client.post("save_bulk", json={"items": [item]}).json()
+    again = db_client.post("save_bulk", json={"items": [item]}).json()
+    assert first["ids"] == again["ids"]
+    assert len(db_client.get("list").json()["items"]) == 1
+
+
+def test_deferred_analysis_is_computed_on_demand(db_app, db_client):
+    item = {"filename": "big.fa", "muscle_content": ALIGNMENT, "msa_content": ALIGNMENT,
+            "defer_analysis": True}
+    aln_id = db_client.post("save_bulk", json={"items": [item]}).json()["ids"][0]
+    with db_app.pooled_connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM summaries").fetchone()[0] == 0
+        assert conn.execute("SELECT COUNT(*) FROM comparisons").fetchone()[0] == 0
+
+    summary = db_client.get(f"get/{aln_id}/summary").json()["summaries"]["muscle"]
+    assert (summary["sequences"], summary["length"]) == (2, 5)
+    assert db_client.get(f"get/{aln_id}/comparison").json()["sp_symmetric"] == 1.0
+
+
+def test_init_migrates_plain_text_rows(tmp_path, monkeypatch):
+    path = tmp_path / "old.db"
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE alignments (id INTEGER PRIMARY KEY AUTOINCREMENT, filename TEXT, "
+                 "muscle_content TEXT, msa_content TEXT, created_at TEXT)")
+    conn.executemany("INSERT INTO alignments (filename, muscle_content, msa_content, created_at) "
+                     "VALUES (?, ?, ?, ?)",
+                     [("a.fa", ALIGNMENT, ALIGNMENT, "2024-01-01"),
+                      ("b.fa", ">x\nAAAA\n", ALIGNMENT, "2024-01-02")])
+    conn.commit()
+    conn.close()
+
+    monkeypatch.setenv("DB_PATH", str(path))
+    db = load_module("db_app_migrated", os.path.join(ROOT, "db", "app.py"))
+    try:
+        conn = sqlite3.connect(path)
+        rows = conn.execute("SELECT muscle_content, msa_content, muscle_blob, msa_blob "
+                            "FROM alignments ORDER BY id").fetchall()
+        # Mismo contenido → un solo blob
+        assert conn.execute("SELECT COUNT(*) FROM blobs").fetchone()[0] == 2
+        conn.close()
+        assert all(r[0] is None and r[1] is None and r[2] and r[3] for r in rows)
+        assert rows[0][2] == rows[0][3] == rows[1][3]
+
+        with db.app.test_client() as client:
+            assert client.get("/get/2").get_json()["muscle_content"] == ">x\nAAAA\n"
+            assert client.get("/get/1/summary").get_json()["summaries"]["muscle"]["sequences"] == 2
+    finally:
+        db.pool.close_all()
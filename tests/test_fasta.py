@@ -0,0 +1,74 @@
+import pytest
+
+from common.fasta import (FastaError, FastaTooLarge, encode_sequences, iter_fasta,
+                          map_file, parse_alignment, scan_fasta)
+
+
+def write(tmp_path, data, name="input.fasta"):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_iter_fasta_multiline_and_crlf():
+    data = b">s1 primera\r\nACGT\r\nAC\r\n>s2\r\nGG-T\r\n"
+    assert list(iter_fasta(data)) == [("s1 primera", b"ACGTAC"), ("s2", b"GG-T")]
+
+
+def test_iter_fasta_rejects_duplicate_ids():
+    with pytest.raises(FastaError, match="duplicado: 's1'"):
+        list(iter_fasta(b">s1 a\nAC\n>s1 b\nGT\n"))
+    # Los alineadores pueden repetir nombres: se acepta si se pide
+    assert len(list(iter_fasta(b">s1\nAC\n>s1\nGT\n", unique_ids=False))) == 2
+
+
+def test_iter_fasta_rejects_invalid_alphabet():
+    with pytest.raises(FastaError, match="'1'"):
+        list(iter_fasta(b">s1\nAC1T\n"))
+    assert list(iter_fasta(b">s1\nAC1T\n", check_alphabet=False)) == [("s1", b"AC1T")]
+
+
+@pytest.mark.parametrize("data", [b"ACGT\n", b"texto\n>s1\nAC\n", b">\nAC\n"])
+def test_iter_fasta_rejects_malformed(data):
+    with pytest.raises(FastaError):
+        list(iter_fasta(data))
+
+
+def test_iter_fasta_blank_input(tmp_path):
+    assert list(iter_fasta(b" \r\n\t\n")) == []
+    assert list(iter_fasta(b"\n\n>s1\nAC\n")) == [("s1", b"AC")]
+    # Sobre un mmap (map_file) sin cabeceras
+    with pytest.raises(FastaError, match="no contiene cabeceras"):
+        list(iter_fasta(map_file(write(tmp_path, b"\n" * 100000 + b"ACGT\n"))))
+
+
+def test_scan_fasta_digest_ignores_line_format(tmp_path):
+    plain = scan_fasta(write(tmp_path, b">s1\nACGTAC\n>s2\nGGT\n", "a.fasta"))
+    wrapped = scan_fasta(write(tmp_path, b">s1\r\nACG\r\nTAC\r\n>s2\r\nGGT", "b.fasta"))
+    assert plain == wrapped
+    assert (plain.sequences, plain.residues, plain.max_length) == (2, 9, 6)
+
+
+def test_scan_fasta_limits(tmp_path):
+    path = write(tmp_path, b">s1\nACGTAC\n>s2\nGGT\n")
+    with pytest.raises(FastaTooLarge, match="secuencias"):
+        scan_fasta(path, max_sequences=1)
+    with pytest.raises(FastaTooLarge, match="residuos"):
+        scan_fasta(path, max_residues=8)
+    with pytest.raises(FastaTooLarge, match="'s1'"):
+        scan_fasta(path, max_length=5)
+    with pytest.raises(FastaTooLarge, match="bytes"):
+        scan_fasta(path, max_bytes=10)
+
+
+def test_scan_fasta_rejects_empty(tmp_path):
+    with pytest.raises(FastaError, match="vacía"):
+        scan_fasta(write(tmp_path, b">s1\n>s2\nAC\n"))
+    with pytest.raises(FastaError, match="no contiene secuencias"):
+        scan_fasta(write(tmp_path, b""))
+
+
+def test_parse_alignment_pads_short_rows():
+    headers, matrix = parse_alignment(b">a\nAC-T\n>b\nAC\n")
+    assert headers == ["a", "b"]
+    assert matrix.tolist() == encode_sequences([b"AC-T", b"AC\0\0"]).tolist()
@@ -0,0 +1,108 @@
+import threading
+
+import pytest
+
+from jobs import CANCELLED, DONE, FAILED, RUNNING, JobQueue, JobQueueFull
+
+
+def blocking(release):
+    def fn(value, cancel_event=None):
+        while not release.wait(0.01):
+            if cancel_event.is_set():
+                raise RuntimeError("cancelado")
+        return value
+    return fn
+
+
+def wait_status(job, status, timeout=5):
+    for _ in range(int(timeout / 0.01)):
+        if job.status == status:
+            return
+        threading.Event().wait(0.01)
+    raise AssertionError(f"{job.status} != {status}")
+
+
+def test_submit_runs_job_and_keeps_result():
+    jobs = JobQueue(workers=2, max_queued=4)
+    job = jobs.submit(lambda x, cancel_event=None: x * 2, 21)
+    assert job.wait(5) == 42
+    assert job.status == DONE
+    assert jobs.get(job.id) is job
+
+
+def test_failure_is_recorded():
+    def fail(cancel_event=None):
+        raise ValueError("roto")
+
+    job = JobQueue(workers=1, max_queued=1).submit(fail)
+    with pytest.raises(ValueError):
+        job.wait(5)
+    assert job.status == FAILED
+    assert job.error == "roto"
+
+
+def test_full_queue_rejects_without_registering():
+    release = threading.Event()
+    jobs = JobQueue(workers=1, max_queued=1)
+    running = jobs.submit(blocking(release), 1)
+    wait_status(running, RUNNING)
+    jobs.submit(blocking(release), 2)
+
+    with pytest.raises(JobQueueFull) as error:
+        jobs.submit(blocking(release), 3)
+    assert error.value.stats == {"workers": 1, "running": 1, "queued": 1, "max_queued": 1}
+    assert len(jobs.pending()) == 2
+    release.set()
+
+
+def test_cancel_queued_job_discards_it():
+    release = threading.Event()
+    discarded = []
+    jobs = JobQueue(workers=1, max_queued=2)
+    running = jobs.submit(blocking(release), 1)
+    wait_status(running, RUNNING)
+    queued = jobs.submit(blocking(release), 2, discard=lambda: discarded.append(2))
+
+    jobs.cancel(queued.id)
+    release.set()
+    assert running.wait(5) == 1
+    queued.finished.wait(5)
+    assert queued.status == CANCELLED
+    assert queued.result is None
+    assert discarded == [2]
+
+
+def test_cancel_running_job():
+    release = threading.Event()
+    discarded = []
+    jobs = JobQueue(workers=1, max_queued=1)
+    job = jobs.submit(blocking(release), 1, discard=lambda: discarded.append(1))
+    wait_status(job, RUNNING)
+
+    jobs.cancel(job.id)
+    job.finished.wait(5)
+    assert job.status == CANCELLED
+    # Ya empezó: liberar sus temporales es cosa de fn
+    assert discarded == []
+
+
+def test_closed_queue_rejects_new_jobs():
+    jobs = JobQueue(workers=1, max_queued=1)
+    jobs.close()
+    with pytest.raises(JobQueueFull):
+        jobs.submit(lambda cancel_event=None: None)
+
+
+def test_internal_jobs_are_forgotten_when_finished():
+    release = threading.Event()
+    jobs = JobQueue(workers=1, max_queued=1)
+    job = jobs.submit(blocking(release), "resultado grande", keep=False)
+    wait_status(job, RUNNING)
+    # Mientras corre sigue registrado (se puede cancelar y el cierre lo espera)
+    assert jobs.get(job.id) is job
+    assert jobs.pending() == [job]
+
+    release.set()
+    assert job.wait(5) == "resultado grande"
+    assert jobs.get(job.id) is None
+    assert jobs._jobs == {}
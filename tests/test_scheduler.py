@@ -0,0 +1,55 @@
+import os
+
+import pytest
+
+from aligner import AlignmentOutOfMemory, run_aligners
+from common.fasta import FastaStats
+from scheduler import FAST, LARGE, AdmissionRejected, Scheduler, estimate_job
+
+MB = 1024 ** 2
+
+
+def scheduler(**kwargs):
+    return Scheduler(1, 1, large_seconds=10, max_seconds=600, max_memory=4096 * MB, **kwargs)
+
+
+def test_admission_by_estimate():
+    lanes = scheduler()
+    small = estimate_job(FastaStats(10, 1000, 100, "x"))
+    assert lanes.admit(small) == FAST
+    assert lanes.admit(small._replace(seconds=60)) == LARGE
+    with pytest.raises(AdmissionRejected):
+        lanes.admit(small._replace(seconds=601))
+    with pytest.raises(AdmissionRejected):
+        lanes.admit(small._replace(memory=4097 * MB))
+
+
+def test_limits_follow_the_estimate():
+    lanes = scheduler(threads=8)
+    small = estimate_job(FastaStats(10, 1000, 100, "x"))
+    # Trabajos pequeños: el mínimo, con la CPU de todos los hilos
+    assert lanes.limits(small) == {"cpu": 30 * 8, "memory": 512 * MB}
+
+    big = small._replace(seconds=100, memory=300 * MB)
+    assert lanes.limits(big) == {"cpu": 400 * 8, "memory": 1200 * MB}
+    # Nunca por encima de los presupuestos
+    huge = small._replace(seconds=500, memory=2000 * MB)
+    assert lanes.limits(huge) == {"cpu": 600 * 8, "memory": 4096 * MB}
+
+
+def test_run_within_limits(fake_aligner, monkeypatch):
+    input_path, prefix = fake_aligner
+    monkeypatch.setenv("ALLOC_MB", "20")
+    results = run_aligners(input_path, prefix, limits={"cpu": 60, "memory": 512 * MB})
+    assert all(r["returncode"] == 0 for r in results.values())
+    assert results["muscle"]["max_rss"] > 20 * MB
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/statm"), reason="sin /proc")
+def test_resident_memory_limit(fake_aligner, monkeypatch):
+    input_path, prefix = fake_aligner
+    monkeypatch.setenv("ALLOC_MB", "200")
+    monkeypatch.setenv("HOLD_SECONDS", "5")
+    with pytest.raises(AlignmentOutOfMemory, match="100 MB"):
+        run_aligners(input_path, prefix, limits={"cpu": 60, "memory": 100 * MB})
+    assert not os.path.exists(prefix + "_muscle.fasta")
@@ -0,0 +1,142 @@
+import json
+import os
+
+import pytest
+
+import writeback
+from writeback import SaveQueue
+
+ALIGNMENT = ">s1\nAC-GT\n>s2\nACAGT\n"
+
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(writeback, "SAVE_RETRY_INITIAL", 0.01)
+    monkeypatch.setattr(writeback, "SAVE_RETRY_MAX", 0.01)
+
+
+def item(filename):
+    return {"filename": filename, "muscle_content": ALIGNMENT, "msa_content": ALIGNMENT}
+
+
+def saved(db_client):
+    return sorted(i["filename"] for i in db_client.get("list").json()["items"])
+
+
+def spool_files(spool):
+    return sorted(name for name in os.listdir(spool) if name != "failed")
+
+
+def sent(db_client):
+    return sum(1 for _, path in db_client.requests if path == "save_bulk")
+
+
+def test_submit_saves_once_and_flushes(tmp_path, db_client):
+    spool = str(tmp_path / "spool")
+    saves = SaveQueue(db_client, spool)
+    keys = saves.submit(item("a.fa")) + saves.submit([item("b.fa"), item("c.fa")])
+
+    assert saves.flush(5)
+    assert len(set(keys)) == 3
+    assert saved(db_client) == ["a.fa", "b.fa", "c.fa"]
+    assert sent(db_client) <= 2
+    assert saves.pending() == 0
+    assert spool_files(spool) == []
+
+
+def test_replays_spool_after_crash(tmp_path, db_client):
+    spool = str(tmp_path / "spool")
+    os.makedirs(spool)
+    # Lo que dejó una ejecución anterior: un guardado completo y uno a medias
+    with open(os.path.join(spool, "00000000000000000001-a.json"), "w") as f:
+        json.dump({"items": [{"save_key": "k1", **item("old.fa")}]}, f)
+    with open(os.path.join(spool, "00000000000000000002-b.json.tmp"), "w") as f:
+        f.write('{"items": [')
+
+    saves = SaveQueue(db_client, spool)
+    saves.submit(item("new.fa"))
+    assert saves.flush(5)
+    assert saved(db_client) == ["new.fa", "old.fa"]
+    assert sent(db_client) <= 2
+    assert spool_files(spool) == []
+
+    # El mismo archivo reenviado otra vez (la DB ya lo guardó) no se duplica
+    with open(os.path.join(spool, "00000000000000000003-a.json"), "w") as f:
+        json.dump({"items": [{"save_key": "k1", **item("old.fa")}]}, f)
+    again = SaveQueue(db_client, spool)
+    again.start()
+    assert again.flush(5)
+    assert saved(db_client) == ["new.fa", "old.fa"]
+
+
+def test_retries_until_db_answers(tmp_path, db_client):
+    calls = []
+    post = db_client.post
+
+    def flaky(path, **kwargs):
+        calls.append(path)
+        if len(calls) < 3:
+            raise ConnectionError("DB caída")
+        return post(path, **kwargs)
+
+    db_client.post = flaky
+    saves = SaveQueue(db_client, str(tmp_path / "spool"))
+    saves.submit(item("a.fa"))
+    assert saves.flush(5)
+    assert len(calls) == 3
+    assert saved(db_client) == ["a.fa"]
+
+
+def test_rejected_save_is_set_aside(tmp_path, db_client):
+    spool = str(tmp_path / "spool")
+    saves = SaveQueue(db_client, spool)
+    saves.submit({"filename": "x.fa", "muscle_blob": "0" * 64, "msa_blob": "0" * 64})
+    assert saves.flush(5)
+    assert saved(db_client) == []
+    assert len(os.listdir(os.path.join(spool, "failed"))) == 1
+
+
+def test_vanished_file_does_not_block_flush(tmp_path, db_client):
+    spool = str(tmp_path / "spool")
+
+    def lose_file(path, **kwargs):
+        for name in spool_files(spool):
+            os.remove(os.path.join(spool, name))
+        raise ConnectionError("DB caída")
+
+    db_client.post = lose_file
+    saves = SaveQueue(db_client, spool)
+    saves.submit(item("a.fa"))
+    assert saves.flush(5)
+    assert saves.pending() == 0
+
+
+def test_files_are_uploaded_from_the_spool(tmp_path, db_client):
+    spool = str(tmp_path / "spool")
+    output = tmp_path / "out.fasta"
+    output.write_text(ALIGNMENT)
+    post = db_client.post
+
+    def db_down_once(path, **kwargs):
+        db_client.post = post
+        raise ConnectionError("DB caída")
+
+    db_client.post = db_down_once
+    saves = SaveQueue(db_client, spool)
+    saves.submit_files({"filename": "big.fa"}, {"muscle_blob": str(output), "msa_blob": str(output)})
+    # El original ya puede borrarse: el spool tiene su copia
+    output.unlink()
+    assert saves.flush(5)
+    assert saved(db_client) == ["big.fa"]
+    assert db_client.get("get/1/fasta", params={"aligner": "msa"}).text == ALIGNMENT
+    assert spool_files(spool) == []
+
+
+def test_orphan_blob_files_are_removed(tmp_path, db_client):
+    spool = str(tmp_path / "spool")
+    os.makedirs(spool)
+    # submit_files() interrumpido antes de escribir el guardado
+    with open(os.path.join(spool, "00000000000000000001-a.muscle_blob.blob"), "w") as f:
+        f.write(ALIGNMENT)
+    SaveQueue(db_client, spool).start()
+    assert spool_files(spool) == []